@@ -1,5 +1,6 @@
 #include "common.h"
 #include "mcp23s17.h"
+#include "serial.h"
 
 void led_init(void)
 {
@@ -66,7 +67,72 @@ void read_data(uint8_t *buffer, uint32_t size)
 
 	for(i=0; i<size; i++)
 	{
-		buffer[i] = fgetc(&gconfig.usb);
+		/* Wait as long as it takes for the start of the data, but not for the rest of it */
+		if(i == 0)
+		{
+			buffer[i] = fgetc(&gconfig.usb);
+		}
+		else
+		{
+			buffer[i] = read_byte();
+		}
+	}
+}
+
+/* Read a byte of data from the host in the middle of a transfer. NACKs and escapes if the host has gone away. */
+uint8_t read_byte(void)
+{
+	int16_t byte = serial_read_byte(ESCAPE_TIMEOUT);
+
+	if(byte < 0)
+	{
+		nack();
+		escape();
+	}
+
+	return (uint8_t) byte;
+}
+
+/* Called periodically while streaming data to the host. Escapes if the host has closed the port, or has sent data to interrupt the stream. */
+void check_escape(void)
+{
+	if(gconfig.escape || serial_data_available())
+	{
+		escape();
+	}
+}
+
+/* Abandon the current mode and return to the main loop, which waits for the host to resynchronise (see wait_for_sync()). */
+void escape(void)
+{
+	longjmp(gconfig.escape_point, 1);
+}
+
+/* 
+ * Discard data from the host until it sends SYNC_SEQUENCE. After an escape the host may still be sending
+ * the rest of the abandoned transfer, and none of that data may be mistaken for a mode.
+ */
+void wait_for_sync(void)
+{
+	const char *sync = SYNC_SEQUENCE;
+	uint8_t i = 0, byte = 0;
+
+	while(sync[i] != '\0')
+	{
+		byte = fgetc(&gconfig.usb);
+
+		if(byte == sync[i])
+		{
+			i++;
+		}
+		else if(byte == sync[0])
+		{
+			i = 1;
+		}
+		else
+		{
+			i = 0;
+		}
 	}
 }
 
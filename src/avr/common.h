@@ -5,6 +5,7 @@
 #include <stdlib.h>
 #include <stdint.h>
 #include <string.h>
+#include <setjmp.h>
 #include <avr/io.h>
 #include <util/delay.h>
 
@@ -22,6 +23,18 @@
 #define XFER_TEST_SIZE 128
 #define LED_TOGGLE_INTERVAL 128
 
+/* 
+ * If the host stops sending part way through a transfer for this many milliseconds, the transfer is
+ * abandoned and the board returns to waiting for a mode. See escape().
+ */
+#define ESCAPE_TIMEOUT 500
+
+/*
+ * After an escape, everything received from the host is discarded until it sends this sequence (see
+ * wait_for_sync()). None of its bytes are valid modes, and the first byte appears only once.
+ */
+#define SYNC_SEQUENCE "GUMBI SYNC"
+
 #define LED_DDR DDRB
 #define LED_PORT PORTB
 #define LED_PIN PB4
@@ -35,6 +48,7 @@
 
 #define PINS_PER_DEVICE 16
 #define PINS_PER_REGISTER 8
+#define MAX_PORTS (MAX_DEVICES * 2)
 #define NUM_REGISTERS 0x16
 
 enum registers
@@ -78,7 +92,9 @@ enum modes
 	SETPINCOUNT = 9,
 	SCANBUS = 10,
 	MONITOR = 11,
-	VOLTAGE = 12
+	VOLTAGE = 12,
+	SPI = 13,
+	JTAG = 14
 };
 
 enum actions
@@ -88,7 +104,10 @@ enum actions
 	WRITE = 2,
 	HIGH = 3,
 	LOW = 4,
-	COMMAND = 5
+	COMMAND = 5,
+	BATCH = 6,
+	READPORTS = 7,
+	WRITEPORTS = 8
 };
 
 enum voltages
@@ -154,6 +173,13 @@ struct confdata
 	struct ctrlpin wi;			/* Write Indicator */
 	struct ctrlpin ri;			/* Read Indicator */
 	struct ctrlpin rst;			/* Reset */
+	struct ctrlpin sck;			/* Serial Clock */
+	struct ctrlpin mosi;			/* Serial Data Out (Master Out, Slave In) */
+	struct ctrlpin miso;			/* Serial Data In (Master In, Slave Out) */
+	struct ctrlpin tck;			/* JTAG Test Clock */
+	struct ctrlpin tms;			/* JTAG Test Mode Select */
+	struct ctrlpin tdi;			/* JTAG Test Data In */
+	struct ctrlpin tdo;			/* JTAG Test Data Out */
 } hconfig;
 
 struct config
@@ -166,6 +192,8 @@ struct config
 	uint8_t buffer_size;
 	uint8_t regulator;
 	FILE usb;
+	volatile uint8_t escape;		/* Set when the host closes the serial port (drops DTR) */
+	jmp_buf escape_point;			/* Main loop state restored by escape() */
 } gconfig;
 
 void led_init(void);
@@ -179,6 +207,10 @@ void sleep(uint8_t seconds);
 uint8_t is_valid_pin(uint8_t p);
 void set_control_pin(struct ctrlpin p, uint8_t tf);
 void read_data(uint8_t *buffer, uint32_t count);
+uint8_t read_byte(void);
+void check_escape(void);
+void escape(void);
+void wait_for_sync(void);
 uint8_t are_valid_pins(uint8_t pins[], uint8_t count);
 
 #endif
@@ -59,20 +59,51 @@ void speed_test(void)
 
 	for(i=0; i<count; i++)
 	{
+		/* Stop if the host has gone away */
+		if((i % LED_TOGGLE_INTERVAL) == 0)
+		{
+			check_escape();
+		}
+
 		fprintf(&gconfig.usb, "%c", byte);
 	}
 }
 
-/* Handler for XFER mode. Reads in XFER_TEST_SIZE bytes of data then sends it back out to the host. */
+/*
+ * Handler for XFER mode. Repeatedly reads in a 4 byte size field followed by that many bytes of data,
+ * echoing the data back to the host XFER_TEST_SIZE bytes at a time. A size of zero is ACK'd and exits XFER mode.
+ */
 void xfer_test(void)
 {
-	uint32_t i = 0;
+	uint32_t count = 0, n = 0, i = 0;
 	uint8_t buf[XFER_TEST_SIZE] = { 0 };
 
-	read_data((uint8_t *) &buf, sizeof(buf));
-
-	for(i=0; i<sizeof(buf); i++)
+	while(TRUE)
 	{
-		fprintf(&gconfig.usb, "%c", buf[i]);
+		read_data((uint8_t *) &count, sizeof(count));
+
+		if(count == 0)
+		{
+			ack();
+			break;
+		}
+
+		while(count > 0)
+		{
+			n = count;
+			if(n > sizeof(buf))
+			{
+				n = sizeof(buf);
+			}
+
+			read_data((uint8_t *) &buf, n);
+
+			for(i=0; i<n; i++)
+			{
+				fputc(buf[i], &gconfig.usb);
+			}
+
+			count -= n;
+		}
 	}
 }
@@ -5,13 +5,14 @@
 void gpio(void)
 {
 	struct io cmd = { 0 };
-	uint8_t loop = TRUE, send_data = FALSE, data = 0;
+	uint8_t loop = TRUE, send_data = FALSE, send_buffer = FALSE, data = 0, i = 0;
 
 	mcp23s17_enable();
 
 	while(loop)
 	{
 		send_data = FALSE;
+		send_buffer = FALSE;
 		read_data((uint8_t *) &cmd, sizeof(cmd));
 		
 		switch(cmd.action)
@@ -29,6 +30,31 @@ void gpio(void)
 				data = get_pin(cmd.pin);
 				send_data = TRUE;
 				break;
+			case BATCH:
+				if(!gpio_batch(cmd.pin))
+				{
+					nack();
+					fprintf(&gconfig.usb, "Invalid GPIO batch [%d commands]\n", cmd.pin);
+				}
+				break;
+			case READPORTS:
+				if(gpio_read_ports(cmd.pin))
+				{
+					send_buffer = TRUE;
+				}
+				else
+				{
+					nack();
+					fprintf(&gconfig.usb, "Invalid GPIO port list [%d ports]\n", cmd.pin);
+				}
+				break;
+			case WRITEPORTS:
+				if(!gpio_write_ports(cmd.pin))
+				{
+					nack();
+					fprintf(&gconfig.usb, "Invalid GPIO port list [%d ports]\n", cmd.pin);
+				}
+				break;
 			case EXIT:
 				loop = FALSE;
 				break;
@@ -46,9 +72,132 @@ void gpio(void)
 		{
 			fputc(data, &gconfig.usb);
 		}
+		else if(send_buffer)
+		{
+			for(i=0; i<gconfig.buffer_size; i++)
+			{
+				fputc(gconfig.buffer[i], &gconfig.usb);
+			}
+		}
 	}
 	
 	mcp23s17_disable();
 
 	return;
 }
+
+/* 
+ * Reads in a batch of count HIGH/LOW commands and applies them all at once.
+ * Pin states are updated in the cached register settings, then committed to the I/O chips in one pass.
+ * Returns TRUE on success, FALSE if the batch was invalid.
+ */
+uint8_t gpio_batch(uint8_t count)
+{
+	uint8_t i = 0, ok = TRUE;
+	struct io *cmds = (struct io *) gconfig.buffer;
+
+	if(count > MAX_GPIO_COMMANDS || (count * sizeof(struct io)) > sizeof(gconfig.buffer))
+	{
+		return FALSE;
+	}
+
+	read_data(gconfig.buffer, (count * sizeof(struct io)));
+	gconfig.buffer_size = (count * sizeof(struct io));
+
+	for(i=0; i<count; i++)
+	{
+		switch(cmds[i].action)
+		{
+			case HIGH:
+				configure_pin_as_output(cmds[i].pin);
+				set_pin_high(cmds[i].pin);
+				break;
+			case LOW:
+				configure_pin_as_output(cmds[i].pin);
+				set_pin_low(cmds[i].pin);
+				break;
+			default:
+				ok = FALSE;
+				break;
+		}
+	}
+
+	commit_ddr_settings();
+	commit_io_settings();
+
+	return ok;
+}
+
+/* 
+ * Reads in a list of count port numbers, then reads the GPIO register for each port into gconfig.buffer.
+ * Port 0 is GPIOA on the first I/O chip, port 1 is GPIOB on the first I/O chip, and so on.
+ * Pin directions are not changed. Returns TRUE on success, FALSE if the port list was invalid.
+ */
+uint8_t gpio_read_ports(uint8_t count)
+{
+	uint8_t i = 0, port = 0;
+
+	if(count > MAX_PORTS)
+	{
+		return FALSE;
+	}
+
+	read_data(gconfig.buffer, count);
+	gconfig.buffer_size = count;
+
+	for(i=0; i<count; i++)
+	{
+		port = gconfig.buffer[i];
+
+		if(port >= (gconfig.num_io_devices * 2))
+		{
+			return FALSE;
+		}
+
+		gconfig.buffer[i] = read_register((port / 2), (GPIOA + (port % 2)));
+	}
+
+	return TRUE;
+}
+
+/*
+ * Reads in a list of count (port, mask, value) entries. For each port, the pins selected by mask are
+ * configured as outputs and set to the corresponding bits in value; all other pins are left untouched.
+ * Returns TRUE on success, FALSE if the port list was invalid.
+ */
+uint8_t gpio_write_ports(uint8_t count)
+{
+	uint8_t i = 0, port = 0, mask = 0, value = 0, device = 0, reg = 0, ok = TRUE;
+
+	if(count > MAX_PORTS)
+	{
+		return FALSE;
+	}
+
+	read_data(gconfig.buffer, (count * 3));
+	gconfig.buffer_size = 0;
+
+	for(i=0; i<(count * 3); i+=3)
+	{
+		port = gconfig.buffer[i];
+		mask = gconfig.buffer[i+1];
+		value = gconfig.buffer[i+2];
+
+		if(port >= (gconfig.num_io_devices * 2))
+		{
+			ok = FALSE;
+			continue;
+		}
+
+		device = port / 2;
+		reg = port % 2;
+
+		gconfig.chips[device].port[IODIRA + reg] &= ~mask;
+		gconfig.chips[device].port[GPIOA + reg] = ((gconfig.chips[device].port[GPIOA + reg] & ~mask) | (value & mask));
+
+		commit_settings(device, (GPIOA + reg));
+		commit_settings(device, (IODIRA + reg));
+	}
+
+	return ok;
+}
@@ -4,5 +4,8 @@
 #include "common.h"
 
 void gpio(void);
+uint8_t gpio_batch(uint8_t count);
+uint8_t gpio_read_ports(uint8_t count);
+uint8_t gpio_write_ports(uint8_t count);
 
 #endif
@@ -7,6 +7,8 @@
 #include "gpio.h"
 #include "monitor.h"
 #include "regulator.h"
+#include "spiflash.h"
+#include "jtag.h"
 
 int main(void)
 {
@@ -46,6 +48,18 @@ int main(void)
 	}
 	*/
 
+	/* escape() returns here if a mode is abandoned part way through a transfer */
+	if(setjmp(gconfig.escape_point))
+	{
+		/* Put the I/O expansion chips back in their default state, as the mode didn't get the chance to */
+		mcp23s17_enable();
+		mcp23s17_disable();
+		led_on();
+
+		/* Don't treat the rest of the abandoned transfer as modes; wait for the host to reset the connection */
+		wait_for_sync();
+	}
+
 	while(TRUE)
 	{
 		read_data((uint8_t *) &mode, sizeof(mode));
@@ -103,12 +117,21 @@ void command_handler(uint8_t mode)
 		case VOLTAGE:
 			handler = &voltage;
 			break;
+		case SPI:
+			handler = &spi_flash;
+			break;
+		case JTAG:
+			handler = &jtag;
+			break;
 		default:
 			break;
 	}
 
 	if(handler)
 	{
+		/* Only a port close during this mode should make it escape */
+		gconfig.escape = FALSE;
+
 		/* Always ACK if the specified mode was identified. */
 		ack();
 		handler();
@@ -0,0 +1,132 @@
+#include "jtag.h"
+
+/* Last TMS and TDI values driven onto the bus, used to skip redundant pin writes */
+static uint8_t last_tms = 0, last_tdi = 0;
+
+/* 
+ * Handler for JTAG mode. The pin configuration is read once, followed by any number of shift requests.
+ * Each shift request is a 16-bit clock count, followed by one TMS byte and one TDI byte for every 8 clocks.
+ * A clock count of zero exits JTAG mode.
+ */
+void jtag(void)
+{
+	uint8_t ok = TRUE;
+	uint16_t count = 0;
+
+	/* Initialize the I/O expansion chips */
+	mcp23s17_enable();
+
+	/* Read in JTAG configuration data */
+	read_data((uint8_t *) &hconfig, sizeof(hconfig));
+
+	ok &= is_valid_pin(hconfig.tck.pin);
+	ok &= is_valid_pin(hconfig.tms.pin);
+	ok &= is_valid_pin(hconfig.tdi.pin);
+	ok &= is_valid_pin(hconfig.tdo.pin);
+	ok &= are_valid_pins(hconfig.vcc_pins, hconfig.num_vcc_pins);
+	ok &= are_valid_pins(hconfig.gnd_pins, hconfig.num_gnd_pins);
+
+	if(!ok)
+	{
+		/* Bad configuration specified, send a NACK and a reason */
+		nack();
+		fprintf(&gconfig.usb, "Invalid configuration");
+	}
+	else
+	{
+		/* Acknowledge successful receipt of valid configuration data */
+		ack();
+
+		configure_pins_as_outputs(hconfig.vcc_pins, hconfig.num_vcc_pins);
+		configure_pins_as_outputs(hconfig.gnd_pins, hconfig.num_gnd_pins);
+		configure_pin_as_output(hconfig.tck.pin);
+		configure_pin_as_output(hconfig.tms.pin);
+		configure_pin_as_output(hconfig.tdi.pin);
+		configure_pin_as_output(hconfig.rst.pin);
+		configure_pin_as_input(hconfig.tdo.pin);
+
+		/* Idle with TCK low and TMS high, which holds the TAP in the Test-Logic-Reset state */
+		set_pin_low(hconfig.tck.pin);
+		set_pin_high(hconfig.tms.pin);
+		set_pin_low(hconfig.tdi.pin);
+		reset_enable(FALSE);
+		last_tms = 1;
+		last_tdi = 0;
+
+		/* Supply power to the target */
+		set_pins_high(hconfig.vcc_pins, hconfig.num_vcc_pins);
+		set_pins_low(hconfig.gnd_pins, hconfig.num_gnd_pins);
+
+		commit_ddr_settings();
+		commit_io_settings();
+
+		while(TRUE)
+		{
+			read_data((uint8_t *) &count, sizeof(count));
+
+			/* Acknowledge the shift request; a zero clock count is an exit request */
+			ack();
+
+			if(count == 0)
+			{
+				break;
+			}
+
+			jtag_shift(count);
+		}
+	}
+
+	/* Disable the I/O expansion chips */
+	mcp23s17_disable();
+
+	return;
+}
+
+/* Drives TMS and TDI, pulses TCK, and returns the value of TDO sampled on the rising edge */
+uint8_t jtag_clock(uint8_t tms, uint8_t tdi)
+{
+	uint8_t tdo = 0;
+
+	/* Only update TMS and TDI if they have changed; each pin write is an SPI transfer to the I/O chips */
+	if(tms != last_tms)
+	{
+		set_pin_immediate(hconfig.tms.pin, tms);
+		last_tms = tms;
+	}
+	if(tdi != last_tdi)
+	{
+		set_pin_immediate(hconfig.tdi.pin, tdi);
+		last_tdi = tdi;
+	}
+
+	set_pin_immediate(hconfig.tck.pin, 1);
+	tdo = get_pin(hconfig.tdo.pin);
+	set_pin_immediate(hconfig.tck.pin, 0);
+
+	return tdo;
+}
+
+/* Clocks count bits, least significant bit first, sending back one packed TDO byte for every TMS/TDI byte pair */
+void jtag_shift(uint16_t count)
+{
+	uint16_t i = 0;
+	uint8_t b = 0, bits = 0, tms = 0, tdi = 0, tdo = 0;
+
+	for(i=0; i<count; i+=8)
+	{
+		tms = read_byte();
+		tdi = read_byte();
+		tdo = 0;
+
+		bits = ((count - i) < 8) ? (count - i) : 8;
+
+		for(b=0; b<bits; b++)
+		{
+			tdo |= (jtag_clock(((tms >> b) & 1), ((tdi >> b) & 1)) << b);
+		}
+
+		fputc(tdo, &gconfig.usb);
+	}
+
+	toggle_led();
+}
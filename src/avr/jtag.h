@@ -0,0 +1,12 @@
+#ifndef __JTAG_H__
+#define __JTAG_H__
+
+#include "common.h"
+#include "mcp23s17.h"
+#include "parallel.h"
+
+void jtag(void);
+uint8_t jtag_clock(uint8_t tms, uint8_t tdi);
+void jtag_shift(uint16_t count);
+
+#endif
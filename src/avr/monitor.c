@@ -20,6 +20,12 @@ void monitor(void)
 
 		for(i=0; i<count; i++)
 		{
+			/* Stop if the host has gone away */
+			if((i % LED_TOGGLE_INTERVAL) == 0)
+			{
+				check_escape();
+			}
+
 			for(j=0; j<gconfig.num_io_devices; j++)
 			{
 				gpioa = read_register(j, GPIOA);
@@ -433,10 +433,11 @@ void parallel_read(void)
 			fputc((uint8_t) ((data >> 8) & 0xFF), &gconfig.usb);
 		}
 
-		/* Toggle the status LED */
+		/* Toggle the status LED, and stop if the host has gone away */
 		if(c == LED_TOGGLE_INTERVAL)
 		{
 			toggle_led();
+			check_escape();
 			c = 0;
 		}
 	}
@@ -469,14 +470,14 @@ void parallel_write(void)
 		for(i=0, j=hconfig.addr, c=0; i<hconfig.count; c++, j++, i+=write_size)
 		{
 			/* Get a byte of data from the host */
-			data1 = fgetc(&gconfig.usb);
+			data1 = read_byte();
 
 			/* If we're working with a 16 bit data bus, get the next byte */
 			if(write_size > 1)
 			{
 				/* Send an ack so the host will send the next byte */
 				ack();
-				data2 = fgetc(&gconfig.usb);
+				data2 = read_byte();
 			}
 
 			/* Combine the two bytes read into a single 16 bit value */
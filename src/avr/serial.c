@@ -95,3 +95,41 @@ void EVENT_USB_Device_ControlRequest(void)
 	CDC_Device_ProcessControlRequest(&VirtualSerial_CDC_Interface);
 }
 
+/** Event handler for the CDC control line state change event. The host drops DTR when it closes the serial port. */
+void EVENT_CDC_Device_ControLineStateChanged(USB_ClassInfo_CDC_Device_t* const CDCInterfaceInfo)
+{
+	if(!(CDCInterfaceInfo->State.ControlLineStates.HostToDevice & CDC_CONTROL_LINE_OUT_DTR))
+	{
+		gconfig.escape = TRUE;
+	}
+}
+
+/* Read a byte from the host, waiting up to timeout milliseconds. Returns -1 on timeout, or if the host closes the serial port. */
+int16_t serial_read_byte(uint16_t timeout)
+{
+	int16_t byte = 0;
+	uint32_t ticks = ((uint32_t) timeout) * 10;
+
+	while((byte = CDC_Device_ReceiveByte(&VirtualSerial_CDC_Interface)) < 0)
+	{
+		if(ticks == 0 || gconfig.escape)
+		{
+			return -1;
+		}
+
+		/* Keep sending any pending data (i.e., ACKs) to the host while we wait */
+		CDC_Device_USBTask(&VirtualSerial_CDC_Interface);
+		USB_USBTask();
+
+		_delay_us(100);
+		ticks--;
+	}
+
+	return byte;
+}
+
+/* Returns TRUE if the host has sent data that has not been read yet. */
+uint8_t serial_data_available(void)
+{
+	return (CDC_Device_BytesReceived(&VirtualSerial_CDC_Interface) > 0);
+}
@@ -51,11 +51,14 @@
 
 	/* Function Prototypes: */
 		void serial_init(void);
+		int16_t serial_read_byte(uint16_t timeout);
+		uint8_t serial_data_available(void);
 
 		void EVENT_USB_Device_Connect(void);
 		void EVENT_USB_Device_Disconnect(void);
 		void EVENT_USB_Device_ConfigurationChanged(void);
 		void EVENT_USB_Device_ControlRequest(void);
+		void EVENT_CDC_Device_ControLineStateChanged(USB_ClassInfo_CDC_Device_t* const CDCInterfaceInfo);
 
 #endif
 
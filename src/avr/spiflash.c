@@ -0,0 +1,269 @@
+#include "spiflash.h"
+
+/* Handles SPI serial flash commands. The SPI bus is bit-banged over the I/O expansion chips. */
+void spi_flash(void)
+{
+	uint8_t ok = TRUE, configured = FALSE;
+
+	/* Initialize the I/O expansion chips */
+	mcp23s17_enable();
+
+	while(TRUE)
+	{
+		/* Read in SPI configuration data */
+		read_data((uint8_t *) &hconfig, sizeof(hconfig));
+
+		/* If given the exit command, don't do anything else, just acknowledge and exit */
+		if(hconfig.action == EXIT)
+		{
+			ack();
+			break;
+		}
+
+		/* Validate that the number of operational commands is sane */
+		ok = (hconfig.num_commands <= MAX_COMMANDS);
+
+		/* The clock, data and chip select pins are all required */
+		ok &= is_valid_pin(hconfig.sck.pin);
+		ok &= is_valid_pin(hconfig.mosi.pin);
+		ok &= is_valid_pin(hconfig.miso.pin);
+		ok &= is_valid_pin(hconfig.ce.pin);
+		ok &= are_valid_pins(hconfig.vcc_pins, hconfig.num_vcc_pins);
+		ok &= are_valid_pins(hconfig.gnd_pins, hconfig.num_gnd_pins);
+
+		if(!ok)
+		{
+			/* Bad configuration specified, send a NACK and a reason */
+			nack();
+			fprintf(&gconfig.usb, "Invalid configuration");
+			break;
+		}
+
+		/* Acknowledge successful receipt of valid configuration data */
+		ack();
+
+		if(configured == FALSE || hconfig.reconfigure)
+		{
+			/* Configure all Vcc, GND and output control pins as outputs */
+			configure_pins_as_outputs(hconfig.vcc_pins, hconfig.num_vcc_pins);
+			configure_pins_as_outputs(hconfig.gnd_pins, hconfig.num_gnd_pins);
+			configure_pin_as_output(hconfig.sck.pin);
+			configure_pin_as_output(hconfig.mosi.pin);
+			configure_pin_as_output(hconfig.ce.pin);
+			configure_pin_as_output(hconfig.wp.pin);
+			configure_pin_as_output(hconfig.rst.pin);
+
+			/* Data from the target chip comes in on the MISO pin */
+			configure_pin_as_input(hconfig.miso.pin);
+
+			/* Idle with the clock low (SPI mode 0) and all control pins disabled */
+			set_pin_low(hconfig.sck.pin);
+			set_pin_low(hconfig.mosi.pin);
+			reset_enable(FALSE);
+			write_protect(FALSE);
+			chip_enable(FALSE);
+
+			/* Supply power to the target chip */
+			set_pins_high(hconfig.vcc_pins, hconfig.num_vcc_pins);
+			set_pins_low(hconfig.gnd_pins, hconfig.num_gnd_pins);
+
+			/* Commit settings */
+			commit_ddr_settings();
+			commit_io_settings();
+
+			configured = TRUE;
+		}
+
+		switch(hconfig.action)
+		{
+			case READ:
+				ack();
+				spi_flash_read();
+				break;
+			case WRITE:
+				ack();
+				spi_flash_write();
+				break;
+			case COMMAND:
+				ack();
+				spi_flash_command();
+				ack();
+				break;
+			default:
+				/* Bad action specified, respond with NACK and a reason string */
+				nack();
+				fprintf(&gconfig.usb, "The specified action is not supported [0x%X]\n", hconfig.action);
+				break;
+		}
+	}
+
+	/* Disable the I/O expansion chips */
+	mcp23s17_disable();
+
+	return;
+}
+
+/* Clocks one byte out on MOSI, most significant bit first, and returns the byte clocked in on MISO */
+uint8_t spi_flash_transfer(uint8_t out)
+{
+	uint8_t i = 0, in = 0;
+
+	for(i=0; i<8; i++)
+	{
+		/* Data is set up while the clock is low, and sampled by both sides on the rising edge */
+		set_pin_immediate(hconfig.mosi.pin, ((out >> (7 - i)) & 1));
+		set_pin_immediate(hconfig.sck.pin, 1);
+		in = (in << 1) | get_pin(hconfig.miso.pin);
+		set_pin_immediate(hconfig.sck.pin, 0);
+	}
+
+	return in;
+}
+
+/* Sends a 24-bit address, most significant byte first */
+void spi_flash_address(uint32_t address)
+{
+	uint8_t i = 0;
+
+	for(i=0; i<SPI_ADDR_BYTES; i++)
+	{
+		spi_flash_transfer((uint8_t) ((address >> (8 * (SPI_ADDR_BYTES - 1 - i))) & 0xFF));
+	}
+}
+
+/* 
+ * Polls the target chip's status register until the write in progress bit is cleared. The status is polled
+ * at most SPI_PAGE_SIZE times, hconfig.tbp microseconds apart, so a page program is allowed at least the
+ * configured byte program time for every byte in the page. Returns TRUE when the chip is ready, FALSE on timeout.
+ */
+uint8_t spi_flash_wait(void)
+{
+	uint16_t i = 0;
+	uint8_t ready = FALSE;
+
+	chip_enable(TRUE);
+	spi_flash_transfer(SPI_CMD_RDSR);
+
+	for(i=0; i<SPI_PAGE_SIZE; i++)
+	{
+		if(!(spi_flash_transfer(DUMMY_BYTE) & SPI_STATUS_WIP))
+		{
+			ready = TRUE;
+			break;
+		}
+
+		/* Stop if the host has gone away */
+		check_escape();
+		usleep(hconfig.tbp);
+	}
+
+	chip_enable(FALSE);
+	return ready;
+}
+
+/* Streams hconfig.count bytes back to the host from hconfig.addr, using a single fast read command */
+void spi_flash_read(void)
+{
+	uint32_t i = 0, c = 0;
+
+	read_indicator(TRUE);
+
+	chip_enable(TRUE);
+	spi_flash_transfer(SPI_CMD_FAST_READ);
+	spi_flash_address(hconfig.addr);
+	/* Fast read requires one dummy byte after the address */
+	spi_flash_transfer(DUMMY_BYTE);
+
+	for(i=0, c=0; i<hconfig.count; i++, c++)
+	{
+		fputc(spi_flash_transfer(DUMMY_BYTE), &gconfig.usb);
+
+		/* Toggle the status LED, and stop if the host has gone away */
+		if(c == LED_TOGGLE_INTERVAL)
+		{
+			toggle_led();
+			check_escape();
+			c = 0;
+		}
+	}
+
+	chip_enable(FALSE);
+	read_indicator(FALSE);
+
+	/* Make sure the LED is on after the read loop */
+	led_on();
+	return;
+}
+
+/* Reads hconfig.count bytes from the host and programs them to the target chip one page at a time */
+void spi_flash_write(void)
+{
+	uint32_t i = 0, address = hconfig.addr;
+	uint16_t chunk = 0, j = 0;
+
+	write_indicator(TRUE);
+
+	while(i < hconfig.count)
+	{
+		/* Page program commands must not cross a page boundary */
+		chunk = SPI_PAGE_SIZE - (address % SPI_PAGE_SIZE);
+		if(chunk > (hconfig.count - i))
+		{
+			chunk = hconfig.count - i;
+		}
+
+		/* Each page program must be preceeded by a write enable command */
+		chip_enable(TRUE);
+		spi_flash_transfer(SPI_CMD_WREN);
+		chip_enable(FALSE);
+
+		chip_enable(TRUE);
+		spi_flash_transfer(SPI_CMD_PP);
+		spi_flash_address(address);
+		for(j=0; j<chunk; j++)
+		{
+			spi_flash_transfer(read_byte());
+		}
+		chip_enable(FALSE);
+
+		/* Wait for the page program to complete */
+		if(!spi_flash_wait())
+		{
+			nack();
+			fprintf(&gconfig.usb, "Timed out waiting for the target chip to become ready\n");
+			break;
+		}
+
+		i += chunk;
+		address += chunk;
+		toggle_led();
+
+		/* Acknowledge when we've finished programming a page so the host knows we're ready for the next one */
+		ack();
+	}
+
+	write_indicator(FALSE);
+
+	led_on();
+	return;
+}
+
+/* Sends the bytes listed in hconfig.commands in a single transaction, then streams hconfig.count response bytes back to the host */
+void spi_flash_command(void)
+{
+	uint32_t i = 0;
+
+	chip_enable(TRUE);
+
+	for(i=0; i<hconfig.num_commands; i++)
+	{
+		spi_flash_transfer((uint8_t) hconfig.commands[i]);
+	}
+
+	for(i=0; i<hconfig.count; i++)
+	{
+		fputc(spi_flash_transfer(DUMMY_BYTE), &gconfig.usb);
+	}
+
+	chip_enable(FALSE);
+}
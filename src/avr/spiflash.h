@@ -0,0 +1,25 @@
+#ifndef __SPIFLASH_H__
+#define __SPIFLASH_H__
+
+#include "common.h"
+#include "mcp23s17.h"
+#include "parallel.h"
+
+#define SPI_PAGE_SIZE 256
+#define SPI_ADDR_BYTES 3
+
+#define SPI_CMD_WREN 0x06
+#define SPI_CMD_RDSR 0x05
+#define SPI_CMD_PP 0x02
+#define SPI_CMD_FAST_READ 0x0B
+#define SPI_STATUS_WIP 0x01
+
+void spi_flash(void);
+uint8_t spi_flash_transfer(uint8_t out);
+void spi_flash_address(uint32_t address);
+uint8_t spi_flash_wait(void);
+void spi_flash_read(void);
+void spi_flash_write(void);
+void spi_flash_command(void);
+
+#endif
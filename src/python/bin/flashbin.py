@@ -2,40 +2,56 @@
 
 import os
 import sys
+import json
+import time
+import hashlib
 from getopt import getopt as GetOpt, GetoptError
-from gumbi import Parallel
+from gumbi import Parallel, ChipDB, Image, ByteSwap
 
 class NORFlash(Parallel):
 
-	# Default chip erase time in seconds
-	DEFAULT_TSCE = 60
 	#DEBUG = True
 
-	def ReadChip(self, address=0, count=0):
+	def _callback(self, progress):
+		"""
+		Returns the progress callback to use for reads and writes. For internal use only.
+		"""
+		if progress:
+			return self.PrintProgress
+		return None
+
+	def ReadChip(self, address=0, count=0, progress=True, transform=None, checkpoint=None):
 		"""
 		Reads count bytes from the target chip starting at address.
+		Set progress to False to suppress the progress bar, and transform to a Transform
+		instance (e.g. ByteSwap) to convert the data as it is read. If specified, checkpoint
+		is called after each segment is read (see Gumbi.Read).
 		"""
 		self.read_data = ''
+		# Don't run any previously selected command set (WRITE, ERASE, etc) before reading
+		self.config.SetCommand([])
 		
 		if count == 0:
-			count = self.config.GetSetting("SIZE")[0]
-			if count is None:
-				count = 0
+			count = (self.config.GetSetting("SIZE") or [0])[0]
+			if not count:
+				raise Exception("The target chip size is unknown; specify a size, or set SIZE in the chip configuration")
 
 		if (count % 2) != 0:
 			count += 1
 
-                return self.Read(address, count, callback=self.PrintProgress)
+                return self.Read(address, count, callback=self._callback(progress), transform=transform, checkpoint=checkpoint)
 
-        def WriteChip(self, address, data):
+        def WriteChip(self, address, data, progress=True, transform=None, checkpoint=None):
 		"""
 		Writes data to the target chip starting at address.
+		Set progress to False to suppress the progress bar, and transform to a Transform
+		instance (e.g. ByteSwap) to convert the data before it is written. If specified,
+		checkpoint is called after each segment is written (see Gumbi.Write).
 		"""
-		if (len(data) % 2) != 0:
-			data += "\xFF"
+		data = self.Pad(data)
 
                 self.config.SetCommand("WRITE")
-                return self.Write(address, data, callback=self.PrintProgress)
+                return self.Write(address, data, callback=self._callback(progress), transform=transform, checkpoint=checkpoint)
 
 	def VendorID(self):
 		"""
@@ -57,79 +73,634 @@ class NORFlash(Parallel):
 		self.config.SetCommand("ID")
 		return ord(self.Read(1, 2)[0])
 
-        def EraseChip(self):
+	def ID(self):
 		"""
-		Perform a full erase of the target chip.
+		Reads both the vendor and product IDs with a single read. See VendorID and ProductID.
+
+		Returns a (vendor ID, product ID) tuple.
 		"""
-                self.config.SetCommand("ERASE")
+		self.config.SetCommand("ID")
+		data = self.Read(0, 4)
 
-		self.config.SetSetting("CMDELAY", self.config.GetSetting("TSCE"))
-		if self.config.GetSetting("CMDELAY") is None:
-			self.config.SetSetting("CMDELAY", [self.DEFAULT_TSCE])
-		
-		self.ExecuteCommands()
-		return True
+		# In word mode, each ID is the low byte of a 16-bit word
+		if self.Width() > 1:
+			return (ord(data[0]), ord(data[2]))
+		return (ord(data[0]), ord(data[1]))
+
+	def BlankCheck(self, address=0, count=0):
+		"""
+		Checks that the target chip is erased.
 
+		@address - Starting address.
+		@count   - Number of bytes to check. If 0, the entire chip is checked.
 
+		Returns the offset of the first non-erased byte, or None if all bytes are erased.
+		"""
+		data = self.ReadChip(address, count)
+		blank = "\xFF" * len(data)
 
+		if data == blank:
+			return None
+		return self._mismatch(data, blank)
 
-if __name__ == "__main__":
+	def Verify(self, address, data, progress=True, transform=None):
+		"""
+		Verifies that the target chip contains the specified data.
 
-	CONFIG_PATH = "bin/config/"
-	CONF_EXT = '.conf'
+		@address   - Starting address.
+		@data      - Expected data.
+		@progress  - Set to False to suppress the progress bar.
+		@transform - Transform instance that converts the chip data to the same format as the expected data.
 
-	def wordflip(data):
+		Returns the offset of the first byte that differs, or None if the data matches.
 		"""
-		Word-flips a given data string.
+		chip = self.ReadChip(address, len(data), progress, transform)[:len(data)]
 
-		@data - String of data to flip.
+		if chip == data:
+			return None
+		return self._mismatch(chip, data)
 
-		Returns converted data.
+	def _mismatch(self, a, b):
+		"""
+		Returns the offset of the first byte that differs between a and b. For internal use only.
 		"""
+		# Narrow down the mismatch in blocks, so that only one block is compared byte by byte
+		block = 4096
 		i = 0
-		fdata = ''
+		while a[i:i+block] == b[i:i+block] and i < len(a):
+			i += block
+		while i < len(a) and i < len(b) and a[i] == b[i]:
+			i += 1
+		return i
+
+
+class FlashJob:
+	"""
+	Runs a sequence of steps on the target chip over a single Gumbi board session. Example:
+
+		job = FlashJob("bin/config/MX29LV320.conf")
+		job.Add("erase")
+		job.Add("write", "firmware.bin")
+		job.Add("verify", "firmware.bin")
+		for line in job.Report(job.Run()):
+			print line
+
+	Jobs can also be loaded from a JSON or YAML manifest (see Load):
+
+		{
+			"chip"  : "MX29LV320",
+			"steps" : [
+				"id",
+				"erase",
+				{"step" : "write", "file" : "firmware.bin", "address" : 0},
+				{"step" : "verify", "file" : "firmware.bin"}
+			]
+		}
+
+	Each step is a step name, or a dict with a "step" name and optional "file", "address", "size", "base" and "swap" values.
+	If swap is 16 or 32, the byte order of each 16 or 32 bit word is reversed as data is read from or written to the chip.
+
+	Write and verify steps accept Intel HEX, S-record and ELF files as well as raw binaries. Only the
+	populated segments of these images are written, at their image addresses less the base address
+	(plus the step's address, if any). Raw binary files are written from the step's address.
+
+	The patch step writes a batch of small regions, such as serial numbers or calibration data.
+	Each patch has an address, either a file or a hex string of data, and an optional verify flag:
+
+		{"step" : "patch", "patches" : [
+			{"address" : "0x3F000", "data" : "001122334455", "verify" : true},
+			{"address" : "0x3F003", "file" : "serial.bin"}
+		]}
+
+	Adjacent and overlapping patches are merged (later patches take precedence where they overlap),
+	and the merged regions are written in address order. A top level "patches" list in a manifest
+	is run as a patch step after the other steps.
+
+	If a checkpoint file is specified, the job's progress is saved to it after each step, and after
+	each segment of data that is written or read. If the job is interrupted, running it again with
+	the same checkpoint file skips the steps that completed and resumes the write or read step that
+	was interrupted from the last completed segment. The checkpoint file is deleted when the job succeeds.
+	"""
+
+	STEPS = ['id', 'erase', 'blank-check', 'write', 'verify', 'read', 'patch']
+
+	def __init__(self, config, port=None, verbose=False, checkpoint=None):
+		"""
+		Class constructor.
+
+		@config     - Path to the chip configuration file.
+		@port       - Gumbi board serial port.
+		@verbose    - Set to True for verbose output.
+		@checkpoint - Path to a checkpoint file, used to resume the job if it is interrupted.
+
+		Returns None.
+		"""
+		self.config = config
+		self.port = port
+		self.verbose = verbose
+		self.checkpoint = checkpoint
+		self.steps = []
+		self.files = {}
+		self.images = {}
+
+	def Add(self, step, filename=None, address=0, size=0, patches=None, base=0, swap=0):
+		"""
+		Adds a step to the job.
+
+		@step     - One of STEPS.
+		@filename - The file to write or verify from, or to read to.
+		@address  - Starting address.
+		@size     - Number of bytes. If 0, the size of the file (write, verify) or chip (blank-check, read) is used.
+		@patches  - List of patch dicts, for the patch step.
+		@base     - Image address that corresponds to byte 0 of the chip, for HEX, S-record and ELF files.
+		@swap     - Word size in bits (16 or 32) to byte swap data read or written by the step, or 0 for none.
+
+		Returns None.
+		"""
+		if step not in self.STEPS:
+			raise Exception("Unknown job step: %s" % step)
+		if step in ('write', 'verify', 'read') and not filename:
+			raise Exception("The %s step requires a file" % step)
+		if step == 'patch' and not patches:
+			raise Exception("The patch step requires a list of patches")
+		if self._int(swap) not in (0, 16, 32):
+			raise Exception("Invalid byte swap word size: %s (must be 16 or 32)" % str(swap))
+
+		self.steps.append({"step" : step, "file" : filename, "address" : self._int(address), "size" : self._int(size), "patches" : patches, "base" : self._int(base), "swap" : self._int(swap)})
+
+	def Load(self, manifest):
+		"""
+		Adds steps from a manifest.
+
+		@manifest - A manifest dict, with a list of steps and/or a list of patches.
+
+		Returns None.
+		"""
+		for step in manifest.get("steps", []):
+			if not isinstance(step, dict):
+				step = {"step" : step}
+			self.Add(step["step"], step.get("file"), step.get("address", 0), step.get("size", 0), step.get("patches"), step.get("base", 0), step.get("swap", 0))
+
+		if manifest.get("patches"):
+			self.Add("patch", patches=manifest["patches"])
+
+	def _int(self, value):
+		"""
+		Converts a manifest value (an integer, or a decimal or 0x prefixed hex string) to an integer. For internal use only.
+		"""
+		if isinstance(value, basestring):
+			return int(value, 0)
+		return value
+
+	def _coalesce(self, patches, width):
+		"""
+		Merges adjacent and overlapping patches. For internal use only.
 
-		while i < len(data):
-			fdata += data[i+1] + data[i]
-			i += 2
-	
-		return fdata
+		@patches - List of patch dicts.
+		@width   - Number of bytes per chip address.
 
-	def chip_list():
-		chips = []
+		Returns a list of (address, data, verify) tuples, sorted by address.
+		"""
+		entries = []
+
+		for patch in patches:
+			if patch.has_key("data"):
+				data = patch["data"].replace(" ", "").decode("hex")
+			elif patch.has_key("file"):
+				data = self._data({"file" : patch["file"], "size" : self._int(patch.get("size", 0))})
+			else:
+				raise Exception("Patch at address %s has no data or file" % str(patch.get("address")))
+
+			if data:
+				# Work in byte offsets, so that patches can be merged on either bus width
+				offset = self._int(patch["address"]) * width
+				entries.append((offset, offset + len(data), data, bool(patch.get("verify", False))))
+
+		regions = []
+		for (start, end, data, verify) in sorted(entries, key=lambda entry: entry[0]):
+			if regions and start <= regions[-1][1]:
+				regions[-1][1] = max(regions[-1][1], end)
+				regions[-1][2] = regions[-1][2] or verify
+			else:
+				regions.append([start, end, verify])
+
+		merged = []
+		for (start, end, verify) in regions:
+			# Pad to a whole number of chip addresses; writing 0xFF leaves erased flash unchanged
+			end += (width - (end - start) % width) % width
+			buf = bytearray("\xFF" * (end - start))
+
+			# Apply patches in manifest order, so that later patches take precedence
+			for (pstart, pend, data, pverify) in entries:
+				if pstart >= start and pend <= end:
+					buf[pstart-start:pend-start] = data
+
+			merged.append((start / width, str(buf), verify))
+
+		return merged
+
+	def _data(self, step):
+		"""
+		Returns the data to write or verify for a step. Files are only read once per job. For internal use only.
+		"""
+		if not self.files.has_key(step["file"]):
+			self.files[step["file"]] = open(step["file"], "rb").read()
+
+		data = self.files[step["file"]]
+		if step["size"]:
+			data = data[0:step["size"]]
+		return data
+
+	def _segments(self, step, width):
+		"""
+		Returns the segments to write or verify for a step, as a list of (chip address, data) tuples.
+		Image files are only parsed once per job. For internal use only.
+
+		@step  - Step dict.
+		@width - Number of bytes per chip address.
+		"""
+		if not self.images.has_key(step["file"]):
+			image = Image()
+			fmt = image.Format(step["file"])
+			if fmt != Image.BINARY:
+				image.Load(step["file"], fmt)
+				self.images[step["file"]] = image.Segments()
+			else:
+				self.images[step["file"]] = None
+
+		if self.images[step["file"]] is None:
+			return [(step["address"], self._data(step))]
+
+		segments = []
+		for (address, data) in self.images[step["file"]]:
+			offset = address - step["base"] + (step["address"] * width)
+			if offset < 0:
+				raise Exception("Segment at image address 0x%X is below the base address 0x%X" % (address, step["base"]))
+
+			# Segments must start and end on a chip address; pad with 0xFF, which leaves erased flash unchanged
+			head = offset % width
+			tail = (width - (head + len(data)) % width) % width
+			segments.append(((offset - head) / width, ("\xFF" * head) + data + ("\xFF" * tail)))
+
+		return segments
+
+	def _transform(self, step):
+		"""
+		Returns a new Transform instance for a step, or None if the step's data isn't transformed. For internal use only.
+		"""
+		if step["swap"]:
+			return ByteSwap(step["swap"] / 8)
+		return None
+
+	def _signature(self):
+		"""
+		Returns a hash of the job's configuration, steps and input files, used to check that a
+		checkpoint file belongs to this job. For internal use only.
+		"""
+		files = []
+		for step in self.steps:
+			names = [step["file"]] + [patch.get("file") for patch in (step["patches"] or [])]
+			for name in names:
+				# Read step output files are expected to change, so only input files are included
+				if name and step["step"] != 'read' and os.path.exists(name):
+					st = os.stat(name)
+					files.append([name, st.st_size, int(st.st_mtime)])
+
+		return hashlib.sha1(json.dumps([self.config, self.steps, files], sort_keys=True)).hexdigest()
+
+	def _resume(self):
+		"""
+		Loads the checkpoint file, if there is one. For internal use only.
+
+		Returns a (step index, byte offset) tuple of where to resume the job from.
+		"""
+		if not self.checkpoint or not os.path.exists(self.checkpoint):
+			return (0, 0)
 
-		for filename in os.listdir(CONFIG_PATH):
-			if filename.endswith(CONF_EXT):
-				chips.append(filename.strip(CONF_EXT))
+		state = json.load(open(self.checkpoint))
+		if state.get("signature") != self._signature():
+			raise Exception("Checkpoint file %s is for a different job, or the job's files have changed; delete it to start over" % self.checkpoint)
+
+		return (state["step"], state["offset"])
+
+	def _save(self, index, offset):
+		"""
+		Saves the job's progress to the checkpoint file. For internal use only.
+
+		@index  - Index of the step that is running, or of the next step to run.
+		@offset - Number of bytes of the step's data that have been written or read.
+
+		Returns None.
+		"""
+		if not self.checkpoint:
+			return
+
+		# Write to a temporary file and rename it, so that an interruption never leaves a partial checkpoint file
+		tmp = self.checkpoint + ".tmp"
+		fp = open(tmp, "w")
+		json.dump({"signature" : self._signature(), "step" : index, "offset" : offset}, fp)
+		fp.close()
+		os.rename(tmp, self.checkpoint)
+
+	def _run_step(self, flash, step, index=0, offset=0):
+		"""
+		Runs a single step. For internal use only.
+
+		@flash  - NORFlash instance.
+		@step   - Step dict.
+		@index  - Index of the step, for checkpointing.
+		@offset - Number of bytes of a write or read step's data that were completed before the job was resumed.
+
+		Returns a (success, message) tuple.
+		"""
+		name = step["step"]
+		address = step["address"]
+
+		if name == 'id':
+			(vendor, product) = flash.ID()
+			return (True, "Vendor ID: 0x%X, Product ID: 0x%X" % (vendor, product))
+
+		elif name == 'erase':
+			flash.EraseChip()
+			return (True, "Chip erased")
+
+		elif name == 'blank-check':
+			offset = flash.BlankCheck(address, step["size"])
+			if offset is not None:
+				return (False, "Chip is not blank at address 0x%X" % (address + offset))
+			return (True, "Chip is blank")
+
+		elif name == 'write':
+			segments = self._segments(step, flash.Width())
+			done = 0
+			for (address, data) in segments:
+				# Skip data that was written before the job was resumed
+				skip = min(max(offset - done, 0), len(data))
+				if skip < len(data):
+					checkpoint = lambda n, chunk, start=done+skip: self._save(index, start + n)
+					flash.WriteChip(address + (skip / flash.Width()), data[skip:], transform=self._transform(step), checkpoint=checkpoint)
+				done += len(data)
+
+			if len(segments) == 1:
+				return (True, "Wrote %d bytes from %s starting at address 0x%X" % (len(segments[0][1]), step["file"], segments[0][0]))
+			return (True, "Wrote %d bytes from %s in %d segments" % (sum([len(s[1]) for s in segments]), step["file"], len(segments)))
+
+		elif name == 'verify':
+			segments = self._segments(step, flash.Width())
+			for (address, data) in segments:
+				offset = flash.Verify(address, data, transform=self._transform(step))
+				if offset is not None:
+					return (False, "Verify failed at address 0x%X" % (address + (offset / flash.Width())))
+			return (True, "Verified %d bytes from %s" % (sum([len(s[1]) for s in segments]), step["file"]))
+
+		elif name == 'read':
+			size = step["size"]
+			if not size:
+				size = (flash.config.GetSetting("SIZE") or [0])[0]
+			if not size:
+				raise Exception("The target chip size is unknown; specify a size, or set SIZE in the chip configuration")
+
+			# The job was interrupted after the last segment was saved, but before the step was marked as done.
+			# Don't pass ReadChip a count of 0 here, as that reads the whole chip.
+			if offset and offset >= size:
+				return (True, "Read %d bytes starting at address 0x%X into %s" % (offset, address, step["file"]))
+
+			# Save each segment as it is read, so that an interrupted read can be resumed
+			if offset:
+				fp = open(step["file"], "r+b")
+				fp.truncate(offset)
+				fp.seek(offset)
+			else:
+				fp = open(step["file"], "wb")
+
+			saved = [offset]
+			def checkpoint(n, chunk):
+				fp.write(chunk)
+				fp.flush()
+				os.fsync(fp.fileno())
+				saved[0] += len(chunk)
+				self._save(index, saved[0])
+
+			try:
+				data = flash.ReadChip(address + (offset / flash.Width()), size - offset, transform=self._transform(step), checkpoint=checkpoint)
+				# Any trailing bytes held back by the transform
+				fp.write(data[saved[0]-offset:])
+			finally:
+				fp.close()
+
+			return (True, "Read %d bytes starting at address 0x%X into %s" % (offset + len(data), address, step["file"]))
+
+		elif name == 'patch':
+			regions = self._coalesce(step["patches"], flash.Width())
+
+			for (address, data, verify) in regions:
+				flash.WriteChip(address, data, progress=False)
+
+			for (address, data, verify) in regions:
+				if verify:
+					offset = flash.Verify(address, data, progress=False)
+					if offset is not None:
+						return (False, "Patch verify failed at address 0x%X" % (address + (offset / flash.Width())))
+
+			return (True, "Wrote %d patches as %d regions (%d bytes)" % (len(step["patches"]), len(regions), sum([len(r[1]) for r in regions])))
+
+	def Run(self):
+		"""
+		Runs all steps in order, over a single Gumbi board session. Stops at the first step that fails.
+
+		Returns a list of result dicts, one per step that was run:
+
+			{"step", "seconds", "success", "message"}
+		"""
+		results = []
 
-		chips.sort()
-		return chips
+		if self.verbose:
+			sys.stdout.write("Connecting to Gumbi board...")
+			sys.stdout.flush()
+
+		(resume, offset) = self._resume()
+
+		t = time.time()
+		flash = NORFlash(config=self.config, port=self.port)
+		results.append({"step" : "connect", "seconds" : time.time() - t, "success" : True, "message" : "Connected"})
+
+		if self.verbose:
+			print "connected."
+
+		try:
+			for (index, step) in enumerate(self.steps):
+				if index < resume:
+					results.append({"step" : step["step"], "seconds" : 0, "success" : True, "message" : "Skipped (completed before the job was resumed)"})
+					continue
+
+				if self.verbose:
+					if index == resume and offset:
+						print "Resuming %s step at byte offset %d..." % (step["step"], offset)
+					else:
+						print "Running %s step..." % step["step"]
+
+				t = time.time()
+				try:
+					(success, message) = self._run_step(flash, step, index, (offset if index == resume else 0))
+				except Exception, e:
+					(success, message) = (False, str(e))
+
+				results.append({"step" : step["step"], "seconds" : time.time() - t, "success" : success, "message" : message})
+				if not success:
+					break
+
+				self._save(index + 1, 0)
+		finally:
+			try:
+				flash.Close()
+			except Exception, e:
+				# Don't let a failure to exit parallel mode hide the results of the steps
+				results.append({"step" : "disconnect", "seconds" : 0, "success" : False, "message" : str(e)})
+
+		if self.checkpoint and os.path.exists(self.checkpoint) and all([r["success"] for r in results]):
+			os.remove(self.checkpoint)
+
+		return results
+
+	def Report(self, results):
+		"""
+		Returns a list of human readable lines describing the results of Run().
+		"""
+		lines = ["%-12s %10s  %s" % ("Step", "Seconds", "Result")]
+
+		for r in results:
+			lines.append("%-12s %10.3f  %-6s %s" % (r["step"], r["seconds"], ("OK" if r["success"] else "FAILED"), r["message"]))
+
+		lines.append("%-12s %10.3f" % ("total", sum([r["seconds"] for r in results])))
+		return lines
+
+def load_manifest(path):
+	"""
+	Loads a job manifest. Files ending in .yaml or .yml are parsed as YAML (requires PyYAML), all others as JSON.
+
+	Returns a dict.
+	"""
+	if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+		try:
+			import yaml
+		except ImportError:
+			raise Exception("PyYAML is required to load YAML job manifests; use JSON instead")
+		return yaml.safe_load(open(path))
+
+	return json.load(open(path))
+
+
+
+
+if __name__ == "__main__":
+
+	CONFIG_PATH = "bin/config/"
+	CONF_EXT = '.conf'
+
+	def wordflip(infile, outfile):
+		"""
+		Word-flips the contents of a file.
+
+		@infile  - File to flip.
+		@outfile - File to save the flipped data to.
+
+		Returns None.
+		"""
+		flip = ByteSwap(2)
+		src = open(infile, "rb")
+		dst = open(outfile, "wb")
+
+		while True:
+			block = src.read(1024 * 1024)
+			if not block:
+				break
+			dst.write(flip.Feed(block))
+		dst.write(flip.Flush())
+
+		src.close()
+		dst.close()
 
 	def list_chips():
+		db = ChipDB(CONFIG_PATH)
+
 		print ""
 		print "Supported chips:\n"
-		for chip in chip_list():
-			print "\t", chip
+		for chip in db.Chips(NORFlash.MODE):
+			entry = db.Get(chip)
+			if entry["vendor"] is not None:
+				ids = "0x%.2X:%s" % (entry["vendor"], ','.join(["0x%.2X" % product for product in entry["products"]]))
+			else:
+				ids = ""
+			print "\t%-16s %8d bytes %4d-bit  %s" % (chip, entry["size"], entry["width"], ids)
 		print ""
 
+	def identify_chip(port, verbose, probe=None):
+		"""
+		Identifies the target chip by its vendor and product IDs, which are read once over a single connection.
+
+		The IDs are read with the configuration of the probe chip, or of the largest group of chips that are
+		identified the same way. Only chips that are powered the same way as the probe chip (same package, VCC
+		and GND pins and voltage) can be identified; other chips must be identified with a different probe.
+
+		Returns the chip name.
+		"""
+		db = ChipDB(CONFIG_PATH)
+
+		if probe is None:
+			probes = db.Probes(NORFlash.MODE)
+			if not probes:
+				raise Exception("None of the chip configuration files list vendor and product IDs!")
+			probe = probes[0][1][0]
+
+		entry = db.Get(probe)
+		if entry is None or entry["mode"] != NORFlash.MODE:
+			raise Exception("Unknown probe chip: %s" % probe)
+
+		if verbose:
+			chips = []
+			for (config, names) in db.Probes(NORFlash.MODE, entry["power"]):
+				chips += names
+			print "Probing with %s for %s..." % (entry["name"], ', '.join(sorted(chips)))
+
+		flash = NORFlash(config=entry["file"], port=port)
+		(vendor, product) = flash.ID()
+		flash.Close()
+
+		matches = db.Identify(vendor, product, NORFlash.MODE, entry["power"])
+		if not matches:
+			raise Exception("Failed to identify the target chip (vendor ID 0x%X, product ID 0x%X) using %s; for chips in other packages or at other voltages, use --probe" % (vendor, product, entry["name"]))
+
+		if len(matches) > 1:
+			print "Vendor ID 0x%X, product ID 0x%X matches: %s (using %s)" % (vendor, product, ', '.join(matches), matches[0])
+		return matches[0]
+
 	def usage():
 		print ""
 		print "Usage: %s [OPTIONS]" % sys.argv[0]
 		print ""
 		print "\t-i, --id                 Retrieve the vendor and product IDs from the target chip"
 		print "\t-e, --erase              Erase the target chip"
+		print "\t-b, --blank-check        Check that the target chip is erased"
 		print "\t-l, --list               List supported chips"
 		print "\t-r, --read=<file>        Read data from the chip and save it in the specified file"
-		print "\t-w, --write=<file>       Write data from the specified file to the chip"
-		print "\t-c, --chip=<part no.>    Specify the part number of the target chip"
+		print "\t-w, --write=<file>       Write data from the specified binary, Intel HEX, S-record or ELF file to the chip"
+		print "\t-V, --verify             Verify the data written to the chip"
+		print "\t-j, --job=<file>         Run the steps and patches listed in a JSON or YAML job manifest"
+		print "\t-c, --chip=<part no.>    Specify the part number of the target chip, or 'auto' to identify it by its IDs"
+		print "\t-A, --probe=<part no.>   With --chip=auto, read the IDs using this chip's package and voltage"
 		print "\t-a, --address=<int>      Specify the starting address [0]"
+		print "\t-B, --base=<int>         Specify the image address of the start of the chip, for HEX, S-record and ELF files [0]"
 		print "\t-s, --size=<int>         Specify the number of bytes to read/write"
 		print "\t-f, --word-flip=<file>   Word-flip the contents of the specified file"
+		print "\t-S, --swap=<16|32>       Byte swap each 16 or 32 bit word as it is read from or written to the chip"
+		print "\t-k, --checkpoint=<file>  Save the job's progress to the specified file, and resume from it if it exists"
 		print "\t-P, --port=<port>        Set the Gumbi board's virtual serial port [/dev/ttyACM0]"
 		print "\t-p, --path=<path>        Set the path to the chip configuration files [%s]" % CONFIG_PATH
 		print "\t-v, --verbose            Enabled verbose output"
 		print "\t-h, --help               Show help"
 		print ""
+		print "All steps are run over a single connection, in this order: %s." % ', '.join(FlashJob.STEPS)
+		print ""
 		sys.exit(1)
 
 
@@ -137,50 +708,61 @@ if __name__ == "__main__":
 
 
 	ACTIONS = {}
-	ACTION_LIST = ['vendorid', 'productid', 'erase', 'write', 'read']
 
-	t = 0
 	size = 0
 	address = 0
-	doid = False
-	doerase = False
 	verbose = False
 	chip = None
 	port = None
-	infile = None
 	config = None
-	outfile = None
-	flipfile = None
+	manifest = None
+	base = 0
+	swap = 0
+	checkpoint = None
+	probe = None
 
 	try:
-		opts, args = GetOpt(sys.argv[1:], "iela:s:r:w:c:f:P:p:vh", ["id", "erase", "list", "address=", "size=", "read=", "write=", "chip=", "word-flip=", "port=", "path=", "verbose", "help"])
+		opts, args = GetOpt(sys.argv[1:], "iebla:B:s:r:w:Vj:c:A:f:S:k:P:p:vh", ["id", "erase", "blank-check", "list", "address=", "base=", "size=", "read=", "write=", "verify", "job=", "chip=", "probe=", "word-flip=", "swap=", "checkpoint=", "port=", "path=", "verbose", "help"])
 	except GetoptError, e:
 		print e
 		usage()
 
 	for opt, arg in opts:
 		if opt in ('-i', '--id'):
-			ACTIONS['vendorid'] = True
-			ACTIONS['productid'] = True
+			ACTIONS['id'] = True
 		elif opt in ('-e', '--erase'):
 			ACTIONS['erase'] = True
+		elif opt in ('-b', '--blank-check'):
+			ACTIONS['blank-check'] = True
 		elif opt in ('-l', '--list'):
 			list_chips()
 			sys.exit(0)
 		elif opt in ('-a', '--address'):
 			address = int(arg)
+		elif opt in ('-B', '--base'):
+			base = int(arg, 0)
 		elif opt in ('-s', '--size'):
 			size = int(arg)
 		elif opt in ('-r', '--read'):
 			ACTIONS['read'] = arg
 		elif opt in ('-w', '--write'):
 			ACTIONS['write'] = arg
+		elif opt in ('-V', '--verify'):
+			ACTIONS['verify'] = True
+		elif opt in ('-j', '--job'):
+			manifest = load_manifest(arg)
 		elif opt in ('-c', '--chip'):
 			chip = arg
+		elif opt in ('-A', '--probe'):
+			probe = arg
 		elif opt in ('-f', '--word-flip'):
-			open("%s.flip" % flipfile, "wb").write(wordflip(open(arg, "rb").read()))
+			wordflip(arg, "%s.flip" % arg)
 			print "File saved to: %s.flip" % arg
 			sys.exit(0)
+		elif opt in ('-S', '--swap'):
+			swap = int(arg)
+		elif opt in ('-k', '--checkpoint'):
+			checkpoint = arg
 		elif opt in ('-P', '--port'):
 			port = arg
 		elif opt in ('-p', '--path'):
@@ -190,70 +772,56 @@ if __name__ == "__main__":
 		elif opt in ('-h', '--help'):
 			usage()
 
-	
+
+	if manifest is not None:
+		if chip is None:
+			chip = manifest.get("chip")
+		if port is None:
+			port = manifest.get("port")
+
+	if chip is not None and chip.lower() == 'auto':
+		try:
+			chip = identify_chip(port, verbose, probe)
+		except Exception, e:
+			print e
+			sys.exit(1)
+		print "Detected chip: %s" % chip
+
 	try:
 		config = os.path.join(*[CONFIG_PATH, chip.upper() + CONF_EXT])
 	except:
 		print "Please specify the chip type!"
 		usage()
 
-	if len(ACTIONS) == 0:
-		print "Please specify an action (id, read, write, etc)!"
-		usage()
-
-	for action in ACTION_LIST:
+	job = FlashJob(config, port=port, verbose=verbose, checkpoint=checkpoint)
 
-		if ACTIONS.has_key(action):
-			
-			t = 0
-			if verbose:
-				sys.stdout.write("Connecting to Gumbi board...")
-				sys.stdout.flush()
-
-			flash = NORFlash(config=config, port=port)
-
-			if verbose:
-				print "connected."
-			
-			if action == 'vendorid':
-				print "Vendor ID: 0x%X" % flash.VendorID()
-
-			elif action == 'productid':
-				print "Product ID: 0x%X" % flash.ProductID()
-		
-			elif action == 'erase':
-				sys.stdout.write("Erasing chip...")
-				sys.stdout.flush()
-				flash.EraseChip()
-				print "done."
-
-			elif action == 'write':
-				data = open(ACTIONS['write'], "rb").read()
-				if not size:
-					size = len(data)
-			
-				print "Writing %d bytes from %s starting at address 0x%X...\n" % (size, ACTIONS['write'], address)
-				flash.StartTimer()
-				flash.WriteChip(address, data[0:size])
-				t = flash.StopTimer()
-				print "\n"
-
-			elif action == 'read':
-				if size:
-					print "Reading %d bytes starting at address 0x%X...\n" % (size, address)
+	try:
+		if manifest is not None:
+			job.Load(manifest)
+
+		for step in FlashJob.STEPS:
+			if ACTIONS.has_key(step):
+				if step == 'verify':
+					if not ACTIONS.has_key('write'):
+						raise Exception("Verify requires a file to be written (-w)!")
+					job.Add(step, ACTIONS['write'], address, size, base=base, swap=swap)
+				elif step in ('write', 'read'):
+					job.Add(step, ACTIONS[step], address, size, base=base, swap=swap)
 				else:
-					print "Reading all bytes starting at address 0x%X...\n" % (address)
-
-				flash.StartTimer()
-				open(ACTIONS['read'], "wb").write(flash.ReadChip(address, size))
-				t = flash.StopTimer()
-				print "\n"
+					job.Add(step, None, address, size)
+	except Exception, e:
+		print e
+		usage()
 
-			flash.Close()
+	if len(job.steps) == 0:
+		print "Please specify an action (id, read, write, etc)!"
+		usage()
 
-			if t:
-				print "Operation completed in", t, "seconds."
+	results = job.Run()
 
-			if action == 'id':
-				sys.exit(0)
+	print ""
+	for line in job.Report(results):
+		print line
 
+	if not results[-1]["success"]:
+		sys.exit(1)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+import sys
+from getopt import getopt as GetOpt, GetoptError
+from gumbi import *
+
+
+if __name__ == '__main__':
+	def usage():
+		print ""
+		print "Usage: %s [OPTIONS]" % sys.argv[0]
+		print ""
+		print "\t-e, --emulate            Run the benchmarks against the software emulator instead of a Gumbi board"
+		print "\t-s, --suites=<list>      Comma separated list of benchmark suites to run [%s]" % ','.join(Benchmark.SUITES)
+		print "\t-i, --iterations=<int>   Number of times to run each benchmark [10]"
+		print "\t-c, --config=<file>      Parallel configuration file for the parallel benchmarks"
+		print "\t-j, --json=<file>        Save the results to a JSON file"
+		print "\t-b, --baseline=<file>    Compare the results against a baseline JSON file"
+		print "\t-t, --threshold=<int>    Percent throughput drop considered to be a regression [10]"
+		print "\t-P, --port=<port>        Set the Gumbi board's virtual serial port [/dev/ttyACM0]"
+		print "\t-h, --help               Show help"
+		print ""
+		print "Exits with a status of 2 if any regressions are found."
+		print ""
+		sys.exit(1)
+
+	suites = None
+	iterations = 10
+	config = None
+	jsonfile = None
+	baseline = None
+	threshold = 10
+	port = None
+	emulate = False
+
+	try:
+		opts, args = GetOpt(sys.argv[1:], "es:i:c:j:b:t:P:h", ["emulate", "suites=", "iterations=", "config=", "json=", "baseline=", "threshold=", "port=", "help"])
+	except GetoptError, e:
+		print e
+		usage()
+
+	for opt, arg in opts:
+		if opt in ('-e', '--emulate'):
+			emulate = True
+		elif opt in ('-s', '--suites'):
+			suites = arg.split(',')
+		elif opt in ('-i', '--iterations'):
+			iterations = int(arg)
+		elif opt in ('-c', '--config'):
+			config = arg
+		elif opt in ('-j', '--json'):
+			jsonfile = arg
+		elif opt in ('-b', '--baseline'):
+			baseline = arg
+		elif opt in ('-t', '--threshold'):
+			threshold = float(arg)
+		elif opt in ('-P', '--port'):
+			port = arg
+		elif opt in ('-h', '--help'):
+			usage()
+
+	bench = Benchmark(iterations=iterations, port=port, config=config, emulate=emulate)
+	results = bench.Run(suites)
+
+	for line in bench.Report(results):
+		print line
+
+	if jsonfile is not None:
+		bench.Save(results, jsonfile)
+
+	if baseline is not None:
+		regressions = bench.Compare(results, bench.Load(baseline), threshold / 100.0)
+
+		print ""
+		if regressions:
+			for (name, base, current, change) in regressions:
+				print "REGRESSION: %s dropped %.1f%% (%.1f -> %.1f %s/s)" % (name, -change * 100, base, current, results["results"][name]["unit"])
+			sys.exit(2)
+		else:
+			print "No regressions against %s" % baseline
@@ -1,38 +1,29 @@
 #!/usr/bin/env python
 
 import sys
-from time import sleep
 from gumbi import *
 
 
 def blinki():
 	io = GPIO(voltage=3)
+	seq = Sequence()
 
-	try:
-		print "Starting Gumbi LED test. Press Ctrl+C to quit."
-
-		while True:
-	
-			i = 1
-
-			while i <= 32:
-				io.PinHigh(i)
-				io.PinLow(i+1)
-				i += 2
-				sleep(.1)
+	i = 1
+	while i <= 32:
+		seq.Step(high=[i], low=[i+1], delay=.1)
+		i += 2
 
-			while i <= 64:
-				io.PinLow(i)
-				io.PinHigh(i+1)
-				i += 2
-				sleep(.1)
+	while i <= 64:
+		seq.Step(high=[i+1], low=[i], delay=.1)
+		i += 2
 
-			sleep(2)
+	seq.Delay(2)
+	seq.Step(low=range(1, 65))
 
-			io.PinsLow(range(1, 65))
-
-	except KeyboardInterrupt:
-		pass
+	print "Starting Gumbi LED test. Press Ctrl+C to quit."
+	stats = io.Play(seq, loops=0)
+	print ""
+	print "Played %d steps at %.1f steps/second (mean jitter: %.6fs, max jitter: %.6fs)" % (stats["steps"], stats["rate"], stats["jitter_mean"], stats["jitter_max"])
 
 	io.Close()
 
@@ -57,6 +48,11 @@ def ping():
 	print "Ping successful:", p.Ping()
 	p.Close
 
+def reset():
+	g = Gumbi()
+	print "Reset successful:", g.Reset()
+	g.Close()
+
 def speed(c):
 	s = SpeedTest(c)
 	print "Performing speed test with", c, "bytes..."
@@ -65,14 +61,93 @@ def speed(c):
 	print "Data transfer valid:", s.Validate()
 	s.Close()
 
+def xfer(n):
+	t = TransferTest()
+	print "Running", n, "transfers of each size:", ', '.join([str(size) for size in t.SWEEP_SIZES]), "bytes..."
+	for line in t.Report(t.Sweep(iterations=n)):
+		print line
+	t.Close()
+
+# Number of toggling pins that the live monitor view calculates statistics for, unless pins are listed
+MONITOR_PINS = 16
+
+def monitor(n, pins=None):
+	m = Monitor()
+
+	try:
+		while True:
+			capture = m.Capture(n)
+			static = capture.StaticPins(pins)
+			toggling = [pin for pin in (pins or range(1, m.num_pins + 1)) if not static.has_key(pin)]
+
+			# Statistics are slow to calculate for toggling pins, so only do a screenful to keep the view responsive
+			shown = toggling
+			if pins is None:
+				shown = toggling[:MONITOR_PINS]
+			stats = capture.Statistics(shown)
+
+			if sys.stdout.isatty():
+				sys.stdout.write("\033[2J\033[H")
+
+			print "Sampled %d pins %d times (%d samples/second). Press Ctrl+C to quit.\n" % (m.num_pins, n, capture.Rate())
+			print "%5s %10s %14s %8s %10s %10s %10s" % ("Pin", "Toggles", "Frequency", "Duty", "Min Pulse", "Avg Pulse", "Glitches")
+
+			for pin in shown:
+				s = stats[pin]
+				print "%5d %10d %12.1fHz %7.2f%% %10d %10.1f %10d" % (pin, s["toggles"], s["frequency"], s["duty"] * 100, s["min_pulse"], s["mean_pulse"], s["glitches"])
+
+			print ""
+			if len(shown) < len(toggling):
+				print "Also toggling (list pins after the sample count to show them):", ','.join([str(pin) for pin in toggling[len(shown):]])
+			print "Static high:", ','.join([str(pin) for pin in sorted(static.keys()) if static[pin]])
+			print "Static low:", ','.join([str(pin) for pin in sorted(static.keys()) if not static[pin]])
+
+	except KeyboardInterrupt:
+		pass
+
+	m.Close()
+def jtag_bench(config, clocks):
+	j = JTAG(config=config)
+	print "Clocking", clocks, "JTAG clocks..."
+	print "Throughput: %.1f clocks/second" % j.Benchmark(clocks)
+	j.Close()
+
 
 
 if __name__ == '__main__':
 	def usage():
-		print "Usage: %s [--info | --led | --scan | --ping | --speed-test <# of bytes> | --voltage <0|2|3|5>]" % sys.argv[0]
+		print "Usage: %s [--stats] [--prometheus <file>] [--record <file> | --replay <file> [--fast]] [--info | --led | --scan | --ping | --reset | --speed-test <# of bytes> | --xfer-test <# of iterations> | --voltage <0|2|3|5> | --monitor <# of samples> [pin,pin,...] | --jtag-bench <config file> [# of clocks]]" % sys.argv[0]
 		sys.exit(1)
 
 	def main():
+		stats = False
+		prometheus = None
+
+		# Metrics options may be combined with any of the commands below
+		if '--stats' in sys.argv:
+			sys.argv.remove('--stats')
+			stats = True
+		if '--prometheus' in sys.argv:
+			i = sys.argv.index('--prometheus')
+			prometheus = sys.argv[i+1]
+			del sys.argv[i:i+2]
+
+		# Record the session to a trace file, or play back a previously recorded session
+		replay = None
+		if '--record' in sys.argv:
+			i = sys.argv.index('--record')
+			Gumbi.TRACE = Trace(sys.argv[i+1], size=0)
+			del sys.argv[i:i+2]
+		if '--replay' in sys.argv:
+			i = sys.argv.index('--replay')
+			replay = Replay(sys.argv[i+1])
+			Gumbi.TRANSPORT = replay
+			del sys.argv[i:i+2]
+		if '--fast' in sys.argv:
+			sys.argv.remove('--fast')
+			if replay is not None:
+				replay.speed = 0
+
 		try:
 			if sys.argv[1] == '--info':
 				info()
@@ -80,18 +155,47 @@ if __name__ == '__main__':
 				blinki()
 			elif sys.argv[1] == '--ping':
 				ping()
+			elif sys.argv[1] == '--reset':
+				reset()
 			elif sys.argv[1] == '--scan':
 				scan()
 				info()
 			elif sys.argv[1] == '--speed-test':
 				speed(int(sys.argv[2]))
+			elif sys.argv[1] == '--xfer-test':
+				xfer(int(sys.argv[2]))
 			elif sys.argv[1] == '--voltage':
 				voltage(int(sys.argv[2]))
 				info()
+			elif sys.argv[1] == '--monitor':
+				if len(sys.argv) > 3:
+					monitor(int(sys.argv[2]), [int(pin) for pin in sys.argv[3].split(',')])
+				else:
+					monitor(int(sys.argv[2]))
+			elif sys.argv[1] == '--jtag-bench':
+				if len(sys.argv) > 3:
+					jtag_bench(sys.argv[2], int(sys.argv[3]))
+				else:
+					jtag_bench(sys.argv[2], 0x10000)
 			else:
 				raise Exception('bad args')
 		except Exception, e:
 			print e
 			usage()
+		finally:
+			if stats:
+				print ""
+				for line in Gumbi.STATS.Report():
+					print line
+			if prometheus is not None:
+				Gumbi.STATS.WritePrometheus(prometheus)
+			if Gumbi.TRACE is not None:
+				Gumbi.TRACE.Close()
+			if replay is not None:
+				print ""
+				for line in replay.Report():
+					print line
+				if not replay.Done():
+					print "Warning: the recorded session was not played back completely"
 
 	main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+import sys
+import signal
+from getopt import getopt as GetOpt, GetoptError
+from gumbi import *
+
+
+if __name__ == '__main__':
+	def usage():
+		print ""
+		print "Usage: %s [OPTIONS]" % sys.argv[0]
+		print ""
+		print "\t-s, --socket=<path>      Unix socket to listen on [%s]" % Server.SOCKET
+		print "\t-P, --port=<port>        Gumbi board serial port; may be given more than once to serve several boards [auto]"
+		print "\t-e, --emulate            Serve the software emulator instead of a Gumbi board"
+		print "\t-h, --help               Show help"
+		print ""
+		print "Boards are numbered in the order their ports are given; clients select a board by number."
+		print ""
+		sys.exit(1)
+
+	path = None
+	ports = []
+
+	try:
+		opts, args = GetOpt(sys.argv[1:], "s:P:eh", ["socket=", "port=", "emulate", "help"])
+	except GetoptError, e:
+		print e
+		usage()
+
+	for opt, arg in opts:
+		if opt in ('-s', '--socket'):
+			path = arg
+		elif opt in ('-P', '--port'):
+			ports.append(arg)
+		elif opt in ('-e', '--emulate'):
+			Gumbi.TRANSPORT = Emulator()
+		elif opt in ('-h', '--help'):
+			usage()
+
+	try:
+		server = Server(path, ports)
+	except Exception, e:
+		print e
+		sys.exit(1)
+
+	def stop(signum, frame):
+		server.Close()
+
+	signal.signal(signal.SIGTERM, stop)
+
+	print "Serving %d board(s) on %s" % (len(server.boards), server.path)
+
+	try:
+		server.Serve()
+	except KeyboardInterrupt:
+		pass
+
+	if server.running:
+		server.Close()
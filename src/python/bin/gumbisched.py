@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+import sys
+import json
+from getopt import getopt as GetOpt, GetoptError
+from gumbi import *
+
+
+if __name__ == '__main__':
+	CONFIG_PATH = "bin/config/"
+
+	def usage():
+		print ""
+		print "Usage: %s [OPTIONS] <job file>" % sys.argv[0]
+		print ""
+		print "\t-P, --port=<port>        Gumbi board serial port; may be given more than once [all /dev/ttyACM* ports]"
+		print "\t-e, --emulate=<int>      Run the jobs on this many emulated boards instead of Gumbi boards"
+		print "\t-p, --path=<path>        Set the path to the chip configuration files [%s]" % CONFIG_PATH
+		print "\t-j, --json=<file>        Save job and board statistics to a JSON file"
+		print "\t-v, --verbose            Print each job's result as it finishes"
+		print "\t-h, --help               Show help"
+		print ""
+		print "The job file contains one JSON job per line ('-' reads jobs from stdin as they arrive), or a JSON list of jobs:"
+		print ""
+		print "\t{\"action\" : \"read\", \"chip\" : \"MX29LV320\", \"file\" : \"dump.bin\", \"address\" : 0, \"size\" : 0}"
+		print ""
+		print "Actions are: %s. Monitor jobs take a \"samples\" count instead of a chip." % ', '.join(Job.ACTIONS)
+		print ""
+		sys.exit(1)
+
+	def jobs(fp):
+		"""
+		Generator that yields job dicts from a job file, one line at a time.
+		"""
+		first = True
+		for line in iter(fp.readline, ''):
+			line = line.strip()
+			if not line:
+				continue
+			if first and line.startswith('['):
+				# A JSON list of jobs
+				for job in json.loads(line + fp.read()):
+					yield job
+				return
+			first = False
+			yield json.loads(line)
+
+	def make_job(spec, db):
+		"""
+		Converts a job dict to a Job instance.
+		"""
+		config = spec.get("config")
+		if config is None and spec.get("chip"):
+			config = db.Path(spec["chip"])
+			if config is None:
+				raise Exception("Unknown chip: %s" % spec["chip"])
+
+		data = None
+		if spec.get("data"):
+			data = spec["data"].decode("hex")
+
+		return Job(spec["action"], config, int(str(spec.get("address", 0)), 0), int(str(spec.get("size", 0)), 0),
+				data, spec.get("file"), int(spec.get("samples", 0)), spec.get("voltage"))
+
+	ports = []
+	emulate = 0
+	jsonfile = None
+	verbose = False
+
+	try:
+		opts, args = GetOpt(sys.argv[1:], "P:e:p:j:vh", ["port=", "emulate=", "path=", "json=", "verbose", "help"])
+	except GetoptError, e:
+		print e
+		usage()
+
+	for opt, arg in opts:
+		if opt in ('-P', '--port'):
+			ports.append(arg)
+		elif opt in ('-e', '--emulate'):
+			emulate = int(arg)
+		elif opt in ('-p', '--path'):
+			CONFIG_PATH = arg + '/'
+		elif opt in ('-j', '--json'):
+			jsonfile = arg
+		elif opt in ('-v', '--verbose'):
+			verbose = True
+		elif opt in ('-h', '--help'):
+			usage()
+
+	if len(args) != 1:
+		usage()
+
+	if emulate:
+		# Each emulated board is a separate Emulator instance
+		Gumbi.TRANSPORT = staticmethod(lambda port: Emulator())
+		ports = ["emulator%d" % i for i in range(0, emulate)]
+
+	try:
+		sched = Scheduler(ports or None)
+	except Exception, e:
+		print e
+		sys.exit(1)
+
+	db = ChipDB(CONFIG_PATH)
+	submitted = []
+
+	if args[0] == '-':
+		fp = sys.stdin
+	else:
+		fp = open(args[0])
+
+	try:
+		for spec in jobs(fp):
+			try:
+				job = sched.Submit(make_job(spec, db))
+				submitted.append(job)
+				if verbose:
+					print "Job %d (%s) queued" % (job.id, job.action)
+			except Exception, e:
+				print "Rejected job %s: %s" % (json.dumps(spec), e)
+	except KeyboardInterrupt:
+		pass
+
+	failed = sched.Wait()
+
+	if verbose:
+		for job in submitted:
+			s = job.Stats()
+			print "Job %d %-8s on %-12s %-6s %10.3fs %s" % (s["id"], s["action"], s["port"], ("OK" if s["success"] else "FAILED"), s["latency"], s["error"] or "")
+		print ""
+
+	for line in sched.Report():
+		print line
+
+	if jsonfile is not None:
+		sched.Save(jsonfile)
+
+	sched.Close()
+
+	if failed:
+		sys.exit(1)
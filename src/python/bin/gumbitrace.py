@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+import sys
+from getopt import getopt as GetOpt, GetoptError
+from gumbi import *
+
+
+def hexdump(data, limit):
+	"""
+	Returns a list of hexdump lines for data, truncated to limit bytes (0 for no limit).
+	"""
+	lines = []
+	truncated = (limit and len(data) > limit)
+
+	if truncated:
+		data = data[:limit]
+
+	for i in range(0, len(data), 16):
+		chunk = data[i:i+16]
+		hexstr = ' '.join(["%.2X" % ord(c) for c in chunk])
+		ascii = ''.join([(c if 32 <= ord(c) < 127 else '.') for c in chunk])
+		lines.append("%.8X  %-48s  %s" % (i, hexstr, ascii))
+
+	if truncated:
+		lines.append("...")
+
+	return lines
+
+def describe_config(config):
+	"""
+	Returns a list of lines describing an unpacked configuration data structure.
+	"""
+	lines = ["%s start=0x%X count=%d toe=%d tbp=%d cmdelay=%d reconfigure=%d" % (Gumbi.ACTION_NAMES.get(config["ACTION"], config["ACTION"]), config["START"], config["COUNT"], config["TOE"], config["TBP"], config["CMDELAY"], config["RECONFIGURE"])]
+
+	for key in ["ADDRESS", "DATA", "VCC", "GND"]:
+		if config[key]:
+			lines.append("%s=%s" % (key, ','.join([str(p) for p in config[key]])))
+
+	if config["COMMANDS"]:
+		lines.append("COMMANDS=%s" % ','.join(["0x%X" % c for c in config["COMMANDS"]]))
+
+	pins = []
+	for key in Configuration.CONTROL_PINS:
+		(pin, active) = config[key]
+		if pin != Gumbi.UNUSED:
+			pins.append("%s=%d:%d" % (key, pin, active))
+	if pins:
+		lines.append(' '.join(pins))
+
+	return lines
+
+def decode(path, limit):
+	"""
+	Pretty-prints the records in a trace file.
+	"""
+	# Only used to unpack configuration frames, so no connection to the Gumbi board is needed
+	unpacker = Configuration({}, None, num_pins=Gumbi.MAX_PINS)
+	first = None
+	last = None
+	config_next = False
+	totals = {Trace.TX : 0, Trace.RX : 0}
+
+	for (rtype, ts, n, data) in ReadTrace(path):
+		if first is None:
+			first = last = ts
+
+		prefix = "%12.6f %+10.6f %-6s" % (ts - first, ts - last, Trace.TYPE_NAMES.get(rtype, rtype))
+
+		# Action annotations aren't displayed, so the next record's time delta is from the previous displayed record
+		if rtype != Trace.ACTION:
+			last = ts
+
+		if rtype == Trace.MODE:
+			print "%s %s" % (prefix, str(Gumbi.MODE_NAMES.get(ord(data), ord(data))).upper())
+		elif rtype == Trace.ACTION:
+			config_next = True
+		elif rtype == Trace.NOTE:
+			print "%s %s" % (prefix, data)
+		else:
+			totals[rtype] = totals.get(rtype, 0) + n
+			info = "%d bytes" % n
+			if len(data) < n:
+				info += " (%d captured)" % len(data)
+
+			config = None
+			if rtype == Trace.TX and config_next:
+				config_next = False
+				config = unpacker.Unpack(data)
+
+			if config is not None:
+				lines = describe_config(config)
+				print "%s %s, config: %s" % (prefix, info, lines[0])
+				for line in lines[1:]:
+					print "%31s %s" % ('', line)
+			elif rtype == Trace.RX and data.strip() in (Gumbi.ACK, Gumbi.NACK):
+				if data.strip() == Gumbi.ACK:
+					print "%s ACK" % prefix
+				else:
+					print "%s NACK" % prefix
+			else:
+				print "%s %s" % (prefix, info)
+				for line in hexdump(data, limit):
+					print "%31s %s" % ('', line)
+
+	print ""
+	print "Sent %d bytes, received %d bytes" % (totals[Trace.TX], totals[Trace.RX]),
+	if first is not None:
+		print "in %.6f seconds" % (last - first)
+	else:
+		print ""
+
+
+if __name__ == '__main__':
+	def usage():
+		print ""
+		print "Usage: %s [OPTIONS] <trace file>" % sys.argv[0]
+		print ""
+		print "\t-n, --bytes=<int>        Number of payload bytes to display per record [32]"
+		print "\t-a, --all                Display all payload bytes"
+		print "\t-h, --help               Show help"
+		print ""
+		sys.exit(1)
+
+	limit = 32
+
+	try:
+		opts, args = GetOpt(sys.argv[1:], "n:ah", ["bytes=", "all", "help"])
+	except GetoptError, e:
+		print e
+		usage()
+
+	for opt, arg in opts:
+		if opt in ('-n', '--bytes'):
+			limit = int(arg)
+		elif opt in ('-a', '--all'):
+			limit = 0
+		elif opt in ('-h', '--help'):
+			usage()
+
+	if len(args) != 1:
+		usage()
+
+	decode(args[0], limit)
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+from getopt import getopt as GetOpt, GetoptError
+from gumbi import SPI
+
+class SPIFlash(SPI):
+
+	# Default chip erase time in seconds
+	DEFAULT_TSCE = 60
+	# Default SPI flash commands
+	DEFAULT_ID = 0x9F
+	DEFAULT_WREN = 0x06
+	DEFAULT_RDSR = 0x05
+	DEFAULT_ERASE = 0xC7
+	# Write in progress bit in the status register
+	STATUS_WIP = 0x01
+
+	def _command(self, key, default):
+		"""
+		Returns the command byte defined by the given configuration key. For internal use only.
+		"""
+		value = self.config.GetSetting(key)
+		if value is None:
+			return default
+		return value[0]
+
+	def ReadChip(self, address=0, count=0):
+		"""
+		Reads count bytes from the target chip starting at address.
+		"""
+		if count == 0:
+			count = (self.config.GetSetting("SIZE") or [0])[0]
+			if count is None:
+				count = 0
+
+		return self.Read(address, count, callback=self.PrintProgress)
+
+	def WriteChip(self, address, data):
+		"""
+		Writes data to the target chip starting at address.
+		"""
+		return self.Write(address, data, callback=self.PrintProgress)
+
+	def ID(self):
+		"""
+		Reads the JEDEC ID from the target chip.
+
+		Returns a tuple of (vendor ID, memory type, capacity).
+		"""
+		data = self.Command([self._command("ID", self.DEFAULT_ID)], 3)
+		return tuple([ord(c) for c in data])
+
+	def Status(self):
+		"""
+		Returns the value of the target chip's status register.
+		"""
+		return ord(self.Command([self._command("RDSR", self.DEFAULT_RDSR)], 1))
+
+	def WaitReady(self, timeout):
+		"""
+		Waits for the target chip to finish an erase or write operation.
+
+		@timeout - Maximum time to wait, in seconds.
+
+		Returns True when the chip is ready, raises an exception on timeout.
+		"""
+		deadline = time.time() + timeout
+
+		while (self.Status() & self.STATUS_WIP):
+			if time.time() > deadline:
+				raise Exception("Timed out waiting for the target chip to become ready")
+			time.sleep(0.1)
+		return True
+
+	def EraseChip(self):
+		"""
+		Perform a full erase of the target chip.
+		"""
+		timeout = self.config.GetSetting("TSCE")
+		if timeout is None:
+			timeout = [self.DEFAULT_TSCE]
+
+		self.Command([self._command("WREN", self.DEFAULT_WREN)])
+		self.Command([self._command("ERASE", self.DEFAULT_ERASE)])
+		return self.WaitReady(timeout[0])
+
+
+
+
+if __name__ == "__main__":
+
+	CONFIG_PATH = "bin/config/"
+	CONF_EXT = '.conf'
+
+	def chip_list():
+		chips = []
+
+		for filename in os.listdir(CONFIG_PATH):
+			if filename.endswith(CONF_EXT):
+				# Only list configuration files for SPI chips
+				for line in open(os.path.join(CONFIG_PATH, filename)).readlines():
+					line = line.split('#')[0].replace(' ', '').upper()
+					if line.startswith("MODE=" + SPIFlash.MODE):
+						chips.append(filename[:-len(CONF_EXT)])
+						break
+
+		chips.sort()
+		return chips
+
+	def list_chips():
+		print ""
+		print "Supported chips:\n"
+		for chip in chip_list():
+			print "\t", chip
+		print ""
+
+	def usage():
+		print ""
+		print "Usage: %s [OPTIONS]" % sys.argv[0]
+		print ""
+		print "\t-i, --id                 Retrieve the JEDEC ID from the target chip"
+		print "\t-e, --erase              Erase the target chip"
+		print "\t-l, --list               List supported chips"
+		print "\t-r, --read=<file>        Read data from the chip and save it in the specified file"
+		print "\t-w, --write=<file>       Write data from the specified file to the chip"
+		print "\t-c, --chip=<part no.>    Specify the part number of the target chip"
+		print "\t-a, --address=<int>      Specify the starting address [0]"
+		print "\t-s, --size=<int>         Specify the number of bytes to read/write"
+		print "\t-P, --port=<port>        Set the Gumbi board's virtual serial port [/dev/ttyACM0]"
+		print "\t-p, --path=<path>        Set the path to the chip configuration files [%s]" % CONFIG_PATH
+		print "\t-v, --verbose            Enabled verbose output"
+		print "\t-h, --help               Show help"
+		print ""
+		sys.exit(1)
+
+
+
+
+
+	ACTIONS = {}
+	ACTION_LIST = ['id', 'erase', 'write', 'read']
+
+	t = 0
+	size = 0
+	address = 0
+	verbose = False
+	chip = None
+	port = None
+	config = None
+
+	try:
+		opts, args = GetOpt(sys.argv[1:], "iela:s:r:w:c:P:p:vh", ["id", "erase", "list", "address=", "size=", "read=", "write=", "chip=", "port=", "path=", "verbose", "help"])
+	except GetoptError, e:
+		print e
+		usage()
+
+	for opt, arg in opts:
+		if opt in ('-i', '--id'):
+			ACTIONS['id'] = True
+		elif opt in ('-e', '--erase'):
+			ACTIONS['erase'] = True
+		elif opt in ('-l', '--list'):
+			list_chips()
+			sys.exit(0)
+		elif opt in ('-a', '--address'):
+			address = int(arg, 0)
+		elif opt in ('-s', '--size'):
+			size = int(arg, 0)
+		elif opt in ('-r', '--read'):
+			ACTIONS['read'] = arg
+		elif opt in ('-w', '--write'):
+			ACTIONS['write'] = arg
+		elif opt in ('-c', '--chip'):
+			chip = arg
+		elif opt in ('-P', '--port'):
+			port = arg
+		elif opt in ('-p', '--path'):
+			CONFIG_PATH = arg + '/'
+		elif opt in ('-v', '--verbose'):
+			verbose = True
+		elif opt in ('-h', '--help'):
+			usage()
+
+
+	try:
+		config = os.path.join(*[CONFIG_PATH, chip.upper() + CONF_EXT])
+	except:
+		print "Please specify the chip type!"
+		usage()
+
+	if len(ACTIONS) == 0:
+		print "Please specify an action (id, read, write, etc)!"
+		usage()
+
+	if verbose:
+		sys.stdout.write("Connecting to Gumbi board...")
+		sys.stdout.flush()
+
+	# Unlike parallel mode, all SPI actions are performed over a single session with the Gumbi board
+	flash = SPIFlash(config=config, port=port)
+
+	if verbose:
+		print "connected."
+
+	try:
+		for action in ACTION_LIST:
+
+			if not ACTIONS.has_key(action):
+				continue
+
+			t = 0
+
+			if action == 'id':
+				(vendor, memtype, capacity) = flash.ID()
+				print "Vendor ID: 0x%X" % vendor
+				print "Device ID: 0x%X%.2X" % (memtype, capacity)
+
+			elif action == 'erase':
+				sys.stdout.write("Erasing chip...")
+				sys.stdout.flush()
+				flash.StartTimer()
+				flash.EraseChip()
+				t = flash.StopTimer()
+				print "done."
+
+			elif action == 'write':
+				data = open(ACTIONS['write'], "rb").read()
+				if not size:
+					size = len(data)
+
+				print "Writing %d bytes from %s starting at address 0x%X...\n" % (size, ACTIONS['write'], address)
+				flash.StartTimer()
+				flash.WriteChip(address, data[0:size])
+				t = flash.StopTimer()
+				print "\n"
+
+			elif action == 'read':
+				if size:
+					print "Reading %d bytes starting at address 0x%X...\n" % (size, address)
+				else:
+					print "Reading all bytes starting at address 0x%X...\n" % (address)
+
+				flash.StartTimer()
+				open(ACTIONS['read'], "wb").write(flash.ReadChip(address, size))
+				t = flash.StopTimer()
+				print "\n"
+
+			if t:
+				print "Operation completed in", t, "seconds."
+	finally:
+		flash.Close()
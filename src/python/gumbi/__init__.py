@@ -1,6 +1,22 @@
 from gumbi import *
+from progress import *
+from metrics import *
+from trace import *
+from replay import *
+from emulator import *
+from benchmark import *
+from image import *
+from transforms import *
+from confcache import *
 from configuration import *
+from chipdb import *
 from gpio import *
 from parallel import *
+from spi import *
+from jtag import *
 from monitor import *
+from board import *
+from daemon import *
+from scheduler import *
 from debug import *
+from decoders import *
@@ -0,0 +1,337 @@
+import time
+import json
+from gumbi import Gumbi
+from metrics import Percentile
+from configuration import Configuration
+from debug import SpeedTest, TransferTest
+from parallel import Parallel
+from gpio import GPIO
+from monitor import Monitor
+from emulator import Emulator
+
+class Benchmark:
+	"""
+	Benchmark suite for the host stack. Each benchmark is run a number of times, and the results are
+	summarized as percentiles of the time per iteration, along with the median throughput. Example:
+
+		bench = Benchmark(iterations=10, emulate=True)
+		results = bench.Run()
+		regressions = bench.Compare(results, bench.Load("baseline.json"))
+
+	Benchmarks may be run against a Gumbi board or against the Emulator. The parallel benchmarks
+	read and write the target chip, so they are only run on a Gumbi board if a configuration is given.
+	"""
+
+	VERSION = 1
+	SUITES = ["rx", "roundtrip", "parallel", "gpio", "monitor", "config"]
+	RX_SIZES = [4096, 65536, 1048576]
+	ROUNDTRIP_SIZES = [128, 4096, 65536]
+	PARALLEL_READ_SIZE = 65536
+	PARALLEL_WRITE_SIZE = 1024
+	GPIO_OPS = 64
+	MONITOR_SAMPLES = 10000
+	CONFIG_OPS = 100
+
+	# Parallel configuration used with the Emulator
+	EMULATOR_CONFIG = {
+		"ADDRESS"	: range(1, 21),
+		"DATA"		: range(21, 29),
+		"CE"		: [29, 0],
+		"OE"		: [30, 0],
+		"WE"		: [31, 0]
+	}
+
+	def __init__(self, iterations=10, port=None, config=None, emulate=False):
+		"""
+		Class constructor.
+
+		@iterations - Number of times to run each benchmark.
+		@port       - Gumbi board serial port.
+		@config     - Parallel configuration file for the parallel benchmarks.
+		@emulate    - Set to True to run the benchmarks against the Emulator instead of a Gumbi board.
+
+		Returns None.
+		"""
+		self.iterations = iterations
+		self.port = port
+		self.config = config
+		self.emulate = emulate
+
+		if emulate and config is None:
+			self.config = self.EMULATOR_CONFIG
+
+	def Measure(self, name, func, size, unit="B", setup=None):
+		"""
+		Runs and times a benchmark.
+
+		@name  - Benchmark name.
+		@func  - Function to time.
+		@size  - Number of units processed by each call to func.
+		@unit  - Unit name: "B" for bytes, or any other name for operations.
+		@setup - Optional function to call (untimed) before each call to func.
+
+		Returns a dict summarizing the results:
+
+			{
+				"name", "unit", "size", "iterations",
+				"min", "max", "mean", "p50", "p90", "p99"	(seconds per iteration)
+				"rate"						(units per second, at the median)
+			}
+		"""
+		samples = []
+
+		for i in range(0, self.iterations):
+			if setup is not None:
+				setup()
+			t = time.time()
+			func()
+			samples.append(time.time() - t)
+
+		samples.sort()
+		p50 = Percentile(samples, 50)
+
+		rate = 0
+		if p50 > 0:
+			rate = size / p50
+
+		return {
+			"name"		: name,
+			"unit"		: unit,
+			"size"		: size,
+			"iterations"	: len(samples),
+			"min"		: samples[0],
+			"max"		: samples[-1],
+			"mean"		: sum(samples) / len(samples),
+			"p50"		: p50,
+			"p90"		: Percentile(samples, 90),
+			"p99"		: Percentile(samples, 99),
+			"rate"		: rate
+		}
+
+	def _rx(self):
+		"""
+		Raw Gumbi board to host throughput (SPEEDTEST mode). For internal use only.
+		"""
+		results = []
+
+		for size in self.RX_SIZES:
+			s = SpeedTest(size, port=self.port)
+			# The constructor enters SPEEDTEST mode for the first iteration; subsequent iterations need to re-enter it
+			state = {"first" : True}
+
+			def setup():
+				if not state["first"]:
+					s.SetMode(s.SPEEDTEST)
+				state["first"] = False
+
+			def run():
+				s.Go()
+				if not s.Validate():
+					raise Exception("Speed test data is invalid")
+
+			results.append(self.Measure("rx.%d" % size, run, size, setup=setup))
+			s.Close()
+
+		return results
+
+	def _roundtrip(self):
+		"""
+		Host to Gumbi board to host throughput (XFER mode), for each of the ROUNDTRIP_SIZES. For internal use only.
+		"""
+		results = []
+		t = TransferTest(port=self.port)
+
+		for size in self.ROUNDTRIP_SIZES:
+			t.size = size
+
+			def run():
+				t.Go()
+				if not t.Validate():
+					raise Exception("Transfer test data is invalid")
+
+			results.append(self.Measure("roundtrip.%d" % size, run, size))
+
+		t.Close()
+		return results
+
+	def _parallel(self):
+		"""
+		Parallel mode Read and Write throughput. For internal use only.
+		"""
+		if self.config is None:
+			return []
+
+		p = Parallel(config=self.config, port=self.port)
+		data = "\x55" * self.PARALLEL_WRITE_SIZE
+
+		results = [
+			self.Measure("parallel.read", lambda: p.Read(0, self.PARALLEL_READ_SIZE), self.PARALLEL_READ_SIZE),
+			self.Measure("parallel.write", lambda: p.Write(0, data), self.PARALLEL_WRITE_SIZE)
+		]
+
+		p.Close()
+		return results
+
+	def _gpio(self):
+		"""
+		GPIO operations per second. For internal use only.
+		"""
+		io = GPIO(port=self.port)
+		pins = range(1, self.GPIO_OPS + 1)
+		state = {"high" : True}
+
+		def pin_ops():
+			for pin in pins:
+				io.PinHigh(pin)
+
+		def buffered_ops():
+			io.SetPins(high=pins[0::2], low=pins[1::2])
+			io.Flush()
+
+		def write_all():
+			state["high"] = not state["high"]
+			if state["high"]:
+				io.WriteAll(0x5555555555555555)
+			else:
+				io.WriteAll(0xAAAAAAAAAAAAAAAA)
+
+		results = [
+			self.Measure("gpio.pin", pin_ops, self.GPIO_OPS, unit="ops"),
+			self.Measure("gpio.buffered", buffered_ops, self.GPIO_OPS, unit="ops"),
+			self.Measure("gpio.writeall", write_all, 1, unit="ops"),
+			self.Measure("gpio.readall", io.ReadAll, 1, unit="ops")
+		]
+
+		io.Close()
+		return results
+
+	def _monitor(self):
+		"""
+		Monitor mode samples per second. For internal use only.
+		"""
+		m = Monitor(port=self.port)
+		result = self.Measure("monitor.capture", lambda: m.Capture(self.MONITOR_SAMPLES), self.MONITOR_SAMPLES, unit="samples")
+		m.Close()
+		return [result]
+
+	def _config(self):
+		"""
+		Configuration parsing and packing costs. These don't talk to the Gumbi board. For internal use only.
+		"""
+		config = self.config
+		if config is None:
+			config = self.EMULATOR_CONFIG
+
+		def parse():
+			for i in range(0, self.CONFIG_OPS):
+				Configuration(config, Parallel.MODE, num_pins=Gumbi.MAX_PINS)
+
+		c = Configuration(config, Parallel.MODE, num_pins=Gumbi.MAX_PINS)
+
+		def pack():
+			for i in range(0, self.CONFIG_OPS):
+				c.Pack(Gumbi.READ, i, 0x100)
+
+		return [
+			self.Measure("config.parse", parse, self.CONFIG_OPS, unit="ops"),
+			self.Measure("config.pack", pack, self.CONFIG_OPS, unit="ops")
+		]
+
+	def Run(self, suites=None):
+		"""
+		Runs the specified benchmark suites.
+
+		@suites - A list of suite names (see SUITES). If not specified, all suites are run.
+
+		Returns a dict of results:
+
+			{
+				"version", "timestamp", "transport", "iterations",
+				"results" : { benchmark name : results dict (see Measure) }
+			}
+		"""
+		if suites is None:
+			suites = self.SUITES
+
+		results = {
+			"version"	: self.VERSION,
+			"timestamp"	: time.time(),
+			"transport"	: "emulator" if self.emulate else (self.port or Gumbi.SERIAL_PORT),
+			"iterations"	: self.iterations,
+			"results"	: {}
+		}
+
+		transport = Gumbi.TRANSPORT
+		if self.emulate:
+			Gumbi.TRANSPORT = Emulator()
+
+		try:
+			for suite in suites:
+				if suite not in self.SUITES:
+					raise Exception("Unknown benchmark suite: %s" % suite)
+
+				for result in getattr(self, "_" + suite)():
+					results["results"][result["name"]] = result
+		finally:
+			Gumbi.TRANSPORT = transport
+
+		return results
+
+	def Compare(self, results, baseline, threshold=0.1):
+		"""
+		Compares benchmark results against a baseline.
+
+		@results   - Results returned by Run().
+		@baseline  - Baseline results, as returned by Run() or Load().
+		@threshold - Fractional drop in throughput that is considered a regression.
+
+		Returns a list of (name, baseline rate, current rate, fractional change) tuples for each regression.
+		"""
+		regressions = []
+
+		for (name, result) in sorted(results["results"].items()):
+			if not baseline["results"].has_key(name):
+				continue
+
+			base = baseline["results"][name]["rate"]
+			if base <= 0:
+				continue
+
+			change = (result["rate"] - base) / float(base)
+			if change < -threshold:
+				regressions.append((name, base, result["rate"], change))
+
+		return regressions
+
+	def Save(self, results, path):
+		"""
+		Saves results to a JSON file.
+
+		Returns None.
+		"""
+		fp = open(path, "w")
+		json.dump(results, fp, indent=4, sort_keys=True)
+		fp.close()
+
+	def Load(self, path):
+		"""
+		Loads results from a JSON file.
+
+		Returns a results dict.
+		"""
+		return json.load(open(path))
+
+	def Report(self, results):
+		"""
+		Returns a list of human readable lines describing the results.
+		"""
+		lines = ["%-20s %10s %10s %10s %10s %16s" % ("Benchmark", "p50 (ms)", "p90 (ms)", "p99 (ms)", "Max (ms)", "Throughput")]
+
+		for (name, r) in sorted(results["results"].items()):
+			if r["unit"] == "B":
+				rate = "%.3f MB/s" % (r["rate"] / 1000000.0)
+			else:
+				rate = "%.1f %s/s" % (r["rate"], r["unit"])
+			lines.append("%-20s %10.3f %10.3f %10.3f %10.3f %16s" % (name, r["p50"] * 1000, r["p90"] * 1000, r["p99"] * 1000, r["max"] * 1000, rate))
+
+		return lines
@@ -0,0 +1,386 @@
+import time
+import heapq
+import threading
+from gumbi import Gumbi
+from gpio import GPIO
+
+class SharedPort(object):
+	"""
+	Serial port wrapper that lets mode instances (Parallel, GPIO, etc) share a Board's connection.
+	Closing a SharedPort does nothing; the connection is closed by Board.Close().
+	"""
+
+	def __init__(self, serial):
+		"""
+		Class constructor.
+
+		@serial - The open serial port to share.
+
+		Returns None.
+		"""
+		self.serial = serial
+
+	def read(self, n=1):
+		return self.serial.read(n)
+
+	def readline(self):
+		return self.serial.readline()
+
+	def write(self, data):
+		return self.serial.write(data)
+
+	def flushInput(self):
+		return self.serial.flushInput()
+
+	def flushOutput(self):
+		return self.serial.flushOutput()
+
+	def close(self):
+		return None
+
+	def _get_timeout(self):
+		return getattr(self.serial, "timeout", None)
+
+	def _set_timeout(self, timeout):
+		if hasattr(self.serial, "timeout"):
+			self.serial.timeout = timeout
+
+	# Read timeout of the shared port, if it has one; mode instances adjust it for each action
+	timeout = property(_get_timeout, _set_timeout)
+
+class Request:
+	"""
+	A command queued on a Board. Returned by Board.Submit; call Wait() to get the result.
+	"""
+
+	def __init__(self, mode, func, config=None, voltage=None, priority=0, ops=None):
+		"""
+		Class constructor.
+
+		@mode     - The mode class (Parallel, GPIO, SPI, etc) that func must be run in, or None to run func outside of any mode.
+		@func     - A function that is passed the mode instance, and returns the request's result.
+		@config   - Configuration file or dict for the mode instance (the pin count, for Monitor).
+		@voltage  - Target voltage for the mode instance.
+		@priority - Request priority; lower values are run first.
+		@ops      - For pin set requests, a list of (high, pin) tuples. See Board.SetPins.
+
+		Returns None.
+		"""
+		self.mode = mode
+		self.func = func
+		self.config = config
+		self.voltage = voltage
+		self.priority = priority
+		self.ops = ops
+		self.submitted = time.time()
+		self.result = None
+		self.error = None
+		self.event = threading.Event()
+
+	def Name(self):
+		"""
+		Returns the name of the request's mode.
+		"""
+		if self.mode is None:
+			return "None"
+		return self.mode.__name__
+
+	def Done(self):
+		"""
+		Returns True if the request has completed.
+		"""
+		return self.event.isSet()
+
+	def Wait(self, timeout=None):
+		"""
+		Waits for the request to complete.
+
+		@timeout - Maximum number of seconds to wait. If None, waits indefinitely.
+
+		Returns the request's result. Raises the request's exception if it failed.
+		"""
+		self.event.wait(timeout)
+		if not self.event.isSet():
+			raise Exception("Timed out waiting for %s request" % self.Name())
+		if self.error is not None:
+			raise self.error
+		return self.result
+
+class Board:
+	"""
+	Thread safe handle to a Gumbi board, for sharing one board between several threads. Example:
+
+		board = Board()
+
+		# Fixture thread
+		board.SetPins(high=[1], low=[2])
+
+		# Programming thread
+		data = board.Run(Parallel, lambda p: p.Read(0, 0x1000), config="chip.conf")
+
+		board.Close()
+
+	All communication with the Gumbi board is done by a single worker thread, which runs queued
+	requests one at a time, so requests from different threads are never interleaved on the wire.
+	Requests are run in priority order (lower values first), and in the order they were submitted
+	within a priority.
+
+	Each request names the mode class it must be run in. The worker keeps the current mode instance
+	open between requests, and only exits it and enters another mode when a request needs a different
+	mode class, configuration or voltage. Requests with no mode class are run with the Board's base
+	Gumbi instance, after exiting the current mode.
+
+	Consecutive pin set requests (SetPins) for the same GPIO configuration are merged, and sent to the
+	Gumbi board as buffered GPIO batches.
+	"""
+
+	HIGH = 0
+	NORMAL = 10
+	LOW = 20
+
+	# Maximum number of pin set requests that are merged together
+	MAX_MERGE = 32
+
+	def __init__(self, port=None):
+		"""
+		Class constructor, opens a connection to the Gumbi board and starts the worker thread.
+
+		@port - Gumbi board serial port.
+
+		Returns None.
+		"""
+		self.link = Gumbi(port=port)
+		self.port = SharedPort(self.link.serial)
+		self.session = None
+		self.key = None
+		self.queue = []
+		self.seq = 0
+		self.closing = False
+		self.cond = threading.Condition()
+
+		self.worker = threading.Thread(target=self._worker, name="gumbi-board")
+		self.worker.daemon = True
+		self.worker.start()
+
+	def _key(self, request):
+		"""
+		Returns the mode key for a request; requests with the same key share a mode instance. For internal use only.
+		"""
+		return (request.mode, request.config, request.voltage)
+
+	def _enqueue(self, request):
+		"""
+		Adds a request to the queue. For internal use only.
+		"""
+		self.cond.acquire()
+		try:
+			if self.closing:
+				raise Exception("Board is closed")
+			heapq.heappush(self.queue, (request.priority, self.seq, request))
+			self.seq += 1
+			self.cond.notify()
+		finally:
+			self.cond.release()
+
+		return request
+
+	def _next(self):
+		"""
+		Waits for the next request, and merges any pin set requests that immediately follow it. For internal use only.
+
+		Returns a list of requests, or None if the Board is closed and the queue is empty.
+		"""
+		self.cond.acquire()
+		try:
+			while not self.queue and not self.closing:
+				self.cond.wait()
+
+			if not self.queue:
+				return None
+
+			batch = [heapq.heappop(self.queue)[2]]
+
+			if batch[0].ops is not None:
+				key = self._key(batch[0])
+				while self.queue and len(batch) < self.MAX_MERGE:
+					request = self.queue[0][2]
+					if request.ops is None or self._key(request) != key:
+						break
+					batch.append(heapq.heappop(self.queue)[2])
+
+			return batch
+		finally:
+			self.cond.release()
+
+	def _close_session(self):
+		"""
+		Exits the current mode. For internal use only.
+		"""
+		session = self.session
+		self.session = None
+		self.key = None
+
+		if session is not None:
+			session.Close()
+
+	def _session(self, request):
+		"""
+		Returns the mode instance for a request, switching modes if necessary. For internal use only.
+		"""
+		key = self._key(request)
+
+		if request.mode is None:
+			self._close_session()
+			return self.link
+
+		if self.session is None or self.key != key:
+			self._close_session()
+			Gumbi.STATS.Count("board_transitions", mode=request.Name())
+			# Mode classes all take (config, voltage, port) as their first arguments (Monitor takes a pin count in place of config)
+			self.session = request.mode(request.config, request.voltage, self.port)
+			self.key = key
+
+		return self.session
+
+	def _run(self, batch):
+		"""
+		Runs a request, or a batch of merged pin set requests. For internal use only.
+		"""
+		now = time.time()
+		for request in batch:
+			Gumbi.STATS.Time("board_wait", now - request.submitted, mode=request.Name())
+
+		try:
+			session = self._session(batch[0])
+
+			if batch[0].ops is not None:
+				Gumbi.STATS.Count("board_merged", len(batch) - 1)
+				with session.Buffered():
+					for request in batch:
+						for (high, pin) in request.ops:
+							if high:
+								session.PinHigh(pin)
+							else:
+								session.PinLow(pin)
+			else:
+				batch[0].result = batch[0].func(session)
+		except Exception, e:
+			for request in batch:
+				request.error = e
+
+			# The Gumbi board may be part way through a command, so leave the mode and reset the
+			# board before running anything else
+			try:
+				self._close_session()
+			except Exception:
+				pass
+
+			try:
+				self.link.Reset()
+			except Exception:
+				pass
+
+		for request in batch:
+			request.event.set()
+
+	def _worker(self):
+		"""
+		Worker thread main loop. For internal use only.
+		"""
+		while True:
+			batch = self._next()
+			if batch is None:
+				break
+			self._run(batch)
+
+		try:
+			self._close_session()
+		finally:
+			self.link.Close()
+
+	def Submit(self, mode, func, config=None, voltage=None, priority=NORMAL):
+		"""
+		Queues a function to be run in the specified mode.
+
+		@mode     - The mode class to run func in (Parallel, GPIO, SPI, JTAG, etc), or None.
+		@func     - A function that takes the mode instance as its only argument. It is run in the worker thread.
+		@config   - Configuration file or dict for the mode.
+		@voltage  - Target voltage.
+		@priority - Request priority (HIGH, NORMAL, LOW or any integer); lower values are run first.
+
+		Returns a Request instance.
+		"""
+		return self._enqueue(Request(mode, func, config, voltage, priority))
+
+	def Run(self, mode, func, config=None, voltage=None, priority=NORMAL, timeout=None):
+		"""
+		Runs a function in the specified mode and waits for it to complete. See Submit.
+
+		@timeout - Maximum number of seconds to wait.
+
+		Returns the function's return value.
+		"""
+		return self.Submit(mode, func, config, voltage, priority).Wait(timeout)
+
+	def SetPins(self, high=[], low=[], config=None, priority=NORMAL, wait=True, voltage=None):
+		"""
+		Sets GPIO pins high and low. The high pins are set first, then the low pins.
+		Consecutive SetPins requests are merged and sent to the Gumbi board together.
+
+		@high     - A list of pins to set high.
+		@low      - A list of pins to set low.
+		@config   - GPIO configuration file or dict.
+		@priority - Request priority.
+		@wait     - Set to False to return without waiting for the pins to be set.
+		@voltage  - Target voltage.
+
+		Returns the Request instance.
+		"""
+		ops = [(True, pin) for pin in high] + [(False, pin) for pin in low]
+		request = self._enqueue(Request(GPIO, None, config, voltage, priority, ops))
+		if wait:
+			request.Wait()
+		return request
+
+	def PinHigh(self, pin, config=None, priority=NORMAL, wait=True):
+		"""
+		Sets the specified pin high. See SetPins.
+
+		Returns the Request instance.
+		"""
+		return self.SetPins(high=[pin], config=config, priority=priority, wait=wait)
+
+	def PinLow(self, pin, config=None, priority=NORMAL, wait=True):
+		"""
+		Sets the specified pin low. See SetPins.
+
+		Returns the Request instance.
+		"""
+		return self.SetPins(low=[pin], config=config, priority=priority, wait=wait)
+
+	def ReadPins(self, pins, config=None, priority=NORMAL):
+		"""
+		Reads the values of the specified pins.
+
+		Returns a list of values for each pin (1 == high, 0 == low).
+		"""
+		return self.Run(GPIO, lambda io: io.ReadPins(pins), config, None, priority)
+
+	def PinCount(self, priority=NORMAL):
+		"""
+		Returns the number of available I/O pins on the Gumbi board. This exits the current mode.
+		"""
+		return self.Run(None, lambda g: g.PinCount(), priority=priority)
+
+	def Close(self):
+		"""
+		Runs all queued requests, exits the current mode and closes the connection with the Gumbi board.
+
+		Returns None.
+		"""
+		self.cond.acquire()
+		self.closing = True
+		self.cond.notify()
+		self.cond.release()
+
+		self.worker.join()
@@ -0,0 +1,259 @@
+import os
+import json
+import hashlib
+from gumbi import Gumbi
+from configuration import Configuration
+
+class ChipDB:
+	"""
+	Index of the chip configuration files in a directory. Example:
+
+		db = ChipDB("bin/config/")
+		for name in db.Identify(0xC2, 0xA7):
+			print name, db.Get(name)["size"]
+
+	The index is saved to disk and refreshed incrementally: only configuration files that have been
+	added, removed or modified (including any files they INCLUDE) since the last refresh are parsed.
+	Chips are looked up by name, or by the vendor and product IDs listed in their configuration file:
+
+		VENDORID	The vendor ID returned by the chip.
+		PRODUCTID	A list of product IDs returned by the chip.
+
+	The index is stored in the Configuration.CACHE directory. If it can't be written, the index
+	is kept in memory only.
+	"""
+
+	VERSION = 2
+	CONF_EXT = ".conf"
+	VENDOR_KEY = "VENDORID"
+	PRODUCT_KEY = "PRODUCTID"
+
+	# Settings that determine how a chip is identified; chips with the same probe settings can be identified with the same configuration
+	PROBE_KEYS = ["MODE", "PINS", "VOLTAGE", "ID", "ADDRESS", "DATA", "VCC", "GND"] + Configuration.CONTROL_PINS
+	# Settings that determine how a chip is powered; it is only safe to probe a chip with a configuration that has the same power settings
+	POWER_KEYS = ["MODE", "PINS", "VOLTAGE", "VCC", "GND"]
+
+	def __init__(self, path, index=None):
+		"""
+		Class constructor.
+
+		@path  - Path to the chip configuration file directory.
+		@index - Path to the index file. Defaults to a file in the Configuration.CACHE directory.
+
+		Returns None.
+		"""
+		self.path = os.path.abspath(path)
+
+		if index is None and Configuration.CACHE.path:
+			index = os.path.join(Configuration.CACHE.path, "chipdb-%s.json" % hashlib.sha1(self.path).hexdigest())
+
+		self.index = index
+		self.chips = {}
+		self.ids = {}
+
+		self._load()
+		self.Refresh()
+
+	def _load(self):
+		"""
+		Loads the saved index. For internal use only.
+		"""
+		if not self.index:
+			return
+
+		try:
+			data = json.load(open(self.index))
+			if data["version"] == self.VERSION and data["path"] == self.path:
+				self.chips = data["chips"]
+		except Exception:
+			self.chips = {}
+
+	def _save(self):
+		"""
+		Saves the index. For internal use only.
+		"""
+		if not self.index:
+			return
+
+		data = {
+			"version"	: self.VERSION,
+			"path"		: self.path,
+			"chips"		: self.chips
+		}
+
+		tmp = "%s.%d.tmp" % (self.index, os.getpid())
+
+		try:
+			dirname = os.path.dirname(self.index)
+			if dirname and not os.path.isdir(dirname):
+				os.makedirs(dirname)
+			fp = open(tmp, "w")
+			json.dump(data, fp, indent=4, sort_keys=True)
+			fp.close()
+			os.rename(tmp, self.index)
+		except (IOError, OSError):
+			try:
+				os.unlink(tmp)
+			except OSError:
+				pass
+
+	def _stale(self, entry):
+		"""
+		Returns True if any of the files that an index entry was built from have changed. For internal use only.
+		"""
+		for (path, mtime, size) in entry["files"]:
+			try:
+				st = os.stat(path)
+			except OSError:
+				return True
+			if (st.st_mtime, st.st_size) != (mtime, size):
+				return True
+		return False
+
+	def _first(self, value, default=None):
+		"""
+		Returns the first value of a setting, or default if it is not set. For internal use only.
+		"""
+		if value is None:
+			return default
+		if type(value) == type(()):
+			if not value:
+				return default
+			return value[0]
+		return value
+
+	def _entry(self, name, path):
+		"""
+		Builds the index entry for a configuration file. For internal use only.
+		"""
+		compiled = Configuration.CACHE.Load(path)
+		data = compiled.Get("DATA", ())
+
+		products = compiled.Get(self.PRODUCT_KEY, ())
+		if type(products) != type(()):
+			products = ()
+
+		probe = []
+		for key in self.PROBE_KEYS:
+			probe.append("%s=%s" % (key, str(compiled.Get(key))))
+
+		power = []
+		for key in self.POWER_KEYS:
+			power.append("%s=%s" % (key, str(compiled.Get(key))))
+
+		return {
+			"name"		: name,
+			"file"		: path,
+			"files"		: [(f[0], f[1], f[2]) for f in compiled.files],
+			"mode"		: compiled.mode,
+			"size"		: self._first(compiled.Get("SIZE"), 0),
+			"vendor"	: self._first(compiled.Get(self.VENDOR_KEY)),
+			"products"	: list(products),
+			"width"		: (16 if len(data) > 8 else 8),
+			"pins"		: self._first(compiled.Get("PINS"), 0),
+			"voltage"	: self._first(compiled.Get("VOLTAGE")),
+			"toe"		: self._first(compiled.Get("TOE"), Gumbi.TOE_DEFAULT),
+			"tbp"		: self._first(compiled.Get("TBP"), Gumbi.TBP_DEFAULT),
+			"tsce"		: self._first(compiled.Get("TSCE")),
+			"probe"		: hashlib.sha1(';'.join(probe)).hexdigest(),
+			"power"		: hashlib.sha1(';'.join(power)).hexdigest()
+		}
+
+	def Refresh(self):
+		"""
+		Updates the index with any configuration files that have been added, removed or modified.
+
+		Returns the number of index entries that were updated.
+		"""
+		changed = 0
+		found = {}
+
+		for filename in os.listdir(self.path):
+			if filename.endswith(self.CONF_EXT):
+				found[filename[:-len(self.CONF_EXT)].upper()] = os.path.join(self.path, filename)
+
+		for name in self.chips.keys():
+			if not found.has_key(name):
+				del self.chips[name]
+				changed += 1
+
+		for (name, path) in found.iteritems():
+			entry = self.chips.get(name)
+			if entry is None or entry["file"] != path or self._stale(entry):
+				self.chips[name] = self._entry(name, path)
+				changed += 1
+
+		# Vendor/product ID lookup table
+		self.ids = {}
+		for name in sorted(self.chips.keys()):
+			entry = self.chips[name]
+			if entry["vendor"] is not None:
+				for product in entry["products"]:
+					self.ids.setdefault((entry["vendor"], product), []).append(name)
+
+		if changed:
+			self._save()
+
+		return changed
+
+	def Chips(self, mode=None):
+		"""
+		Returns a sorted list of chip names.
+
+		@mode - If specified, only chips with configuration files for this mode are listed.
+		"""
+		return sorted([name for (name, entry) in self.chips.iteritems() if mode is None or entry["mode"] == mode])
+
+	def Get(self, name):
+		"""
+		Returns the index entry for the named chip, or None if there is no such chip:
+
+			{
+				"name", "file", "mode", "size", "vendor", "products", "width",
+				"pins", "voltage", "toe", "tbp", "tsce", "probe", "power"
+			}
+		"""
+		return self.chips.get(name.upper())
+
+	def Path(self, name):
+		"""
+		Returns the path to the named chip's configuration file, or None if there is no such chip.
+		"""
+		entry = self.Get(name)
+		if entry is None:
+			return None
+		return entry["file"]
+
+	def Identify(self, vendor, product, mode=None, power=None):
+		"""
+		Looks up chips by vendor and product ID.
+
+		@vendor  - Vendor ID.
+		@product - Product ID.
+		@mode    - If specified, only chips with configuration files for this mode are returned.
+		@power   - If specified, only chips with these power settings (an index entry's "power" value) are returned.
+
+		Returns a sorted list of matching chip names.
+		"""
+		return [name for name in self.ids.get((vendor, product), []) if (mode is None or self.chips[name]["mode"] == mode) and (power is None or self.chips[name]["power"] == power)]
+
+	def Probes(self, mode=None, power=None):
+		"""
+		Groups the chips that have vendor and product IDs by the settings used to read their IDs.
+		The chips in a group can all be identified with any one of their configuration files.
+
+		@mode  - If specified, only chips with configuration files for this mode are included.
+		@power - If specified, only chips with these power settings (an index entry's "power" value) are included.
+
+		Returns a list of (configuration file, [chip names]) tuples, largest group first.
+		"""
+		groups = {}
+
+		for name in self.Chips(mode):
+			entry = self.chips[name]
+			if entry["vendor"] is not None and entry["products"] and (power is None or entry["power"] == power):
+				groups.setdefault(entry["probe"], []).append(name)
+
+		probes = [(self.chips[names[0]]["file"], names) for names in groups.values()]
+		probes.sort(key=lambda probe: (-len(probe[1]), probe[1][0]))
+		return probes
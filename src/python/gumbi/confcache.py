@@ -0,0 +1,377 @@
+import os
+import sys
+import marshal
+import hashlib
+import threading
+from collections import OrderedDict
+from gumbi import Gumbi
+
+def ParseConfigLine(line):
+	"""
+	Parses a configuration file line.
+
+	@line - A line from the configuration file.
+
+	Returns the (key, value) pair from the line. Numeric values are returned as a list of integers;
+	non-numeric single values are returned as an upper case string.
+	"""
+	key = value = None
+	line = line.split('#')[0]
+	if '=' in line:
+		(key, value) = line.split('=', 1)
+		key = key.strip().upper()
+		# Multple value delimiters are: ',', ';', ':'
+		value = value.strip().upper().replace(";", ",").replace(":", ",")
+		if ',' in value:
+			value = [_parse_int(v, v) for v in value.split(',')]
+		else:
+			i = _parse_int(value, None)
+			if i is not None:
+				value = [i]
+	return (key, value)
+
+def _parse_int(value, default):
+	"""
+	Converts a decimal or hexadecimal string to an integer. For internal use only.
+
+	Returns default if value is not a valid integer.
+	"""
+	try:
+		return int(value)
+	except ValueError:
+		try:
+			return int(value, 16)
+		except ValueError:
+			return default
+
+class CompiledConfig(object):
+	"""
+	Immutable, validated result of parsing a configuration file and all of the files it INCLUDEs.
+	Instances are created by ConfigCache.Load.
+	"""
+
+	__slots__ = ["path", "mode", "files", "settings"]
+
+	# Control pins, in the order that they appear in the configuration data structure
+	CONTROL_PINS = ["CE", "WE", "RE", "OE", "BE", "BY", "WP", "WI", "RI", "RST", "SCK", "MOSI", "MISO", "TCK", "TMS", "TDI", "TDO"]
+	# Settings that must be lists of pin numbers
+	PIN_LISTS = ["ADDRESS", "DATA", "VCC", "GND"]
+	# Settings that must be a single integer
+	INTEGERS = ["TOE", "TBP", "CMDELAY", "RECONFIGURE", "PINS", "VOLTAGE"]
+
+	def __init__(self, path, settings, files):
+		"""
+		Class constructor.
+
+		@path     - Absolute path to the configuration file.
+		@settings - Dict of parsed configuration settings.
+		@files    - List of (path, mtime, size, sha1) tuples for the configuration file and all included files.
+
+		Returns None.
+		"""
+		self._validate(path, settings)
+
+		frozen = {}
+		for (key, value) in settings.iteritems():
+			if type(value) == type([]):
+				value = tuple(value)
+			frozen[key] = value
+
+		mode = settings.get(Gumbi.MODE_KEY)
+		if mode is not None:
+			mode = str(mode)
+
+		object.__setattr__(self, "path", path)
+		object.__setattr__(self, "mode", mode)
+		object.__setattr__(self, "files", tuple(files))
+		object.__setattr__(self, "settings", frozen)
+
+	def __setattr__(self, name, value):
+		raise AttributeError("CompiledConfig objects are immutable")
+
+	def _validate(self, path, settings):
+		"""
+		Checks that pin and timing settings have valid values. For internal use only.
+		"""
+		for (key, value) in settings.iteritems():
+			if key in self.PIN_LISTS or key in self.INTEGERS:
+				numeric = (type(value) == type([]) and all([type(v) == type(0) for v in value]))
+			elif key in self.CONTROL_PINS:
+				numeric = (type(value) == type([]) and 0 < len(value) <= 2 and all([type(v) == type(0) for v in value]))
+			else:
+				continue
+
+			if not numeric:
+				raise Exception("Invalid value for %s in configuration file %s: %s" % (key, path, str(value)))
+			if key in self.PIN_LISTS and len(value) > Gumbi.MAX_PINS:
+				raise Exception("Too many %s pins in configuration file %s: %d (max %d)" % (key, path, len(value), Gumbi.MAX_PINS))
+
+	def Settings(self):
+		"""
+		Returns a new dict of the configuration settings. Setting values are returned as lists
+		(or strings), the same as Configuration.ParseConfigLine, and may be modified by the caller.
+		"""
+		settings = {}
+		for (key, value) in self.settings.iteritems():
+			if type(value) == type(()):
+				value = list(value)
+			settings[key] = value
+		return settings
+
+	def Get(self, key, default=None):
+		"""
+		Returns the value of the specified setting, or default if it is not set.
+		"""
+		return self.settings.get(key, default)
+
+class ConfigCache:
+	"""
+	Cache of compiled configuration files. Example:
+
+		cache = ConfigCache()
+		compiled = cache.Load("bin/config/MX29LV320.conf")
+
+	Compiled configurations are kept in an in-process LRU cache, and in an on-disk cache so that they
+	persist between processes. Cache entries are keyed by the absolute path of the configuration file,
+	and are invalidated when the configuration file or any of the files it INCLUDEs change. A file is
+	considered changed if its contents hash differently; files whose modification time and size are
+	unchanged are not re-read.
+
+	The on-disk cache is stored in the directory specified by the GUMBI_CACHE environment variable,
+	or ~/.gumbi/cache by default. If the cache directory can't be written, only the in-process cache is used.
+	"""
+
+	INCLUDE = "INCLUDE"
+	VERSION = 1
+	EXTENSION = ".cache"
+
+	def __init__(self, path=None, size=64):
+		"""
+		Class constructor.
+
+		@path - On-disk cache directory. Set to False to disable the on-disk cache.
+		@size - Maximum number of compiled configurations to keep in memory.
+
+		Returns None.
+		"""
+		if path is None:
+			path = os.environ.get("GUMBI_CACHE", os.path.join(os.path.expanduser("~"), ".gumbi", "cache"))
+
+		self.path = path
+		self.size = size
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def _stat(self, path):
+		"""
+		Returns the (mtime, size) of a file, or None if it doesn't exist. For internal use only.
+		"""
+		try:
+			st = os.stat(path)
+		except OSError:
+			return None
+		return (st.st_mtime, st.st_size)
+
+	def _hash(self, path):
+		"""
+		Returns the SHA1 hash of a file's contents. For internal use only.
+		"""
+		return hashlib.sha1(open(path, "rb").read()).hexdigest()
+
+	def _fresh(self, files):
+		"""
+		Checks if a list of (path, mtime, size, sha1) tuples still describes the files on disk. For internal use only.
+
+		Returns a (valid, files) tuple, where files is the updated list of tuples.
+		"""
+		updated = []
+
+		for (path, mtime, size, sha1) in files:
+			stat = self._stat(path)
+			if stat is None:
+				return (False, files)
+
+			if stat != (mtime, size):
+				# The file was touched or modified; only a change in content invalidates the entry
+				try:
+					if self._hash(path) != sha1:
+						return (False, files)
+				except IOError:
+					return (False, files)
+				(mtime, size) = stat
+
+			updated.append((path, mtime, size, sha1))
+
+		return (True, updated)
+
+	def _cache_file(self, path):
+		"""
+		Returns the path to the on-disk cache file for a configuration file. For internal use only.
+		"""
+		name = hashlib.sha1("%s:%s" % (sys.version, path)).hexdigest()
+		return os.path.join(self.path, name + self.EXTENSION)
+
+	def _load_disk(self, path):
+		"""
+		Loads a compiled configuration from the on-disk cache. For internal use only.
+
+		Returns a CompiledConfig instance, or None if there is no valid cache entry.
+		"""
+		if not self.path:
+			return None
+
+		cache_file = self._cache_file(path)
+
+		try:
+			data = marshal.loads(open(cache_file, "rb").read())
+			if data["version"] != self.VERSION or data["path"] != path:
+				return None
+		except Exception:
+			return None
+
+		(valid, files) = self._fresh(data["files"])
+		if not valid:
+			return None
+
+		compiled = CompiledConfig(path, data["settings"], files)
+
+		# Save the updated file modification times so that the files don't need to be re-hashed next time
+		if files != data["files"]:
+			self._save_disk(compiled)
+
+		return compiled
+
+	def _save_disk(self, compiled):
+		"""
+		Saves a compiled configuration to the on-disk cache. For internal use only.
+		"""
+		if not self.path:
+			return
+
+		data = {
+			"version"	: self.VERSION,
+			"path"		: compiled.path,
+			"files"		: list(compiled.files),
+			"settings"	: compiled.Settings()
+		}
+
+		cache_file = self._cache_file(compiled.path)
+		tmp = "%s.%d.tmp" % (cache_file, os.getpid())
+
+		try:
+			if not os.path.isdir(self.path):
+				os.makedirs(self.path)
+			fp = open(tmp, "wb")
+			fp.write(marshal.dumps(data))
+			fp.close()
+			# Atomically replace the old cache file, so that concurrent readers never see a partial file
+			os.rename(tmp, cache_file)
+		except (IOError, OSError):
+			try:
+				os.unlink(tmp)
+			except OSError:
+				pass
+
+	def _compile(self, path, settings, files, chain):
+		"""
+		Parses a configuration file and any files it includes into settings. For internal use only.
+
+		@path     - Absolute path to the configuration file.
+		@settings - Dict to store the parsed settings in.
+		@files    - List to append (path, mtime, size, sha1) tuples to.
+		@chain    - List of files currently being parsed, used to detect INCLUDE loops.
+
+		Returns None.
+		"""
+		if path in chain:
+			raise Exception("Configuration file %s includes itself" % path)
+
+		stat = self._stat(path)
+		if stat is None:
+			raise Exception("Configuration file %s does not exist" % path)
+
+		data = open(path, "rb").read()
+		files.append((path, stat[0], stat[1], hashlib.sha1(data).hexdigest()))
+
+		for line in data.splitlines():
+			(key, value) = ParseConfigLine(line)
+			if key is not None and value is not None:
+				if key == self.INCLUDE:
+					# Included files are in the same directory, with the same file extension. The file name is
+					# taken from the line itself, since ParseConfigLine upper cases values and converts numbers to integers.
+					name = line.split('#')[0].split('=', 1)[1].strip()
+					filename = "%s%s" % (name, os.path.splitext(path)[1])
+					self._compile(os.path.join(os.path.dirname(path), filename), settings, files, chain + [path])
+				else:
+					settings[key] = value
+
+	def Compile(self, path):
+		"""
+		Parses a configuration file, bypassing the cache.
+
+		@path - Path to the configuration file.
+
+		Returns a CompiledConfig instance.
+		"""
+		path = os.path.abspath(path)
+		settings = {}
+		files = []
+		self._compile(path, settings, files, [])
+		return CompiledConfig(path, settings, files)
+
+	def Load(self, path):
+		"""
+		Loads a compiled configuration file, from the cache if possible.
+
+		@path - Path to the configuration file.
+
+		Returns a CompiledConfig instance.
+		"""
+		path = os.path.abspath(path)
+
+		self.lock.acquire()
+		try:
+			compiled = self.entries.pop(path, None)
+		finally:
+			self.lock.release()
+
+		if compiled is not None:
+			(valid, files) = self._fresh(compiled.files)
+			if not valid:
+				compiled = None
+			elif files != list(compiled.files):
+				compiled = CompiledConfig(path, compiled.Settings(), files)
+
+		if compiled is not None:
+			self.hits += 1
+		else:
+			compiled = self._load_disk(path)
+			if compiled is not None:
+				self.hits += 1
+			else:
+				self.misses += 1
+				compiled = self.Compile(path)
+				self._save_disk(compiled)
+
+		self.lock.acquire()
+		try:
+			# Most recently used entries are at the end
+			self.entries[path] = compiled
+			while len(self.entries) > self.size:
+				self.entries.popitem(last=False)
+		finally:
+			self.lock.release()
+
+		return compiled
+
+	def Clear(self):
+		"""
+		Clears the in-process cache. The on-disk cache is not modified.
+
+		Returns None.
+		"""
+		self.lock.acquire()
+		self.entries.clear()
+		self.lock.release()
@@ -1,5 +1,136 @@
-import os
+import struct
 from gumbi import Gumbi
+from confcache import ConfigCache, CompiledConfig, ParseConfigLine
+
+class ConfigSnapshot(object):
+	"""
+	An immutable version of a Configuration's settings, with the physical Gumbi board pin numbers
+	and the configuration data structure precomputed. Changing a setting creates a new snapshot,
+	so a snapshot can be safely shared between threads.
+	"""
+
+	__slots__ = ["settings", "num_pins", "package_pins", "pins", "body"]
+
+	PIN_LISTS = ["ADDRESS", "DATA", "VCC", "GND"]
+	CONTROL_PINS = CompiledConfig.CONTROL_PINS
+
+	# Action, start address and count; the rest of the configuration data structure is precomputed
+	PACK_ACTION = "<BII"
+	PACK_SETTINGS = "<BBBBHHHHB"
+
+	def __init__(self, settings, num_pins):
+		"""
+		Class constructor.
+
+		@settings - Dict of configuration settings. Values are frozen, so the dict may be modified by the caller afterwards.
+		@num_pins - The number of available pins on the Gumbi board.
+
+		Returns None.
+		"""
+		frozen = {}
+		for (key, value) in settings.iteritems():
+			if type(value) == type([]):
+				value = tuple(value)
+			frozen[key] = value
+
+		package_pins = 0
+		if frozen.get("PINS"):
+			package_pins = frozen["PINS"][0]
+
+		object.__setattr__(self, "settings", frozen)
+		object.__setattr__(self, "num_pins", num_pins)
+		object.__setattr__(self, "package_pins", package_pins)
+
+		pins = {}
+		for key in self.PIN_LISTS:
+			pins[key] = tuple([self._pin2real(pin) for pin in frozen[key]])
+		for key in self.CONTROL_PINS:
+			pins[key] = self._convert_control_pin(frozen[key])
+
+		object.__setattr__(self, "pins", pins)
+		object.__setattr__(self, "body", self._pack())
+
+	def __setattr__(self, name, value):
+		raise AttributeError("ConfigSnapshot objects are immutable")
+
+	def _pin2real(self, pin):
+		"""
+		Converts the pin number in the config file to the physical Gumbi pin number.
+		For internal use only.
+		"""
+		if pin != Gumbi.UNUSED:
+
+			# If the number of pins in the target package was specified in the config file,
+			# then treat the pin numbers as relative to the package type.
+			if self.num_pins > 0 and self.package_pins > 0 and pin > (self.package_pins / 2):
+				pin += (self.num_pins - self.package_pins)
+
+			# User supplied pin numbers are index 1, Gumbi board pin numbers are index 0
+			if pin is not None and pin > 0:
+				pin -= 1
+
+		return pin
+
+	def _convert_control_pin(self, cp):
+		"""
+		Converts a control pin setting to a (pin, active state) tuple. For internal use only.
+		"""
+		cpc = (Gumbi.UNUSED, 0)
+		if cp is not None and len(cp) > 0:
+			if len(cp) == 1:
+				cpc = (self._pin2real(cp[0]), 0)
+			else:
+				cpc = (self._pin2real(cp[0]), cp[1])
+		return cpc
+
+	def _pack(self):
+		"""
+		Packs everything in the configuration data structure after the action, start address and count.
+		For internal use only.
+		"""
+		commands = self.settings["COMMANDS"]
+
+		data = struct.pack(self.PACK_SETTINGS,
+				self.settings["TOE"][0],
+				self.settings["TBP"][0],
+				self.settings["CMDELAY"][0],
+				self.settings["RECONFIGURE"][0],
+				len(self.pins["ADDRESS"]),
+				len(self.pins["DATA"]),
+				len(self.pins["VCC"]),
+				len(self.pins["GND"]),
+				len(commands))
+
+		for key in self.PIN_LISTS:
+			pins = self.pins[key]
+			data += ''.join([chr(pin) for pin in pins]) + (Gumbi.NULL * (Gumbi.MAX_PINS - len(pins)))
+
+		data += struct.pack("<%dI" % len(commands), *commands) + (Gumbi.NULL * ((Gumbi.MAX_COMMANDS - len(commands)) * 4))
+
+		for key in self.CONTROL_PINS:
+			data += chr(self.pins[key][0]) + chr(self.pins[key][1])
+
+		return data
+
+	def Get(self, key):
+		"""
+		Returns the value of the specified setting, or None if it is not set.
+		"""
+		return self.settings.get(key)
+
+	def Set(self, key, value):
+		"""
+		Returns a new snapshot with the specified setting changed.
+		"""
+		settings = dict(self.settings)
+		settings[key] = value
+		return ConfigSnapshot(settings, self.num_pins)
+
+	def Pack(self, action, start, count):
+		"""
+		Returns the packed configuration data structure for the specified action.
+		"""
+		return struct.pack(self.PACK_ACTION, action, start, count) + self.body
 
 class Configuration(Gumbi):
 	"""
@@ -14,10 +145,10 @@ class Configuration(Gumbi):
 		# List of FOO pins
 		FOO=1,2,3,4
 
-	All data read from the configuration file will be stored in the CONFIG dictionary.
-	All values are stored in the CONFIG dict as lists.
+	All data read from the configuration file is stored in the instance's settings.
+	All numeric values are stored as lists.
 
-	There are some configuration values that are pre-defined in the CONFIG dict. These
+	There are some configuration values that are pre-defined in the DEFAULTS dict. These
 	values are used to generate the configuration data structure that is passed down
 	to the Gumbi board:
 
@@ -84,6 +215,25 @@ class Configuration(Gumbi):
 				active low, 1 is active high). This pin is deasserted
 				in parallel mode.
 
+		SCK		The serial clock pin. Used in SPI mode.			[255, 0]
+
+		MOSI		The serial data output pin (Master Out, Slave In).	[255, 0]
+				Used in SPI mode.
+
+		MISO		The serial data input pin (Master In, Slave Out).	[255, 0]
+				Used in SPI mode. The CE pin is used as the SPI chip
+				select.
+
+		TCK		The JTAG test clock pin. Used in JTAG mode.		[255, 0]
+
+		TMS		The JTAG test mode select pin. Used in JTAG mode.	[255, 0]
+
+		TDI		The JTAG test data input pin. Used in JTAG mode.	[255, 0]
+
+		TDO		The JTAG test data output pin. Used in JTAG mode.	[255, 0]
+				The RST pin, if defined, is used as TRST and is
+				deasserted in JTAG mode.
+
 		COMMANDS	A list of commands to be executed prior to a read	[]
 				or write opration. The commands will vary based on
 				the selected mode of operation.
@@ -108,15 +258,30 @@ class Configuration(Gumbi):
 				specified, the currently enabled voltage regulator will
 				be used.
 
-	Values in the CONFIG dict can also be viewed/modified using the GetSetting() and
-	SetSetting() methods.
+	Settings can also be viewed/modified using the GetSetting() and SetSetting() methods.
+	Each Configuration instance has its own settings, which are held in an immutable
+	ConfigSnapshot; modifying a setting replaces the snapshot rather than changing it,
+	so Configuration instances for different chips can be used from different threads.
+
+	Configuration files may include other configuration files in the same directory with
+	INCLUDE=<name> (the file extension is the same as the including file's). Parsed
+	configuration files are cached by CACHE; see ConfigCache.
 
 	If used, this class instance must be called prior to invoking Gumbi.SetMode().
 	"""
 
-	INCLUDE = "INCLUDE"
+	INCLUDE = ConfigCache.INCLUDE
 
-	CONFIG = {
+	# Control pins, in the order that they appear in the configuration data structure
+	CONTROL_PINS = CompiledConfig.CONTROL_PINS
+
+	# Compiled configuration file cache, shared by all instances
+	CACHE = ConfigCache()
+
+	# Fixed size header at the start of the configuration data structure
+	PACK_HEADER = "<BIIBBBBHHHHB"
+
+	DEFAULTS = {
 		"TOE"		: [Gumbi.TOE_DEFAULT],
 		"TBP"		: [Gumbi.TBP_DEFAULT],
 		"ADDRESS"	: [],
@@ -133,6 +298,13 @@ class Configuration(Gumbi):
 		"WI"		: [Gumbi.UNUSED, 0],
 		"RI"		: [Gumbi.UNUSED, 0],
 		"RST"		: [Gumbi.UNUSED, 0],
+		"SCK"		: [Gumbi.UNUSED, 0],
+		"MOSI"		: [Gumbi.UNUSED, 0],
+		"MISO"		: [Gumbi.UNUSED, 0],
+		"TCK"		: [Gumbi.UNUSED, 0],
+		"TMS"		: [Gumbi.UNUSED, 0],
+		"TDI"		: [Gumbi.UNUSED, 0],
+		"TDO"		: [Gumbi.UNUSED, 0],
 		"COMMANDS"	: [],
 		"CMDELAY"	: [0],
 		"RECONFIGURE"	: [0],
@@ -141,33 +313,41 @@ class Configuration(Gumbi):
 		"VOLTAGE"	: [None]
 	}
 	
-	def __init__(self, config, mode, port=None):
+	def __init__(self, config, mode, port=None, num_pins=0):
 		"""
 		Class initializer. Must be called BEFORE Gumbi.SetMode so that it can retrieve the current pin count from the Gumbi board.
 
-		@config - Path to the configuration file.
-		@mode   - The expected MODE value in the configuration file.
+		@config   - Path to the configuration file, or a dict of configuration settings.
+		@mode     - The expected MODE value in the configuration file.
+		@num_pins - The number of available pins on the Gumbi board. If specified, the
+			    configuration is parsed without opening a connection to the Gumbi board.
 
 		Returns None.
 		"""
 		self.config = config
 		self.cmode = mode
-		self.package_pins = 0
-		self.pins_shifted = False
+		self.snapshot = None
+		# Snapshots with each of the named command sets selected, see SetCommand
+		self.command_sets = {}
 		
-		Gumbi.__init__(self, port=port)
+		Gumbi.__init__(self, port=port, new=(not num_pins))
 
-		# Get the number of available pins on the Gumbi board
-		self.num_pins = self.PinCount()
+		if num_pins:
+			self.num_pins = num_pins
+			self._parse_config()
+		else:
+			# Get the number of available pins on the Gumbi board
+			self.num_pins = self.PinCount()
 
-		# Parse the configuration file/dict
-		self._parse_config()
+			# Parse the configuration file/dict
+			self._parse_config()
 
-		# If a voltage was specified in the config file, set it
-		if self.CONFIG["VOLTAGE"][0] is not None:
-			self.SetVoltage(self.CONFIG["VOLTAGE"][0])
+			# If a voltage was specified in the config file, set it
+			voltage = self.snapshot.Get("VOLTAGE")[0]
+			if voltage is not None:
+				self.SetVoltage(voltage)
 		
-		self.Close()
+			self.Close()
 		
 
 	def ParseConfigLine(self, line):
@@ -178,154 +358,48 @@ class Configuration(Gumbi):
 
 		Returns the (key, value) pair from the line.
 		"""
-		key = value = None
-		line = line.split('#')[0]
-		if '=' in line:
-			(key, value) = line.split('=', 1)
-			key = key.strip().upper()
-			# Multple value delimiters are: ',', ';', ':'
-			value = value.strip().upper().replace(";", ",").replace(":", ",")
-			if ',' in value:
-				value = value.split(',')
-				for i in range(0, len(value)):
-					try:
-						value[i] = int(value[i])
-					except:
-						try:
-							value[i] = int(value[i], 16)
-						except:
-							pass
-			else:
-				try:
-					value = [int(value)]
-				except:
-					try:
-						value = [int(value, 16)]
-					except:
-						pass
-		return (key, value)
+		return ParseConfigLine(line)
 
-	def _pin2real(self, pin):
+	def _parse_config(self):
 		"""
-		Converts the pin number in the config file to the physical Gumbi pin number.
-		For internal use only.
+		If the specified config value is a dict, populate the settings with the contents of the config dict.
+		Else, call _parse_config_file to treat config as a path to a configuration file.
 		"""
-		if pin != self.UNUSED:
-
-			# If the number of pins in the target package was specified in the config file,
-			# then treat the pin numbers as relative to the package type.
-			if self.num_pins > 0 and self.package_pins > 0 and pin > (self.package_pins / 2):
-				pin += (self.num_pins - self.package_pins)
+		settings = dict(self.DEFAULTS)
 
-			pin = self.Pin2Real(pin)
-	
-		return pin
-		
-	def _shift_pins(self):
-		"""
-		Shifts all pin numbers to be the appropriate pin number on the Gumbi board.
-		For internal use only.
-		"""
-		if not self.pins_shifted:
-			self.CONFIG["ADDRESS"] = self._convert_pin_array(self.CONFIG["ADDRESS"])
-			self.CONFIG["DATA"] = self._convert_pin_array(self.CONFIG["DATA"])
-			self.CONFIG["VCC"] = self._convert_pin_array(self.CONFIG["VCC"])
-			self.CONFIG["GND"] = self._convert_pin_array(self.CONFIG["GND"])
-			self.CONFIG["CE"] = self._convert_control_pin(self.CONFIG["CE"])
-			self.CONFIG["WE"] = self._convert_control_pin(self.CONFIG["WE"])
-			self.CONFIG["RE"] = self._convert_control_pin(self.CONFIG["RE"])
-			self.CONFIG["OE"] = self._convert_control_pin(self.CONFIG["OE"])
-			self.CONFIG["BE"] = self._convert_control_pin(self.CONFIG["BE"])
-			self.CONFIG["BY"] = self._convert_control_pin(self.CONFIG["BY"])
-			self.CONFIG["WP"] = self._convert_control_pin(self.CONFIG["WP"])
-			self.CONFIG["RST"] = self._convert_control_pin(self.CONFIG["RST"])
-			self.pins_shifted = True
+		if type(self.config) == type({}):
+			for key,value in self.config.iteritems():
+				if type(value) not in (type([]), type(())):
+					settings[key] = [value]
+				else:
+					settings[key] = value
+		else:
+			settings.update(self._parse_config_file())
 
-	def _convert_control_pin(self, cp):
-		"""
-		Converts a control pin array to a valid pin offset on the Gumbi board.
-		For internal use only.
-		"""
-		cpc = (self.UNUSED, 0)
-		if cp is not None and len(cp) > 0:
-			if len(cp) == 1:
-				cpc = (self._pin2real(cp[0]), 0)
-			else:
-				cpc = (self._pin2real(cp[0]), cp[1])
-		return cpc
+		self.snapshot = ConfigSnapshot(settings, self.num_pins)
 
-	def _convert_pin_array(self, pins):
-		"""
-		Converts an array of pin numbers to valid pin numbers on the Gumbi board.
-		For internal use only.
+	def _parse_config_file(self):
 		"""
-		for i in range(0, len(pins)):
-			pins[i] = self._pin2real(pins[i])
-		return pins
+		Loads the specified configuration file, and any files it includes, from CACHE. For internal use only.
 
-	def _pack_pins(self, pins):
+		Returns a dict of settings.
 		"""
-		Packs an array of pins into a data structure. For internal use only.
-		"""
-		pd = self.PackBytes(pins)
-		pd += self.PackFiller(self.MAX_PINS - len(pins))
-		return pd
+		if self.config and self.config is not None:
+			compiled = self.CACHE.Load(self.config)
 
-	def _pack_commands(self, commands):
-		"""
-		Packs the CONFIG["COMMANDS"] values for transmission to the Gumbi board.
-		Returns the mode on success. Returns None on failure.
-		"""
-		pd = self.PackDWords(commands)
-		pd += self.PackFiller((self.MAX_COMMANDS * 4) - len(pd))
-		return pd
+			if compiled.mode is not None and compiled.mode != self.cmode:
+				raise Exception("Wrong mode specified in configuration file. Got '%s', expected '%s'." % (compiled.mode, self.cmode))
 
-	def _config_mode(self):
-		"""
-		Returns the mode specified in a configuration file. For internal use only.
-		"""
-		if self.config and self.config is not None:
-			for line in open(self.config).readlines():
-				(key, value) = self.ParseConfigLine(line)
-				if key == self.MODE_KEY:
-					return value
-		return None
+			return compiled.settings
 
-	def _parse_config(self):
-		"""
-		If the specified config value is a dict, populate self.CONFIG with the contents of the config dict.
-		Else, call _parse_config_file to treat config as a path to a configuration file.
-		"""
-		if type(self.config) == type({}):
-			for key,value in self.config.iteritems():
-				if type(value) != type([]):
-					self.CONFIG[key] = [value]
-				else:
-					 self.CONFIG[key] = value
-		else:
-			self._parse_config_file()
-		
-		if self.CONFIG.has_key("PINS"):
-			self.package_pins = self.CONFIG["PINS"][0]
+		return {}
 
-	def _parse_config_file(self):
+	def _set_snapshot(self, snapshot):
 		"""
-		Parses the specified configuration file. For internal use only.
+		Replaces the current settings snapshot. For internal use only.
 		"""
-		mode_name = self._config_mode()
-		if mode_name is not None and mode_name != self.cmode:
-			raise Exception("Wrong mode specified in configuration file. Got '%s', expected '%s'." % (mode_name, self.cmode))
-
-		if self.config and self.config is not None:
-			for line in open(self.config).readlines():
-				(key, value) = self.ParseConfigLine(line)
-				if key is not None and value is not None:
-					if key == self.INCLUDE:
-						filepath = os.path.dirname(config)
-						filename = "%s%s" % (value, os.path.splitext(config)[1])
-						self._parse_config(os.path.join(*[filepath, filename]))
-					else:
-						self.CONFIG[key] = value
+		self.command_sets = {}
+		self.snapshot = snapshot
 
 	def SetCommand(self, commands):
 		"""
@@ -337,34 +411,49 @@ class Configuration(Gumbi):
 		Returns None.
 		"""
 		if type(commands) == type([]):
-			self.CONFIG["COMMANDS"] = commands
-		elif commands is not None and self.CONFIG.has_key(commands):
-			self.CONFIG["COMMANDS"] = self.CONFIG[commands]
+			self.snapshot = self.snapshot.Set("COMMANDS", commands)
+		elif commands is not None and self.snapshot.Get(commands) is not None:
+			# Named command sets (ID, WRITE, ERASE, etc) are only packed the first time they are used
+			if not self.command_sets.has_key(commands):
+				self.command_sets[commands] = self.snapshot.Set("COMMANDS", self.snapshot.Get(commands))
+			self.snapshot = self.command_sets[commands]
 
 	def GetSetting(self, key):
 		"""
-		Returns the value of the specified CONFIG dict key.
+		Returns the value of the specified setting.
 
-		@key - The CONFIG key name.
+		@key - The setting name.
 
 		Returns the key value on success, None on failure.
 		"""
-		value = None
-
-		if self.CONFIG.has_key(key):
-			value = self.CONFIG[key]
+		value = self.snapshot.Get(key)
+		if type(value) == type(()):
+			value = list(value)
 		return value
 
+	def GetPins(self, key):
+		"""
+		Returns the physical Gumbi board pin numbers (index 0) for the specified setting.
+
+		@key - The setting name of a pin list (ADDRESS, DATA, etc) or control pin (CE, WE, etc).
+
+		Returns a list of pins for pin lists, a (pin, active state) tuple for control pins, or None on failure.
+		"""
+		pins = self.snapshot.pins.get(key)
+		if key in ConfigSnapshot.PIN_LISTS:
+			pins = list(pins)
+		return pins
+
 	def SetSetting(self, key, value):
 		"""
-		Sets the value for the specified CONFIG dict key.
+		Sets the value for the specified setting.
 		
-		@key   - The CONFIG key name.
-		@value - The CONFIG key value.
+		@key   - The setting name.
+		@value - The setting value.
 
 		Returns None.
 		"""
-		self.CONFIG[key] = value
+		self._set_snapshot(self.snapshot.Set(key, value))
 
 	def Pack(self, action, start, count):
 		"""
@@ -374,39 +463,48 @@ class Configuration(Gumbi):
 		@action   - Action (READ, WRITE, EXIT, etc).
 		@start    - Start address.
 		@count    - Number of bytes.
-		@commands - A list of commands to write to the chip prior to performing the action.
 
 		Returns a packed data string.
 		"""
-		self._shift_pins()
-		data = self.PackByte(action)
-		data += self.Pack32(start)
-		data += self.Pack32(count)
-		data += self.PackByte(self.CONFIG["TOE"][0])
-		data += self.PackByte(self.CONFIG["TBP"][0])
-		data += self.PackByte(self.CONFIG["CMDELAY"][0])
-		data += self.PackByte(self.CONFIG["RECONFIGURE"][0])
-		data += self.Pack16(len(self.CONFIG["ADDRESS"]))
-		data += self.Pack16(len(self.CONFIG["DATA"]))
-		data += self.Pack16(len(self.CONFIG["VCC"]))
-		data += self.Pack16(len(self.CONFIG["GND"]))
-		data += self.PackByte(len(self.CONFIG["COMMANDS"]))
-		data += self._pack_pins(self.CONFIG["ADDRESS"])
-		data += self._pack_pins(self.CONFIG["DATA"])
-		data += self._pack_pins(self.CONFIG["VCC"])
-		data += self._pack_pins(self.CONFIG["GND"])
-		data += self._pack_commands(self.CONFIG["COMMANDS"])
-		data += self.PackBytes(self.CONFIG["CE"])
-		data += self.PackBytes(self.CONFIG["WE"])
-		data += self.PackBytes(self.CONFIG["RE"])
-		data += self.PackBytes(self.CONFIG["OE"])
-		data += self.PackBytes(self.CONFIG["BE"])
-		data += self.PackBytes(self.CONFIG["BY"])
-		data += self.PackBytes(self.CONFIG["WP"])
-		data += self.PackBytes(self.CONFIG["WI"])
-		data += self.PackBytes(self.CONFIG["RI"])
-		data += self.PackBytes(self.CONFIG["RST"])
-		return data
+		return self.snapshot.Pack(action, start, count)
 
+	def Unpack(self, data):
+		"""
+		Unpacks a configuration data string generated by Pack(). Pin numbers are Gumbi board pin numbers.
 
+		@data - Packed configuration data.
 
+		Returns a dict of the configuration data, or None if data is too short.
+		"""
+		hsize = struct.calcsize(self.PACK_HEADER)
+		size = hsize + (4 * self.MAX_PINS) + (self.MAX_COMMANDS * 4) + (2 * len(self.CONTROL_PINS))
+
+		if len(data) < size:
+			return None
+
+		(action, start, count, toe, tbp, cmdelay, reconfigure, naddr, ndata, nvcc, ngnd, ncmd) = struct.unpack(self.PACK_HEADER, data[:hsize])
+
+		config = {
+			"ACTION"	: action,
+			"START"		: start,
+			"COUNT"		: count,
+			"TOE"		: toe,
+			"TBP"		: tbp,
+			"CMDELAY"	: cmdelay,
+			"RECONFIGURE"	: reconfigure
+		}
+
+		offset = hsize
+		for (key, n) in [("ADDRESS", naddr), ("DATA", ndata), ("VCC", nvcc), ("GND", ngnd)]:
+			config[key] = [ord(c) for c in data[offset:offset+min(n, self.MAX_PINS)]]
+			offset += self.MAX_PINS
+
+		ncmd = min(ncmd, self.MAX_COMMANDS)
+		config["COMMANDS"] = list(struct.unpack("<%dI" % ncmd, data[offset:offset+(ncmd*4)]))
+		offset += self.MAX_COMMANDS * 4
+
+		for key in self.CONTROL_PINS:
+			config[key] = (ord(data[offset]), ord(data[offset+1]))
+			offset += 2
+
+		return config
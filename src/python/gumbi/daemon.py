@@ -0,0 +1,688 @@
+import os
+import stat
+import errno
+import struct
+import marshal
+import socket
+import threading
+from gumbi import Gumbi
+from board import Board
+from parallel import Parallel
+from spi import SPI
+from gpio import GPIO
+from monitor import Monitor, Capture
+from configuration import Configuration
+
+class Connection:
+	"""
+	Frames RPC messages over a stream socket. Each message is a fixed size header, followed by the
+	marshalled arguments and then the raw payload:
+
+		op	(uint8)		Operation (requests) or status (responses)
+		flags	(uint8)		Reserved, 0
+		pad	(uint16)	Reserved, 0
+		alen	(uint32)	Length of the marshalled arguments
+		plen	(uint32)	Length of the payload
+
+	Payloads (data read from or written to the target chip) are sent and received as is, without
+	being marshalled or copied into a larger message buffer.
+	"""
+
+	HEADER = "<BBHII"
+	HEADER_SIZE = struct.calcsize(HEADER)
+
+	def __init__(self, sock):
+		"""
+		Class constructor.
+
+		@sock - A connected stream socket.
+
+		Returns None.
+		"""
+		self.sock = sock
+
+	def _recv(self, n):
+		"""
+		Receives exactly n bytes into a new buffer. For internal use only.
+
+		Returns a bytearray, or None if the connection was closed before any data was received.
+		"""
+		buf = bytearray(n)
+		view = memoryview(buf)
+		rx = 0
+
+		while rx < n:
+			count = self.sock.recv_into(view[rx:], n - rx)
+			if count == 0:
+				if rx == 0:
+					return None
+				raise Exception("Connection closed mid-message")
+			rx += count
+
+		return buf
+
+	def Send(self, op, args=None, payload=''):
+		"""
+		Sends a message.
+
+		@op      - Operation or status code.
+		@args    - Arguments; any value that can be marshalled.
+		@payload - Raw data string.
+
+		Returns None.
+		"""
+		margs = marshal.dumps(args)
+		self.sock.sendall(struct.pack(self.HEADER, op, 0, 0, len(margs), len(payload)) + margs)
+		if payload:
+			self.sock.sendall(payload)
+
+	def Recv(self):
+		"""
+		Receives a message.
+
+		Returns an (op, args, payload) tuple, or None if the connection was closed.
+		"""
+		header = self._recv(self.HEADER_SIZE)
+		if header is None:
+			return None
+
+		(op, flags, pad, alen, plen) = struct.unpack(self.HEADER, str(header))
+
+		args = None
+		if alen:
+			args = marshal.loads(str(self._recv(alen)))
+
+		payload = ''
+		if plen:
+			payload = str(self._recv(plen))
+
+		return (op, args, payload)
+
+	def Close(self):
+		"""
+		Closes the connection.
+
+		Returns None.
+		"""
+		self.sock.close()
+
+class Server:
+	"""
+	Board server, which keeps Gumbi boards open (and in their current mode) between client
+	connections. Clients connect to a Unix socket and call mode methods remotely; see the Remote*
+	classes. Example:
+
+		server = Server(ports=["/dev/ttyACM0"])
+		server.Serve()
+
+	Each board is accessed through a Board instance, so calls from any number of clients are
+	serialized, and pin set calls from different clients are merged.
+	"""
+
+	# Request operations
+	INFO = 1
+	CALL = 2
+
+	# Response status codes
+	OK = 0
+	ERROR = 1
+
+	# Default socket path; override with the GUMBID_SOCKET environment variable
+	SOCKET = os.environ.get("GUMBID_SOCKET", os.path.join(os.path.expanduser("~"), ".gumbi", "gumbid.sock"))
+
+	# Mode classes, and the methods that clients may call in each mode
+	MODES = {
+		"PARALLEL"	: (Parallel, ["Read", "Write", "ExecuteCommands"]),
+		"SPI"		: (SPI, ["Read", "Write", "Command", "ExecuteCommands"]),
+		"GPIO"		: (GPIO, ["ReadPin", "ReadPins", "ReadPorts", "ReadAll", "WriteAll", "Play"]),
+		"MONITOR"	: (Monitor, ["Capture"])
+	}
+
+	# Maximum number of settings snapshots cached per mode instance
+	MAX_SNAPSHOTS = 64
+
+	def __init__(self, path=None, ports=None):
+		"""
+		Class constructor. Opens the boards and binds the server socket.
+
+		@path  - Path to the Unix socket. Defaults to SOCKET.
+		@ports - List of Gumbi board serial ports. If not specified, the first board found is used.
+
+		Returns None.
+		"""
+		if path is None:
+			path = self.SOCKET
+		if not ports:
+			ports = [None]
+
+		self.path = path
+		self.boards = []
+		self.pins = []
+		self.running = False
+
+		for port in ports:
+			board = Board(port)
+			self.boards.append(board)
+			self.pins.append(board.PinCount())
+
+		self._bind()
+
+	def _bind(self):
+		"""
+		Creates the server socket. Only the current user may connect to it. For internal use only.
+		"""
+		dirname = os.path.dirname(self.path)
+		if dirname and not os.path.isdir(dirname):
+			os.makedirs(dirname)
+
+		# Remove a stale socket left by a previous server, but refuse to replace one that is still in use
+		if os.path.exists(self.path):
+			probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			try:
+				probe.connect(self.path)
+				probe.close()
+				raise Exception("Another server is already listening on %s" % self.path)
+			except socket.error:
+				os.unlink(self.path)
+
+		self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		umask = os.umask(0077)
+		try:
+			self.sock.bind(self.path)
+		finally:
+			os.umask(umask)
+		os.chmod(self.path, stat.S_IRUSR | stat.S_IWUSR)
+		self.sock.listen(16)
+
+	def _board(self, index):
+		"""
+		Returns the Board instance for a board index. For internal use only.
+		"""
+		if index is None:
+			index = 0
+		if index < 0 or index >= len(self.boards):
+			raise Exception("No such board: %s" % str(index))
+		return self.boards[index]
+
+	def _configure(self, session, settings):
+		"""
+		Applies a client's modified settings to a mode instance. Snapshots are cached per mode instance,
+		so repeated calls with the same settings don't re-pack the configuration. For internal use only.
+		"""
+		if not hasattr(session, "config"):
+			return
+
+		if not hasattr(session, "snapshots"):
+			session.snapshots = {None : session.config.snapshot}
+
+		key = None
+		if settings:
+			key = marshal.dumps(sorted(settings.items()))
+
+		if not session.snapshots.has_key(key):
+			if len(session.snapshots) > self.MAX_SNAPSHOTS:
+				session.snapshots = {None : session.snapshots[None]}
+
+			snapshot = session.snapshots[None]
+			for (name, value) in settings.iteritems():
+				snapshot = snapshot.Set(name, value)
+			session.snapshots[key] = snapshot
+
+		session.config._set_snapshot(session.snapshots[key])
+
+	def _call(self, args, payload):
+		"""
+		Runs a CALL request. For internal use only.
+
+		@args    - (board index, mode, config, voltage, settings, method, params) tuple.
+		@payload - Data to append to params, if any.
+
+		Returns a (result, payload) tuple.
+		"""
+		(index, mode, config, voltage, settings, method, params) = args
+		board = self._board(index)
+		params = list(params)
+
+		if mode == "GPIO" and method in ("SetPins", "PinsHigh", "PinsLow"):
+			# Pin sets go through the Board so that they can be merged with other clients' pin sets
+			if method == "SetPins":
+				(high, low) = params
+			elif method == "PinsHigh":
+				(high, low) = (params[0], [])
+			else:
+				(high, low) = ([], params[0])
+			board.SetPins(high, low, config=config, voltage=voltage)
+			return (None, '')
+
+		if not self.MODES.has_key(mode) or method not in self.MODES[mode][1]:
+			raise Exception("Unsupported call: %s.%s" % (mode, method))
+
+		if payload:
+			params.append(payload)
+
+		def run(session):
+			self._configure(session, settings)
+			return getattr(session, method)(*params)
+
+		result = board.Run(self.MODES[mode][0], run, config, voltage)
+
+		if isinstance(result, Capture):
+			return ((result.num_pins, result.offset, result.elapsed), result.data)
+		if isinstance(result, basestring):
+			return (None, result)
+		if isinstance(result, bytearray):
+			return (None, str(result))
+		return (result, '')
+
+	def _client(self, sock):
+		"""
+		Handles requests from a client connection. For internal use only.
+		"""
+		conn = Connection(sock)
+
+		try:
+			while True:
+				message = conn.Recv()
+				if message is None:
+					break
+
+				(op, args, payload) = message
+				try:
+					if op == self.INFO:
+						conn.Send(self.OK, {"boards" : len(self.boards), "pins" : self.pins})
+					elif op == self.CALL:
+						(result, data) = self._call(args, payload)
+						conn.Send(self.OK, result, data)
+					else:
+						raise Exception("Unknown request: %d" % op)
+				except socket.error:
+					raise
+				except Exception, e:
+					conn.Send(self.ERROR, str(e))
+		except socket.error, e:
+			if e.args[0] not in (errno.EPIPE, errno.ECONNRESET):
+				raise
+		finally:
+			conn.Close()
+
+	def Serve(self):
+		"""
+		Accepts client connections until Close() is called. Each client is handled in its own thread.
+
+		Returns None.
+		"""
+		self.running = True
+
+		while self.running:
+			try:
+				(sock, addr) = self.sock.accept()
+			except socket.error, e:
+				if not self.running or e.args[0] == errno.EBADF:
+					break
+				if e.args[0] == errno.EINTR:
+					continue
+				raise
+
+			thread = threading.Thread(target=self._client, args=(sock,), name="gumbid-client")
+			thread.daemon = True
+			thread.start()
+
+	def Close(self):
+		"""
+		Stops the server, and closes all boards.
+
+		Returns None.
+		"""
+		self.running = False
+
+		try:
+			self.sock.shutdown(socket.SHUT_RDWR)
+		except socket.error:
+			pass
+		self.sock.close()
+
+		try:
+			os.unlink(self.path)
+		except OSError:
+			pass
+
+		for board in self.boards:
+			board.Close()
+
+class Client:
+	"""
+	Connection to a board server. The Remote* classes are easier to use.
+	"""
+
+	def __init__(self, path=None):
+		"""
+		Class constructor.
+
+		@path - Path to the server's Unix socket. Defaults to Server.SOCKET.
+
+		Returns None.
+		"""
+		if path is None:
+			path = Server.SOCKET
+
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		sock.connect(path)
+		self.conn = Connection(sock)
+		self.lock = threading.Lock()
+
+	def Request(self, op, args=None, payload=''):
+		"""
+		Sends a request and waits for the response.
+
+		@op      - Request operation.
+		@args    - Request arguments.
+		@payload - Request payload.
+
+		Returns a (result, payload) tuple. Raises an exception if the server reports an error.
+		"""
+		self.lock.acquire()
+		try:
+			self.conn.Send(op, args, payload)
+			response = self.conn.Recv()
+		finally:
+			self.lock.release()
+
+		if response is None:
+			raise Exception("Board server closed the connection")
+
+		(status, result, data) = response
+		if status != Server.OK:
+			raise Exception(result)
+		return (result, data)
+
+	def Info(self):
+		"""
+		Returns a dict describing the server's boards: {"boards" : count, "pins" : [pin count of each board]}.
+		"""
+		return self.Request(Server.INFO)[0]
+
+	def Call(self, index, mode, config, voltage, settings, method, params, payload=''):
+		"""
+		Calls a mode method on the server. See Server._call.
+
+		Returns a (result, payload) tuple.
+		"""
+		return self.Request(Server.CALL, (index, mode, config, voltage, settings, method, tuple(params)), payload)
+
+	def Close(self):
+		"""
+		Closes the connection.
+
+		Returns None.
+		"""
+		self.conn.Close()
+
+class Remote:
+	"""
+	Mix-in class for the Remote* classes, which provide the same API as the corresponding mode
+	classes but run on a board server. For internal use only.
+	"""
+
+	def _connect(self, mode, config, voltage, port, path):
+		"""
+		Connects to the board server. For internal use only.
+
+		@mode    - Mode name (see Server.MODES).
+		@config  - Configuration file or dict.
+		@voltage - Target voltage.
+		@port    - Index of the server's board to use.
+		@path    - Server socket path.
+		"""
+		Gumbi.__init__(self, port=port, new=False)
+
+		self.client = Client(path)
+		self.board = port
+		self.rmode = mode
+		self.voltage = voltage
+
+		# Configuration files are opened by the server, which may have a different working directory
+		if isinstance(config, basestring):
+			config = os.path.abspath(config)
+		self.rconfig = config
+
+		pins = self.client.Info()["pins"]
+		if port is not None and (port < 0 or port >= len(pins)):
+			raise Exception("No such board: %s" % str(port))
+		self.num_pins = pins[port or 0]
+
+		if mode != "MONITOR":
+			self.config = Configuration(config, mode.upper(), num_pins=self.num_pins)
+			self.base = self.config.snapshot
+
+	def _settings(self):
+		"""
+		Returns the settings that have been changed since the configuration was loaded. For internal use only.
+		"""
+		if not hasattr(self, "config") or self.config.snapshot is self.base:
+			return None
+
+		base = self.base.settings
+		return dict([(key, list(value)) for (key, value) in self.config.snapshot.settings.iteritems() if base.get(key) != value])
+
+	def _call(self, method, params=(), payload='', config=None):
+		"""
+		Calls a method on the server. For internal use only.
+
+		Returns a (result, payload) tuple.
+		"""
+		if config is None:
+			config = self.rconfig
+		return self.client.Call(self.board, self.rmode, config, self.voltage, self._settings(), method, params, payload)
+
+	def Close(self):
+		"""
+		Closes the connection to the board server. The board is left in its current mode.
+
+		Returns None.
+		"""
+		self.client.Close()
+
+class RemoteParallel(Remote, Parallel):
+	"""
+	Parallel mode on a board server. Example:
+
+		p = RemoteParallel(config="bin/config/MX29LV320.conf")
+		data = p.Read(0, 0x1000)
+		p.Close()
+	"""
+
+	def __init__(self, config=None, voltage=None, port=None, path=None):
+		"""
+		Class constructor.
+
+		@config  - Path to configuration file.
+		@voltage - Target voltage.
+		@port    - Index of the server's board to use.
+		@path    - Server socket path.
+
+		Returns None.
+		"""
+		self._connect(self.MODE, config, voltage, port, path)
+
+	def Read(self, start, count, callback=None, transform=None, checkpoint=None):
+		"""
+		Reads a number of bytes from the target chip. See Gumbi.Read.
+		The server retries failed segments itself, so checkpoint is called once, after the whole read.
+		"""
+		data = self._call("Read", (start, count))[1]
+		if transform is not None:
+			data = transform.Apply(data)
+		if callback is not None:
+			callback(len(data), count)
+		if checkpoint is not None:
+			checkpoint(len(data), data)
+		return data
+
+	def Write(self, start, data, callback=None, transform=None, checkpoint=None):
+		"""
+		Writes a number of bytes to the target chip. See Gumbi.Write.
+		The server retries failed segments itself, so checkpoint is called once, after the whole write.
+		"""
+		if transform is not None:
+			data = transform.Apply(data)
+		result = self._call("Write", (start,), data)[0]
+		if callback is not None:
+			callback(len(data), len(data))
+		if checkpoint is not None:
+			checkpoint(len(data), data)
+		return result
+
+	def ExecuteCommands(self):
+		"""
+		Runs the commands listed in the "COMMANDS" configuration setting. See Gumbi.ExecuteCommands.
+		"""
+		self._call("ExecuteCommands")
+
+class RemoteSPI(Remote, SPI):
+	"""
+	SPI mode on a board server.
+	"""
+
+	def __init__(self, config=None, voltage=None, port=None, path=None):
+		"""
+		Class constructor.
+
+		@config  - Path to configuration file.
+		@voltage - Target voltage.
+		@port    - Index of the server's board to use.
+		@path    - Server socket path.
+
+		Returns None.
+		"""
+		self._connect(self.MODE, config, voltage, port, path)
+
+	def Command(self, commands, count=0):
+		"""
+		Sends a list of bytes to the target chip and reads back count bytes. See SPI.Command.
+		"""
+		self.config.SetCommand(commands)
+		return self._call("Command", (list(self.config.GetSetting("COMMANDS")), count))[1]
+
+	def Read(self, start, count, callback=None):
+		"""
+		Reads a number of bytes from the target chip. See SPI.Read.
+		"""
+		data = self._call("Read", (start, count))[1]
+		if callback is not None:
+			callback(len(data), count)
+		return data
+
+	def Write(self, start, data, callback=None):
+		"""
+		Writes a number of bytes to the target chip. See SPI.Write.
+		"""
+		result = self._call("Write", (start,), data)[0]
+		if callback is not None:
+			callback(len(data), len(data))
+		return result
+
+	def ExecuteCommands(self):
+		"""
+		Runs the commands listed in the "COMMANDS" configuration setting. See Gumbi.ExecuteCommands.
+		"""
+		self._call("ExecuteCommands")
+
+class RemoteGPIO(Remote, GPIO):
+	"""
+	GPIO mode on a board server. Pin set commands are sent immediately, and may be merged by the
+	server with pin set commands from other clients.
+	"""
+
+	def __init__(self, config=None, voltage=None, port=None, path=None):
+		"""
+		Class constructor.
+
+		@config  - Path to configuration file.
+		@voltage - Target voltage.
+		@port    - Index of the server's board to use.
+		@path    - Server socket path.
+
+		Returns None.
+		"""
+		self.queue = []
+		self.buffering = 0
+		self._connect(self.MODE, config, voltage, port, path)
+		self.num_ports = self.num_pins / self.PINS_PER_PORT
+
+	def Flush(self):
+		"""
+		Pin set commands are not buffered by the client, so this does nothing.
+
+		Returns None.
+		"""
+		return None
+
+	def PinHigh(self, pin):
+		self._call("SetPins", ([pin], []))
+
+	def PinLow(self, pin):
+		self._call("SetPins", ([], [pin]))
+
+	def PinsHigh(self, pins):
+		self._call("SetPins", (list(pins), []))
+
+	def PinsLow(self, pins):
+		self._call("SetPins", ([], list(pins)))
+
+	def SetPins(self, high, low):
+		self._call("SetPins", (list(high), list(low)))
+
+	def ReadPin(self, pin):
+		return self._call("ReadPin", (pin,))[0]
+
+	def ReadPins(self, pins):
+		return self._call("ReadPins", (list(pins),))[0]
+
+	def ReadPorts(self, ports):
+		return bytearray(self._call("ReadPorts", (list(ports),))[1])
+
+	def ReadAll(self):
+		return self._call("ReadAll")[0]
+
+	def WriteAll(self, value, mask=None):
+		self._call("WriteAll", (value, mask))
+
+	def Play(self, sequence, loops=1):
+		"""
+		Plays back a Sequence on the server. The sequence is compiled by the client. See GPIO.Play.
+		"""
+		steps = sequence
+		if not isinstance(sequence, list):
+			steps = self.Compile(sequence)
+		return self._call("Play", (steps, loops))[0]
+
+class RemoteMonitor(Remote, Monitor):
+	"""
+	Monitor mode on a board server. Only Capture() is run on the server; Sniff, Statistics,
+	Stream and Decode are built on Capture, as in Monitor.
+	"""
+
+	def __init__(self, count=0, voltage=None, port=None, path=None):
+		"""
+		Class constructor.
+
+		@count   - The number of pins to read. If 0 or not specified, all pins will be read.
+		@voltage - Target voltage.
+		@port    - Index of the server's board to use.
+		@path    - Server socket path.
+
+		Returns None.
+		"""
+		self._connect("MONITOR", count, voltage, port, path)
+		if count:
+			self.num_pins = count
+		self.num_ports = self.num_pins / self.PINS_PER_PORT
+
+	def Capture(self, n, offset=0):
+		"""
+		Reads in n samples of raw pin data. See Monitor.Capture.
+
+		Returns a Capture object.
+		"""
+		((num_pins, first, elapsed), data) = self._call("Capture", (n, offset))
+		return Capture(data, num_pins, offset, elapsed)
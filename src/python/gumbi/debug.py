@@ -1,4 +1,6 @@
+import time
 from gumbi import *
+from metrics import Percentile
 
 class SpeedTest(Gumbi):
 	"""
@@ -52,24 +54,65 @@ class SpeedTest(Gumbi):
 class TransferTest(Gumbi):
 	"""
 	Test the two-way transfer speed and validates data integrity.
+
+	A single transfer is run with Go() and checked with Validate(). Sweep() runs many transfers
+	across a range of sizes and reports round trip latency percentiles and duplex throughput:
+
+		t = TransferTest()
+		results = t.Sweep(iterations=1000)
+		for line in t.Report(results):
+			print line
+		t.Close()
 	"""
 
 	XFER_SIZE = 128
+	MAX_XFER_SIZE = 0x10000
+	SWEEP_SIZES = [1, 16, 64, 256, 1024, 4096, 16384, 65536]
+
+	# Maximum number of bytes sent before reading back the echoed data, so that neither side's buffers overflow
+	WINDOW_SIZE = 4096
 
-	def __init__(self, port=None):
+	# Counting pattern, so that dropped, duplicated or re-ordered bytes are detected
+	PATTERN = ''.join([chr(i) for i in range(0, 256)]) * (MAX_XFER_SIZE / 256)
+
+	def __init__(self, port=None, size=XFER_SIZE):
 		"""
 		Class contstructor.
+
+		@port - Gumbi board serial port.
+		@size - Number of bytes to transfer during Go().
+
+		Returns None.
 		"""
 		self.data = ''
+		self.size = size
 		Gumbi.__init__(self, port=port)
 		self.SetMode(self.XFER)
 
-	def _xfer(self):
+	def _exit(self):
+		"""
+		Exit XFER mode. For internal use only.
+		"""
+		# When told to transfer 0 bytes, XFER mode will ACK and exit
+		self.WriteBytes(self.Pack32(0))
+		self.ReadAck()
+
+	def _xfer(self, size):
 		"""
 		Performs the actual data transfer. For internal use only.
 		"""
-		self.WriteBytes(self.DUMMY_BYTE * self.XFER_SIZE)
-		self.data = self.ReadBytes(self.XFER_SIZE)
+		if size < 1 or size > self.MAX_XFER_SIZE:
+			raise Exception("Transfer size must be between 1 and %d bytes" % self.MAX_XFER_SIZE)
+
+		data = []
+		self.WriteBytes(self.Pack32(size))
+
+		for i in range(0, size, self.WINDOW_SIZE):
+			n = min(self.WINDOW_SIZE, size - i)
+			self.WriteBytes(self.PATTERN[i:i+n])
+			data.append(self.ReadBytes(n))
+
+		self.data = ''.join(data)
 
 	def Go(self):
 		"""
@@ -78,7 +121,7 @@ class TransferTest(Gumbi):
 		Returns the number of seconds elapsed during the transfer.
 		"""
 		self.StartTimer()
-		self._xfer()
+		self._xfer(self.size)
 		return self.StopTimer()
 
 	def Validate(self):
@@ -87,16 +130,75 @@ class TransferTest(Gumbi):
 
 		Returns True if data is valid, False if invalid.
 		"""
-		retval = True
-		if len(self.data) >= self.XFER_SIZE:
-			for i in range(0, self.XFER_SIZE):
-				if self.data[i] != self.DUMMY_BYTE:
-					retval = False
-					break
-		else:
-			retval = False
+		return (self.data == self.PATTERN[:self.size])
 
-		return retval
+	def Sweep(self, sizes=None, iterations=1000):
+		"""
+		Runs the transfer test repeatedly for each of the specified sizes.
+		Latencies are also recorded in Gumbi.STATS, in the "xfer_latency" histograms.
+
+		@sizes      - List of transfer sizes, in bytes. Defaults to SWEEP_SIZES.
+		@iterations - Number of transfers to run for each size.
+
+		Returns a dict of results for each size:
+
+			{
+				size : {
+					"iterations", "errors",
+					"min", "mean", "p50", "p99", "max"	(round trip latency, in seconds)
+					"throughput"				(bytes per second in each direction, at the mean latency)
+				}
+			}
+		"""
+		if sizes is None:
+			sizes = self.SWEEP_SIZES
+
+		results = {}
+
+		for size in sizes:
+			samples = []
+			errors = 0
+			expected = self.PATTERN[:size]
+
+			for i in range(0, iterations):
+				t = time.time()
+				self._xfer(size)
+				t = time.time() - t
+
+				samples.append(t)
+				self.STATS.Time("xfer_latency", t, size=size)
+				if self.data != expected:
+					errors += 1
+					self.STATS.Count("xfer_errors", size=size)
+
+			samples.sort()
+			mean = sum(samples) / len(samples)
+
+			results[size] = {
+				"iterations"	: len(samples),
+				"errors"	: errors,
+				"min"		: samples[0],
+				"mean"		: mean,
+				"p50"		: Percentile(samples, 50),
+				"p99"		: Percentile(samples, 99),
+				"max"		: samples[-1],
+				"throughput"	: (size / mean) if mean > 0 else 0
+			}
+
+		return results
+
+	def Report(self, results):
+		"""
+		Returns a list of human readable lines describing the results of Sweep().
+		Duplex throughput counts the data in both directions.
+		"""
+		lines = ["%8s %8s %7s %10s %10s %10s %10s %14s" % ("Size", "Count", "Errors", "Mean (ms)", "p50 (ms)", "p99 (ms)", "Max (ms)", "Duplex (KB/s)")]
+
+		for size in sorted(results.keys()):
+			r = results[size]
+			lines.append("%8d %8d %7d %10.3f %10.3f %10.3f %10.3f %14.1f" % (size, r["iterations"], r["errors"], r["mean"] * 1000, r["p50"] * 1000, r["p99"] * 1000, r["max"] * 1000, (r["throughput"] * 2) / 1000.0))
+
+		return lines
 
 class Info(Gumbi):
 	"""
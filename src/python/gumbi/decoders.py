@@ -0,0 +1,491 @@
+from gumbi import Gumbi
+from parallel import Parallel
+from configuration import Configuration
+
+class Decoder:
+	"""
+	Base class for protocol decoders that operate on pin data streamed from the Gumbi board in monitor mode.
+
+	Decoders consume an iterable of Capture objects (see Monitor.Stream) one block at a time, and
+	yield transaction records (dicts) as soon as they are decoded. Decoder state is carried across
+	blocks, so transactions that straddle a block boundary are decoded correctly, and memory usage
+	is bounded by the block size rather than by the length of the capture.
+
+	All sample numbers in the decoded records are relative to the start of the stream.
+	"""
+
+	# Maximum number of bytes held in a single transaction record before it is emitted
+	MAX_TRANSACTION = 4096
+
+	def __init__(self):
+		"""
+		Class constructor.
+
+		Returns None.
+		"""
+		self.sample = 0
+		self.last = {}
+		self.planes = {}
+
+	def _plane(self, capture, pin):
+		"""
+		Returns the bit plane for the specified pin, prefixed with the last state of the pin
+		from the previous block. Index j in the returned string corresponds to stream sample
+		self.sample + j - 1. For internal use only.
+		"""
+		if not self.planes.has_key(pin):
+			plane = capture.Plane(pin)
+			prev = self.last.get(pin, plane[:1])
+			self.last[pin] = plane[-1:] or prev
+			self.planes[pin] = prev + plane
+		return self.planes[pin]
+
+	def _decode(self, capture):
+		"""
+		Place holder _decode method, called by Decode() once for each block of pin data.
+
+		This should be overridden by the subclass and return an iterable of decoded records.
+		"""
+		return []
+
+	def Edges(self, plane, rising=True, start=0, end=None):
+		"""
+		Generator that locates edges in a bit plane.
+
+		@plane  - A bit plane string, as returned by Capture.Plane.
+		@rising - Set to True to locate rising edges, False to locate falling edges.
+		@start  - Index to start searching at.
+		@end    - Index to stop searching at.
+
+		Yields the index of the first sample following each edge.
+		"""
+		if rising:
+			pattern = '01'
+		else:
+			pattern = '10'
+
+		if end is None:
+			end = len(plane)
+
+		i = plane.find(pattern, start, end)
+		while i != -1:
+			yield i + 1
+			i = plane.find(pattern, i + 1, end)
+
+	def Decode(self, captures):
+		"""
+		Decodes a stream of pin data.
+
+		@captures - An iterable of Capture objects, such as the generator returned by Monitor.Stream.
+
+		Returns a generator of decoded records.
+		"""
+		for capture in captures:
+			self.planes = {}
+			for record in self._decode(capture):
+				yield record
+			self.sample += len(capture)
+
+class SPIDecoder(Decoder):
+	"""
+	Decodes SPI transactions.
+
+	Each record is a dict with the following keys:
+
+		start	- The sample number at which the transaction started.
+		end	- The sample number at which the transaction ended.
+		mosi	- String of bytes sent to the slave.
+		miso	- String of bytes received from the slave.
+
+	If a chip select pin is specified, one record is emitted per chip select assertion.
+	Otherwise, one record is emitted per byte.
+	"""
+
+	# Bit reversal lookup table, used for LSB first data
+	REVERSE = [int(bin(i)[2:].zfill(8)[::-1], 2) for i in range(0, 256)]
+
+	def __init__(self, sck, mosi=None, miso=None, cs=None, mode=0, lsb=False, cs_active=0):
+		"""
+		Class constructor.
+
+		@sck       - The SPI clock pin.
+		@mosi      - The MOSI pin, if any.
+		@miso      - The MISO pin, if any.
+		@cs        - The chip select pin, if any.
+		@mode      - The SPI clock mode (0 - 3).
+		@lsb       - Set to True if data is sent least significant bit first.
+		@cs_active - The active state of the chip select pin.
+
+		Returns None.
+		"""
+		Decoder.__init__(self)
+		self.sck = sck
+		self.mosi = mosi
+		self.miso = miso
+		self.cs = cs
+		self.lsb = lsb
+		self.cs_active = str(cs_active)
+		# Data is sampled on the rising edge in modes 0 and 3, and the falling edge in modes 1 and 2
+		self.rising = mode in (0, 3)
+		self._reset(False)
+
+	def _reset(self, active):
+		"""
+		Clears the current transaction. For internal use only.
+		"""
+		self.active = active
+		self.start = self.end = 0
+		self.nbits = 0
+		self.mosi_byte = self.miso_byte = 0
+		self.mosi_data = []
+		self.miso_data = []
+
+	def _record(self):
+		"""
+		Returns a record for the current transaction. For internal use only.
+		"""
+		return {
+			"start"	: self.start,
+			"end"	: self.end,
+			"mosi"	: ''.join(self.mosi_data),
+			"miso"	: ''.join(self.miso_data)
+		}
+
+	def _decode(self, capture):
+		"""
+		Decodes one block of pin data. For internal use only.
+		"""
+		sck = self._plane(capture, self.sck)
+		mosi = miso = cs = None
+		if self.mosi is not None:
+			mosi = self._plane(capture, self.mosi)
+		if self.miso is not None:
+			miso = self._plane(capture, self.miso)
+
+		n = len(sck)
+
+		# Split the block up into segments where the chip select state does not change
+		if self.cs is not None:
+			cs = self._plane(capture, self.cs)
+			bounds = sorted(list(self.Edges(cs, True)) + list(self.Edges(cs, False)))
+		else:
+			bounds = []
+
+		starts = [1] + bounds
+		ends = bounds + [n]
+
+		for (a, b) in zip(starts, ends):
+			if a >= b:
+				continue
+
+			if cs is not None and cs[a] != self.cs_active:
+				if self.active:
+					self.end = self.sample + a - 1
+					yield self._record()
+					self._reset(False)
+				continue
+
+			if not self.active:
+				self._reset(True)
+				self.start = self.sample + a - 1
+
+			for j in self.Edges(sck, self.rising, a - 1, b):
+				self.mosi_byte <<= 1
+				self.miso_byte <<= 1
+				if mosi is not None and mosi[j] == '1':
+					self.mosi_byte |= 1
+				if miso is not None and miso[j] == '1':
+					self.miso_byte |= 1
+				self.nbits += 1
+
+				if self.nbits == 8:
+					if self.lsb:
+						self.mosi_byte = self.REVERSE[self.mosi_byte]
+						self.miso_byte = self.REVERSE[self.miso_byte]
+					self.mosi_data.append(chr(self.mosi_byte))
+					self.miso_data.append(chr(self.miso_byte))
+					self.mosi_byte = self.miso_byte = 0
+					self.nbits = 0
+					self.end = self.sample + j - 1
+
+					if cs is None or len(self.mosi_data) >= self.MAX_TRANSACTION:
+						yield self._record()
+						self._reset(True)
+						self.start = self.sample + j - 1
+
+class I2CDecoder(Decoder):
+	"""
+	Decodes I2C transactions.
+
+	Each record is a dict with the following keys:
+
+		start	- The sample number of the start condition.
+		end	- The sample number of the stop (or repeated start) condition.
+		address	- The 7-bit slave address.
+		read	- True for a read transaction, False for a write transaction.
+		data	- String of data bytes transferred after the address byte.
+		nack	- True if any byte in the transaction was not acknowledged.
+	"""
+
+	START = 0
+	STOP = 1
+	CLOCK = 2
+
+	def __init__(self, scl, sda):
+		"""
+		Class constructor.
+
+		@scl - The I2C clock pin.
+		@sda - The I2C data pin.
+
+		Returns None.
+		"""
+		Decoder.__init__(self)
+		self.scl = scl
+		self.sda = sda
+		self._reset(False)
+
+	def _reset(self, active):
+		"""
+		Clears the current transaction. For internal use only.
+		"""
+		self.active = active
+		self.start = 0
+		self.address = None
+		self.read = False
+		self.nack = False
+		self.nbits = 0
+		self.byte = 0
+		self.data = []
+
+	def _record(self, end):
+		"""
+		Returns a record for the current transaction. For internal use only.
+		"""
+		return {
+			"start"		: self.start,
+			"end"		: end,
+			"address"	: self.address,
+			"read"		: self.read,
+			"data"		: ''.join(self.data),
+			"nack"		: self.nack
+		}
+
+	def _decode(self, capture):
+		"""
+		Decodes one block of pin data. For internal use only.
+		"""
+		scl = self._plane(capture, self.scl)
+		sda = self._plane(capture, self.sda)
+
+		# SDA transitions while SCL is held high are start/stop conditions; everything else is data
+		events = [(j, self.CLOCK) for j in self.Edges(scl, True)]
+		events += [(j, self.START) for j in self.Edges(sda, False) if scl[j] == '1' and scl[j-1] == '1']
+		events += [(j, self.STOP) for j in self.Edges(sda, True) if scl[j] == '1' and scl[j-1] == '1']
+		events.sort()
+
+		for (j, event) in events:
+			sample = self.sample + j - 1
+
+			if event == self.START:
+				if self.active and self.address is not None:
+					yield self._record(sample)
+				self._reset(True)
+				self.start = sample
+
+			elif event == self.STOP:
+				if self.active and self.address is not None:
+					yield self._record(sample)
+				self._reset(False)
+
+			elif self.active:
+				self.nbits += 1
+
+				if self.nbits <= 8:
+					self.byte = (self.byte << 1) | int(sda[j])
+				else:
+					# The ninth bit is the ACK/NACK bit
+					if sda[j] == '1':
+						self.nack = True
+
+					if self.address is None:
+						self.address = self.byte >> 1
+						self.read = (self.byte & 1) == 1
+					else:
+						self.data.append(chr(self.byte))
+
+					self.nbits = 0
+					self.byte = 0
+
+					if len(self.data) >= self.MAX_TRANSACTION:
+						yield self._record(sample)
+						self.data = []
+						self.start = sample
+
+class UARTDecoder(Decoder):
+	"""
+	Decodes asynchronous serial (UART) data.
+
+	Each record is a dict with the following keys:
+
+		start	- The sample number of the start bit.
+		end	- The sample number of the end of the stop bit(s).
+		data	- The received data value.
+		error	- True if a framing or parity error was detected.
+	"""
+
+	def __init__(self, rx, baud, rate, bits=8, parity=None, stop=1):
+		"""
+		Class constructor.
+
+		@rx     - The receive pin.
+		@baud   - The baud rate.
+		@rate   - The monitor sample rate, in samples per second.
+		@bits   - The number of data bits.
+		@parity - One of: None, 'E' (even), 'O' (odd).
+		@stop   - The number of stop bits.
+
+		Returns None.
+		"""
+		Decoder.__init__(self)
+		self.rx = rx
+		self.bits = bits
+		self.parity = parity
+		self.stop = stop
+		self.width = float(rate) / baud
+		self.nbits = 1 + bits + stop
+		if parity is not None:
+			self.nbits += 1
+		self.frame = int(self.width * self.nbits + 0.5)
+		self.offsets = [int((i + 0.5) * self.width) for i in range(0, self.nbits)]
+		self.carry = ''
+
+	def _decode(self, capture):
+		"""
+		Decodes one block of pin data. For internal use only.
+		"""
+		plane = self.carry + capture.Plane(self.rx)
+		base = self.sample - len(self.carry)
+		self.carry = plane[-1:]
+		pos = 0
+
+		while True:
+			i = plane.find('10', pos)
+			if i == -1:
+				break
+
+			# If the frame is not complete, hold on to it until the next block arrives
+			s = i + 1
+			if (s + self.frame) > len(plane):
+				self.carry = plane[i:]
+				break
+
+			frame = [plane[s+offset] for offset in self.offsets]
+
+			# A start bit that does not last until the middle of the bit period is a glitch
+			if frame[0] != '0':
+				pos = s
+				continue
+
+			# Data bits are sent least significant bit first
+			data = int(''.join(frame[self.bits:0:-1]), 2)
+			error = '0' in frame[-self.stop:]
+
+			if self.parity is not None:
+				ones = frame[1:self.bits+2].count('1')
+				if self.parity.upper() == 'E':
+					error |= (ones % 2) != 0
+				else:
+					error |= (ones % 2) != 1
+
+			yield {
+				"start"	: base + s,
+				"end"	: base + s + self.frame,
+				"data"	: data,
+				"error"	: error
+			}
+
+			# Resume searching from the middle of the last stop bit
+			pos = s + self.offsets[-1]
+
+class NORDecoder(Decoder):
+	"""
+	Decodes NOR flash (parallel bus) read and write cycles, using the ADDRESS, DATA, CE, WE and OE
+	pin definitions from a chip configuration file.
+
+	A write cycle is recorded each time WE is de-asserted while CE is asserted, and a read cycle is
+	recorded each time OE is de-asserted while CE is asserted. Address and data lines are sampled on
+	the last sample before the de-assertion.
+
+	Each record is a dict with the following keys:
+
+		sample	- The sample number at which the address and data lines were sampled.
+		op	- Either "read" or "write".
+		address	- The value of the address bus.
+		data	- The value of the data bus.
+	"""
+
+	def __init__(self, config, num_pins=Gumbi.MAX_PINS):
+		"""
+		Class constructor.
+
+		@config   - A Configuration instance, or the path to a parallel chip configuration file.
+		@num_pins - The number of pins being monitored on the Gumbi board.
+
+		Returns None.
+		"""
+		Decoder.__init__(self)
+
+		if not isinstance(config, Configuration):
+			config = Configuration(config, Parallel.MODE, num_pins=num_pins)
+
+		# Convert physical pin numbers (index 0) to the pin numbers used by Capture (index 1)
+		self.address = [pin + 1 for pin in config.GetPins("ADDRESS")]
+		self.data = [pin + 1 for pin in config.GetPins("DATA")]
+		self.ce = self._control_pin(config.GetPins("CE"))
+		self.we = self._control_pin(config.GetPins("WE"))
+		self.oe = self._control_pin(config.GetPins("OE"))
+
+	def _control_pin(self, cp):
+		"""
+		Returns a (pin, active state) tuple for the given control pin, or None if unused. For internal use only.
+		"""
+		if cp is None or cp[0] == Gumbi.UNUSED:
+			return None
+		return (cp[0] + 1, str(cp[1]))
+
+	def _value(self, planes, j):
+		"""
+		Returns the value represented by a list of bit planes at index j. For internal use only.
+		"""
+		value = 0
+		for i in range(0, len(planes)):
+			if planes[i][j] == '1':
+				value |= (1 << i)
+		return value
+
+	def _decode(self, capture):
+		"""
+		Decodes one block of pin data. For internal use only.
+		"""
+		address = [self._plane(capture, pin) for pin in self.address]
+		data = [self._plane(capture, pin) for pin in self.data]
+		ce = None
+		if self.ce is not None:
+			ce = self._plane(capture, self.ce[0])
+
+		events = []
+		for (cp, op) in ((self.we, "write"), (self.oe, "read")):
+			if cp is not None:
+				# De-assertion of an active low pin is a rising edge
+				events += [(j, op) for j in self.Edges(self._plane(capture, cp[0]), cp[1] == '0')]
+		events.sort()
+
+		for (j, op) in events:
+			if ce is None or ce[j-1] == self.ce[1]:
+				yield {
+					"sample"	: self.sample + j - 2,
+					"op"		: op,
+					"address"	: self._value(address, j-1),
+					"data"		: self._value(data, j-1)
+				}
@@ -0,0 +1,362 @@
+import time
+import struct
+from gumbi import Gumbi
+from configuration import Configuration
+
+class Emulator:
+	"""
+	Software stand-in for the Gumbi board, which implements the Gumbi board side of the protocol
+	for the debug, GPIO, parallel and monitor modes. Target chips are emulated as a flat block of
+	memory, and pins read back the last value written to them.
+
+	To use the emulator instead of a Gumbi board, set Gumbi.TRANSPORT:
+
+		Gumbi.TRANSPORT = Emulator()
+
+	Responses are generated as soon as the request is received, so the emulator is useful for
+	measuring host side overhead, but not for estimating real Gumbi board throughput.
+
+	Like the Gumbi board, the emulator abandons a transfer if the host stops sending part way through
+	it for Gumbi.ESCAPE_TIMEOUT seconds, and then discards everything until Gumbi.SYNC is received.
+	"""
+
+	BOARD_ID = "Gumbi Emulator"
+	FIRMWARE_ID = "emulator"
+	XFER_BUFFER_SIZE = 128
+
+	def __init__(self, num_pins=64, memory_size=0x100000):
+		"""
+		Class constructor.
+
+		@num_pins    - The number of I/O pins to emulate.
+		@memory_size - The size of the emulated target chip, in bytes.
+
+		Returns None.
+		"""
+		self.num_pins = num_pins
+		self.default_pins = num_pins
+		self.memory = bytearray("\xFF" * memory_size)
+		self.pins = bytearray(Gumbi.MAX_PINS)
+		self.voltage = 0
+		self.unpacker = Configuration({}, None, num_pins=Gumbi.MAX_PINS)
+		self.config_size = len(self.unpacker.Pack(0, 0, 0))
+
+		self.handlers = {
+			Gumbi.NOP		: self._nop,
+			Gumbi.PING		: self._ping,
+			Gumbi.INFO		: self._info,
+			Gumbi.GID		: self._id,
+			Gumbi.SPEEDTEST		: self._speed_test,
+			Gumbi.XFER		: self._xfer_test,
+			Gumbi.GETPINCOUNT	: self._get_pin_count,
+			Gumbi.SETPINCOUNT	: self._set_pin_count,
+			Gumbi.SCANBUS		: self._scan_bus,
+			Gumbi.VOLTAGE		: self._voltage,
+			Gumbi.GPIO		: self._gpio,
+			Gumbi.PARALLEL		: self._parallel,
+			Gumbi.MONITOR		: self._monitor
+		}
+
+		self.inbuf = ''
+		self.outbuf = ''
+		self.outpos = 0
+		self.pending = []
+		self.rx_time = 0
+		self.timed = False
+		self.device = self._device()
+		self.need = self.device.next()
+
+	def __call__(self, port=None):
+		"""
+		Transport factory, called by Gumbi._open. All Gumbi instances share the same emulated board.
+
+		Returns self.
+		"""
+		return self
+
+	def _send(self, data):
+		"""
+		Queues data to be read by the host. For internal use only.
+		"""
+		self.pending.append(data)
+
+	def _ack(self):
+		self._send("A\n")
+
+	def _nack(self, reason=''):
+		self._send("N\n" + reason)
+
+	def _device(self):
+		"""
+		Generator implementing the Gumbi board main loop. Yields the number of bytes it needs next,
+		and receives those bytes from write(). For internal use only.
+		"""
+		while True:
+			mode = ord((yield 1))
+
+			if not self.handlers.has_key(mode):
+				self._nack("The specified mode is not implemented [0x%X]\n" % mode)
+				continue
+
+			# Always ACK if the specified mode was identified
+			self._ack()
+
+			# Run the mode handler generator until it returns, passing data requests through
+			handler = self.handlers[mode]()
+			try:
+				need = handler.next()
+				while True:
+					need = handler.send((yield need))
+			except StopIteration:
+				pass
+
+	def _sync(self):
+		"""
+		Generator that discards data until Gumbi.SYNC is received, then runs the Gumbi board main loop.
+		For internal use only.
+		"""
+		i = 0
+		while i < len(Gumbi.SYNC):
+			byte = (yield 1)
+			if byte == Gumbi.SYNC[i]:
+				i += 1
+			elif byte == Gumbi.SYNC[0]:
+				i = 1
+			else:
+				i = 0
+
+		device = self._device()
+		need = device.next()
+		while True:
+			need = device.send((yield need))
+
+	def _escape(self):
+		"""
+		Abandons the current transfer, as the Gumbi board does when the host stops sending part way
+		through it. For internal use only.
+		"""
+		self._nack()
+		self.inbuf = ''
+		self.timed = False
+		self.device = self._sync()
+		self.need = self.device.next()
+
+	def _nop(self):
+		return
+		yield
+
+	def _ping(self):
+		self._ack()
+		return
+		yield
+
+	def _info(self):
+		self._send("Board ID: %s\n" % self.BOARD_ID)
+		self._send("Firmware Version: %s\n" % self.FIRMWARE_ID)
+		self._send("I/O Chip Count: %d\n" % (self.num_pins / 16))
+		self._send("I/O Pin Count: %d\n" % self.num_pins)
+		self._send("Voltage: %d.%dv\n" % ((self.voltage >> 4), (self.voltage & 0x0F)))
+		self._ack()
+		return
+		yield
+
+	def _id(self):
+		self._send("%s\n" % self.BOARD_ID)
+		return
+		yield
+
+	def _get_pin_count(self):
+		self._send(chr(self.num_pins))
+		return
+		yield
+
+	def _set_pin_count(self):
+		self.num_pins = ord((yield 1))
+		self._send(chr(self.num_pins))
+
+	def _scan_bus(self):
+		self.num_pins = self.default_pins
+		self._send(chr(self.num_pins))
+		return
+		yield
+
+	def _voltage(self):
+		self.voltage = ord((yield 1))
+		self._ack()
+
+	def _speed_test(self):
+		count = struct.unpack("<I", (yield 4))[0]
+		self._send(Gumbi.DUMMY_BYTE * count)
+
+	def _xfer_test(self):
+		while True:
+			count = struct.unpack("<I", (yield 4))[0]
+
+			if count == 0:
+				self._ack()
+				return
+
+			# Data is echoed as it arrives, in blocks of the Gumbi board's XFER buffer size
+			while count > 0:
+				n = min(count, self.XFER_BUFFER_SIZE)
+				self._send((yield n))
+				count -= n
+
+	def _gpio(self):
+		while True:
+			(action, pin) = struct.unpack("BB", (yield 2))
+			data = None
+
+			if action in (Gumbi.HIGH, Gumbi.LOW):
+				self.pins[pin] = int(action == Gumbi.HIGH)
+			elif action == Gumbi.READ:
+				data = chr(self.pins[pin])
+			elif action == Gumbi.BATCH:
+				cmds = (yield (pin * 2))
+				for i in range(0, len(cmds), 2):
+					self.pins[ord(cmds[i+1])] = int(ord(cmds[i]) == Gumbi.HIGH)
+			elif action == Gumbi.READPORTS:
+				data = ''.join([chr(self._port(ord(port))) for port in (yield pin)])
+			elif action == Gumbi.WRITEPORTS:
+				entries = (yield (pin * 3))
+				for i in range(0, len(entries), 3):
+					(port, mask, value) = struct.unpack("BBB", entries[i:i+3])
+					for bit in range(0, Gumbi.PINS_PER_PORT):
+						if mask & (1 << bit):
+							self.pins[(port * Gumbi.PINS_PER_PORT) + bit] = (value >> bit) & 1
+			elif action == Gumbi.EXIT:
+				self._ack()
+				return
+			else:
+				self._nack("The specified GPIO action is not supported [0x%X]\n" % action)
+
+			self._ack()
+			if data is not None:
+				self._send(data)
+
+	def _port(self, port):
+		"""
+		Returns the value of the specified 8-bit port. For internal use only.
+		"""
+		value = 0
+		for bit in range(0, Gumbi.PINS_PER_PORT):
+			value |= (self.pins[(port * Gumbi.PINS_PER_PORT) + bit] << bit)
+		return value
+
+	def _parallel(self):
+		while True:
+			config = self.unpacker.Unpack((yield self.config_size))
+
+			if config["ACTION"] == Gumbi.EXIT:
+				self._ack()
+				return
+
+			# Acknowledge receipt of the configuration data
+			self._ack()
+
+			size = 1
+			if len(config["DATA"]) > 8:
+				size = 2
+
+			start = (config["START"] * size) % len(self.memory)
+			count = config["COUNT"]
+
+			if config["ACTION"] == Gumbi.READ:
+				self._ack()
+				data = str(self.memory[start:start+count])
+				self._send(data + ("\xFF" * (count - len(data))))
+			elif config["ACTION"] == Gumbi.WRITE:
+				self._ack()
+				# The Gumbi board ACKs each byte written, and escapes if the host stops sending them
+				for i in range(0, count):
+					self.timed = True
+					byte = (yield 1)
+					if (start + i) < len(self.memory):
+						self.memory[start+i] = byte
+					self._ack()
+			elif config["ACTION"] == Gumbi.COMMAND:
+				self._ack()
+				self._ack()
+			else:
+				self._nack("The specified action is not supported [0x%X]\n" % config["ACTION"])
+
+	def _monitor(self):
+		while True:
+			count = struct.unpack("<I", (yield 4))[0]
+
+			if count == 0:
+				self._ack()
+				return
+
+			sample = ''.join([chr(self._port(port)) for port in range(0, self.num_pins / Gumbi.PINS_PER_PORT)])
+			self._send(sample * count)
+
+	def _flush(self):
+		"""
+		Moves queued responses into the output buffer. For internal use only.
+		"""
+		if self.pending:
+			self.outbuf = self.outbuf[self.outpos:] + ''.join(self.pending)
+			self.outpos = 0
+			self.pending = []
+
+	def write(self, data):
+		"""
+		Processes data sent by the host.
+		"""
+		now = time.time()
+		if (self.inbuf or self.timed) and (now - self.rx_time) > Gumbi.ESCAPE_TIMEOUT:
+			self._escape()
+		self.rx_time = now
+
+		self.inbuf += data
+
+		while len(self.inbuf) >= self.need:
+			chunk = self.inbuf[:self.need]
+			self.inbuf = self.inbuf[self.need:]
+			self.timed = False
+			self.need = self.device.send(chunk)
+
+		return len(data)
+
+	def read(self, n=1):
+		"""
+		Returns up to n bytes of response data. Returns fewer than n bytes if no more data is available, as a serial port read would after a timeout.
+		"""
+		if (len(self.outbuf) - self.outpos) < n:
+			self._flush()
+
+		data = self.outbuf[self.outpos:self.outpos+n]
+		self.outpos += len(data)
+		return data
+
+	def readline(self):
+		"""
+		Returns a new-line terminated line of response data.
+		"""
+		i = self.outbuf.find('\n', self.outpos)
+		if i < 0:
+			self._flush()
+			i = self.outbuf.find('\n', self.outpos)
+			if i < 0:
+				i = len(self.outbuf) - 1
+
+		return self.read(i + 1 - self.outpos)
+
+	def flushInput(self):
+		self._flush()
+		self.outbuf = ''
+		self.outpos = 0
+
+	def flushOutput(self):
+		pass
+
+	def close(self):
+		"""
+		Closing the serial port drops DTR, which makes the Gumbi board abandon any mode it is part way through.
+		The emulator doesn't then wait for Gumbi.SYNC, as TRANSPORT connections are not Reset when opened.
+		"""
+		self.inbuf = ''
+		self.timed = False
+		self.device = self._device()
+		self.need = self.device.next()
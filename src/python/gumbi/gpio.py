@@ -1,6 +1,79 @@
+import time
+import math
+from contextlib import contextmanager
 from gumbi import *
 from configuration import *
 
+class Sequence:
+	"""
+	Class for describing a series of pin state vectors to be played back by GPIO.Play.
+
+	Each step sets a group of pins, then waits for a delay period before the next step is applied.
+	Pins that are not included in a step are left untouched. Example:
+
+		seq = Sequence()
+		seq.Step(high=[1], low=[2], delay=0.01)
+		seq.Step(high=[2], low=[1], delay=0.01)
+		stats = io.Play(seq, loops=100)
+	"""
+
+	def __init__(self):
+		"""
+		Class constructor.
+
+		Returns None.
+		"""
+		self.steps = []
+
+	def __len__(self):
+		"""
+		Returns the number of steps in the sequence.
+		"""
+		return len(self.steps)
+
+	def Vector(self, value, mask, delay=0):
+		"""
+		Appends a step to the sequence, specified as bitmasks.
+
+		@value - An integer bitmask of pin states; bit 0 is pin 1, bit 1 is pin 2, and so on.
+		@mask  - An integer bitmask of the pins to set in this step.
+		@delay - The number of seconds to wait after this step is applied.
+
+		Returns None.
+		"""
+		self.steps.append((value & mask, mask, delay))
+
+	def Step(self, high=[], low=[], delay=0):
+		"""
+		Appends a step to the sequence.
+
+		@high  - A list of pins to set high.
+		@low   - A list of pins to set low.
+		@delay - The number of seconds to wait after this step is applied.
+
+		Returns None.
+		"""
+		value = 0
+		mask = 0
+
+		for pin in high:
+			value |= (1 << (pin - 1))
+			mask |= (1 << (pin - 1))
+		for pin in low:
+			mask |= (1 << (pin - 1))
+
+		self.Vector(value, mask, delay)
+
+	def Delay(self, delay):
+		"""
+		Appends a step that does not change any pins.
+
+		@delay - The number of seconds to wait.
+
+		Returns None.
+		"""
+		self.Vector(0, 0, delay)
+
 class GPIO(Gumbi):
 	"""
 	Class to provide raw read/write access to all I/O pins.
@@ -8,6 +81,9 @@ class GPIO(Gumbi):
 
 	MODE = "GPIO"
 
+	# Play() sleeps until this many seconds before a step is due, then busy-waits for the remainder
+	SPIN_PERIOD = 0.002
+
 	def __init__(self, config=None, voltage=None, port=None):
 		"""
 		Class constructor.
@@ -16,8 +92,12 @@ class GPIO(Gumbi):
 
 		Returns None.
 		"""
+		self.queue = []
+		self.buffering = 0
 		self.config = Configuration(config, self.MODE, port)
 		Gumbi.__init__(self, port=port)
+		self.num_pins = self.config.num_pins
+		self.num_ports = self.num_pins / self.PINS_PER_PORT
 		if voltage is not None:
 			self.SetVoltage(voltage)
 		self.SetMode(self.GPIO)
@@ -27,8 +107,8 @@ class GPIO(Gumbi):
 		"""
 		Sets the Vcc and GND pins specified in the config file. For internal use only.
 		"""
-		self.PinsHigh(self.config.CONFIG["VCC"])
-		self.PinsLow(self.config.CONFIG["GND"])
+		self.PinsHigh(self.config.GetSetting("VCC"))
+		self.PinsLow(self.config.GetSetting("GND"))
 
 	def _send_command(self, cmd, pin):
 		"""
@@ -40,12 +120,132 @@ class GPIO(Gumbi):
 		# GPIO mode will return an ACK once the specified command is completed
 		self.ReadAck()
 
+	def _queue_command(self, cmd, pin):
+		"""
+		Sends a GPIO command, or adds it to the command buffer if buffering is enabled.
+		The command buffer is flushed automatically when it is full.
+
+		Returns None.
+		"""
+		if self.buffering:
+			self.queue.append((cmd, pin))
+			if len(self.queue) >= self.MAX_GPIO_COMMANDS:
+				self.Flush()
+		else:
+			self._send_command(cmd, pin)
+
+	def _send_batch(self, cmds):
+		"""
+		Sends a list of (command, pin) tuples to the Gumbi board as a single batch.
+
+		Returns None.
+		"""
+		data = [self.BATCH, len(cmds)]
+		for (cmd, pin) in cmds:
+			data += [cmd, pin]
+
+		self.WriteBytes(self.PackBytes(data))
+		# GPIO mode will return one ACK once all commands in the batch are completed
+		self.ReadAck()
+
+	def _port_entries(self, value, mask):
+		"""
+		Converts pin value and mask bitmasks to a list of (port, mask, value) tuples. For internal use only.
+		"""
+		ports = []
+
+		for port in range(0, self.num_ports):
+			shift = port * self.PINS_PER_PORT
+			pmask = (mask >> shift) & 0xFF
+			if pmask:
+				ports.append((port, pmask, (value >> shift) & 0xFF))
+
+		return ports
+
+	def _pack_ports(self, ports):
+		"""
+		Packs a list of (port, mask, value) tuples into WRITEPORTS commands. For internal use only.
+
+		Returns a list of packed command strings.
+		"""
+		frames = []
+
+		for i in range(0, len(ports), self.MAX_PORTS):
+			chunk = ports[i:i+self.MAX_PORTS]
+			data = [self.WRITEPORTS, len(chunk)]
+			for entry in chunk:
+				data += list(entry)
+			frames.append(self.PackBytes(data))
+
+		return frames
+
+	def _write_ports(self, ports):
+		"""
+		Sends a list of (port, mask, value) tuples to the Gumbi board in a single command.
+
+		Returns None.
+		"""
+		self.Flush()
+
+		for frame in self._pack_ports(ports):
+			self.WriteBytes(frame)
+			self.ReadAck()
+
 	def _exit(self):
 		"""
 		Exits GPIO mode. For internal use only.
 		"""
+		self.Flush()
 		self._send_command(self.EXIT, 0)
 
+	def Flush(self):
+		"""
+		Sends all buffered pin commands to the Gumbi board.
+
+		Commands are sent in batches of up to MAX_GPIO_COMMANDS commands. The Gumbi board applies 
+		each batch at once, so a batch is cut short if a pin appears in it more than once; this 
+		preserves pulses that are queued within a single buffer.
+
+		Returns None.
+		"""
+		batch = []
+		pins = set()
+
+		for (cmd, pin) in self.queue:
+			if pin in pins:
+				self._send_batch(batch)
+				batch = []
+				pins = set()
+
+			batch.append((cmd, pin))
+			pins.add(pin)
+
+		if batch:
+			self._send_batch(batch)
+
+		self.queue = []
+
+	@contextmanager
+	def Buffered(self):
+		"""
+		Context manager that buffers all pin set commands issued within the context, and flushes
+		them when the context exits. Contexts may be nested; the buffer is flushed when the 
+		outermost context exits. Example:
+
+			with io.Buffered():
+				io.PinHigh(1)
+				io.PinLow(2)
+
+		Returns a context manager.
+		"""
+		self.buffering += 1
+		try:
+			yield self
+		finally:
+			self.buffering -= 1
+			if not self.buffering:
+				self.Flush()
+
 	def PinHigh(self, pin):
 		"""
 		Sets the specified pin high.
@@ -54,18 +254,20 @@ class GPIO(Gumbi):
 
 		Returns None.
 		"""
-		self._send_command(self.HIGH, self.Pin2Real(pin))
+		self._queue_command(self.HIGH, self.Pin2Real(pin))
 
 	def PinsHigh(self, pins):
 		"""
 		Sets the specified pins high.
+		These pin set commands are buffered, then flushed at once.
 
 		@pins   - A list of pins to set high.
 
 		Returns None.
 		"""
-		for pin in pins:
-			self.PinHigh(pin)
+		with self.Buffered():
+			for pin in pins:
+				self.PinHigh(pin)
 
 	def PinLow(self, pin):
 		"""
@@ -75,18 +277,20 @@ class GPIO(Gumbi):
 
 		Returns None.
 		"""
-		self._send_command(self.LOW, self.Pin2Real(pin))
+		self._queue_command(self.LOW, self.Pin2Real(pin))
 
 	def PinsLow(self, pins):
 		"""
 		Sets the specified pins low.
+		These pin set commands are buffered, then flushed at once.
 		
 		@pins   - A list of pins to set low.
 
 		Returns None.
 		"""
-		for pin in pins:
-			self.PinLow(pin)
+		with self.Buffered():
+			for pin in pins:
+				self.PinLow(pin)
 
 	def SetPins(self, high, low):
 		"""
@@ -95,14 +299,15 @@ class GPIO(Gumbi):
 		These pin set commands are buffered, then flushed at once.
 
 		@high   - A list of pins to set high.
-		@low    - A list of pins to set high.
+		@low    - A list of pins to set low.
 
 		Returns None.
 		"""
-		for pin in high:
-			self.PinHigh(pin)
-		for pin in low:
-			self.PinLow(pin)
+		with self.Buffered():
+			for pin in high:
+				self.PinHigh(pin)
+			for pin in low:
+				self.PinLow(pin)
 
 	def ReadPin(self, pin):
 		"""
@@ -112,6 +317,8 @@ class GPIO(Gumbi):
 
 		Returns 1 if the pin is high, 0 if low.
 		"""
+		# Any buffered pin commands must be processed before the pin is read
+		self.Flush()
 		self._send_command(self.READ, self.Pin2Real(pin))
 		return ord(self.ReadBytes()[0])
 
@@ -130,3 +337,148 @@ class GPIO(Gumbi):
 			states.append(self.ReadPin(pin))
 
 		return states
+
+	def ReadPorts(self, ports):
+		"""
+		Immediately reads the GPIO registers of the specified ports in a single command.
+		Each port contains 8 pins: port 0 is pins 1-8, port 1 is pins 9-16, and so on.
+		Pin directions are not changed, so the states of output pins are read back as well.
+
+		@ports - A list of port numbers to read.
+
+		Returns a bytearray of port values, one per port. Bit 0 of each value is the lowest numbered pin in the port.
+		"""
+		values = bytearray()
+
+		# Any buffered pin commands must be processed before the ports are read
+		self.Flush()
+
+		for i in range(0, len(ports), self.MAX_PORTS):
+			chunk = list(ports[i:i+self.MAX_PORTS])
+			self.WriteBytes(self.PackBytes([self.READPORTS, len(chunk)] + chunk))
+			self.ReadAck()
+			values += bytearray(self.ReadBytes(len(chunk)))
+
+		return values
+
+	def ReadAll(self):
+		"""
+		Immediately reads the state of all pins in a single command. Pin directions are not changed.
+
+		Returns an integer bitmask of pin states; bit 0 is pin 1, bit 1 is pin 2, and so on.
+		"""
+		mask = 0
+		values = self.ReadPorts(range(0, self.num_ports))
+
+		for i in range(0, len(values)):
+			mask |= (values[i] << (i * self.PINS_PER_PORT))
+
+		return mask
+
+	def WriteAll(self, value, mask=None):
+		"""
+		Immediately sets the state of multiple pins in a single command.
+		Pins selected by mask are configured as outputs and set according to value; other pins are left untouched.
+
+		@value - An integer bitmask of pin states; bit 0 is pin 1, bit 1 is pin 2, and so on.
+		@mask  - An integer bitmask of the pins to set. Defaults to all pins.
+
+		Returns None.
+		"""
+		if mask is None:
+			mask = (1 << self.num_pins) - 1
+
+		self._write_ports(self._port_entries(value, mask))
+
+	def Compile(self, sequence):
+		"""
+		Compiles a Sequence into the commands that will be sent to the Gumbi board.
+		Each step is compiled into a single WRITEPORTS command, so each step costs one round trip.
+
+		@sequence - A Sequence instance.
+
+		Returns a list of (packed command string, delay) tuples, one per step.
+		"""
+		steps = []
+
+		for (value, mask, delay) in sequence.steps:
+			steps.append((''.join(self._pack_ports(self._port_entries(value, mask))), delay))
+
+		return steps
+
+	def Play(self, sequence, loops=1):
+		"""
+		Plays back a Sequence. The sequence is compiled before playback begins, and each step is 
+		scheduled relative to the start of playback, so timing errors do not accumulate.
+
+		@sequence - A Sequence instance, or a list of steps previously returned by Compile().
+		@loops    - The number of times to play the sequence. If 0, the sequence is played until interrupted.
+
+		Returns a dict of playback statistics:
+
+			steps		- Number of steps played.
+			elapsed		- Total playback time, in seconds.
+			rate		- Achieved step rate, in steps per second.
+			jitter_mean	- Mean difference between the scheduled and actual step times, in seconds.
+			jitter_max	- Maximum difference between the scheduled and actual step times, in seconds.
+			jitter_stddev	- Standard deviation of the differences between the scheduled and actual step times.
+		"""
+		if isinstance(sequence, Sequence):
+			steps = self.Compile(sequence)
+		else:
+			steps = sequence
+
+		n = 0
+		total = 0.0
+		squares = 0.0
+		worst = 0.0
+		loop = 0
+		offset = 0.0
+
+		self.Flush()
+		start = time.time()
+
+		try:
+			while loops == 0 or loop < loops:
+				for (frame, delay) in steps:
+					due = start + offset
+
+					# Sleep until just before the step is due, then spin for better accuracy
+					now = time.time()
+					if (due - now) > self.SPIN_PERIOD:
+						time.sleep(due - now - self.SPIN_PERIOD)
+					while time.time() < due:
+						pass
+
+					late = time.time() - due
+					if frame:
+						self.WriteBytes(frame)
+						self.ReadAck()
+
+					n += 1
+					total += late
+					squares += (late * late)
+					worst = max(worst, late)
+					offset += delay
+				loop += 1
+		except KeyboardInterrupt:
+			if loops:
+				raise
+
+		elapsed = time.time() - start
+		stats = {
+			"steps"		: n,
+			"elapsed"	: elapsed,
+			"rate"		: 0.0,
+			"jitter_mean"	: 0.0,
+			"jitter_max"	: worst,
+			"jitter_stddev"	: 0.0
+		}
+
+		if n:
+			stats["jitter_mean"] = total / n
+			stats["jitter_stddev"] = math.sqrt(max((squares / n) - (stats["jitter_mean"] ** 2), 0))
+		if elapsed > 0:
+			stats["rate"] = n / elapsed
+
+		return stats
@@ -4,6 +4,9 @@ import time
 import math
 import struct
 import serial
+from progress import Progress
+from metrics import Metrics
+from trace import Trace
 	
 class Gumbi:
 	"""
@@ -16,16 +19,48 @@ class Gumbi:
 	subclass has overridden the method (with few exceptions, overriding Gumbi methods is undesirable).
 	"""
 
+	# If True, all communications are traced to DEBUG_TRACE. See Trace.
 	DEBUG = False
+	DEBUG_TRACE = "gumbi.trace"
+
+	# Trace instance to record all communications to, shared by all instances
+	TRACE = None
+
+	# If set, a function that is called with the port name and returns a serial port-like object
+	# to use instead of a pyserial Serial port (i.e., a Replay instance). These are not Reset when opened.
+	TRANSPORT = None
+
+	# Protocol metrics, shared by all instances. See Metrics.
+	STATS = Metrics()
 
 	ACK = "A"
 	NACK = "N"
 	PINS_PER_PORT = 8
 	MAX_PINS = 128
+	MAX_PORTS = 16
 	MAX_COMMANDS = 32
 	MAX_GPIO_COMMANDS = 31
 	MAX_GPIO_BUFFER = 62
-	RESET_LEN = 1024
+	# Number of zero bytes sent by Reset; enough to complete and exit two configuration frames
+	RESET_LEN = 2048
+	# Maximum number of seconds that Reset may take
+	RESET_TIMEOUT = 2
+	# Board IDs reported in GID mode start with this (case insensitive)
+	ID_PREFIX = "GUMBI"
+	# Transfers with a progress callback are done in chunks of this many bytes
+	CHUNK_SIZE = 4096
+	# Reads and writes are split into segments of this many bytes, so that a failed transfer only has to repeat one segment
+	SEGMENT_SIZE = 0x8000
+	# Number of times a failed segment is retried before giving up
+	RETRIES = 3
+	# Seconds to wait for a response from the Gumbi board, on top of any configured CMDELAY
+	TIMEOUT = 5
+	# The Gumbi board abandons a transfer if the host stops sending part way through it for this many seconds
+	ESCAPE_TIMEOUT = 0.5
+	# After abandoning a transfer, the Gumbi board discards everything it receives until this is sent by Reset
+	SYNC = "GUMBI SYNC"
+	# When resynchronising, stale data is discarded until none has been received for this many seconds
+	DRAIN_TIME = 0.25
 	UNUSED = 0xFF
 	NULL = "\x00"
 	DUMMY_BYTE = "\xFF"
@@ -47,6 +82,26 @@ class Gumbi:
 	SCANBUS = 10
 	MONITOR = 11
 	VOLTAGE = 12
+	SPI = 13
+	JTAG = 14
+
+	MODE_NAMES = {
+		NOP		: "nop",
+		PARALLEL	: "parallel",
+		PING		: "ping",
+		INFO		: "info",
+		SPEEDTEST	: "speedtest",
+		GPIO		: "gpio",
+		GID		: "gid",
+		XFER		: "xfer",
+		GETPINCOUNT	: "getpincount",
+		SETPINCOUNT	: "setpincount",
+		SCANBUS		: "scanbus",
+		MONITOR		: "monitor",
+		VOLTAGE		: "voltage",
+		SPI		: "spi",
+		JTAG		: "jtag"
+	}
 
 	REGULATORS = {
 		0 	: 0x00,
@@ -64,6 +119,21 @@ class Gumbi:
 	HIGH = 3
 	LOW = 4
 	COMMAND = 5
+	BATCH = 6
+	READPORTS = 7
+	WRITEPORTS = 8
+
+	ACTION_NAMES = {
+		EXIT		: "EXIT",
+		READ		: "READ",
+		WRITE		: "WRITE",
+		HIGH		: "HIGH",
+		LOW		: "LOW",
+		COMMAND		: "COMMAND",
+		BATCH		: "BATCH",
+		READPORTS	: "READPORTS",
+		WRITEPORTS	: "WRITEPORTS"
+	}
 
 	MODE_KEY = "MODE"
 	MODE_VALUE = None
@@ -72,14 +142,20 @@ class Gumbi:
 		"""
 		Class constructor, opens a connection to the gumbi board.
 
-		@port - Gumbi board serial port, defaults to /dev/ttyACM0.
+		@port - Gumbi board serial port, defaults to /dev/ttyACM0. May also be an open serial
+			port-like object (i.e., a Board's SharedPort), which is used as is.
 		@new  - Set to False to not open a connection to the Gumbi board.
 
 		Returns None.
 		"""
 		self.ts = 0
+		self.tx_time = 0
 		self.port = port
 		self.num_pins = 0
+		self.progress = None
+
+		if self.DEBUG and Gumbi.TRACE is None:
+			Gumbi.TRACE = Trace(self.DEBUG_TRACE)
 
 		if new:
 			self._open()
@@ -89,8 +165,13 @@ class Gumbi:
 		Opens a connection to the Gumbi board. For internal use only.
 		"""
 	
-		if self.port is not None:
-			self.serial = serial.Serial(self.port)
+		if self.port is not None and not isinstance(self.port, basestring):
+			self.serial = self.port
+		elif self.TRANSPORT is not None:
+			self.serial = self.TRANSPORT(self.port)
+		elif self.port is not None:
+			self.serial = serial.Serial(self.port, timeout=self.TIMEOUT)
+			self.Reset()
 		else:	
 			n = 0
 			last_error = ''
@@ -99,7 +180,7 @@ class Gumbi:
 			while n < 10:
 				try:
 					self.port = prefix + str(n)
-					self.serial = serial.Serial(self.port)
+					self.serial = serial.Serial(self.port, timeout=self.TIMEOUT)
 					break
 				except Exception, e:
 					last_error = str(e)
@@ -111,6 +192,17 @@ class Gumbi:
 			else:
 				self.Reset()
 
+	def _enter(self):
+		"""
+		Place holder _enter method, called by Resync() to put the Gumbi board back in the
+		subclass's mode after it has been reset.
+
+		This should be overridden by subclasses that implement a mode.
+
+		Returns None.
+		"""
+		return None
+
 	def _exit(self):
 		"""
 		Place holder _exit method, called by Close(). 
@@ -135,6 +227,74 @@ class Gumbi:
 		self.serial.flushInput()
 		self.serial.flushOutput()
 
+	def _set_timeout(self, timeout):
+		"""
+		Sets the serial port's read timeout, if it has one. For internal use only.
+
+		@timeout - Timeout in seconds.
+
+		Returns the previous timeout.
+		"""
+		previous = getattr(self.serial, "timeout", None)
+		if hasattr(self.serial, "timeout") and previous != timeout:
+			self.serial.timeout = timeout
+		return previous
+
+	def _drain(self, seconds):
+		"""
+		Discards data from the Gumbi board until none has been received for DRAIN_TIME seconds,
+		or until the specified time has passed. For internal use only.
+
+		@seconds - Maximum number of seconds to spend draining.
+
+		Returns the number of bytes discarded.
+		"""
+		n = 0
+		deadline = time.time() + seconds
+		previous = self._set_timeout(self.DRAIN_TIME)
+
+		try:
+			self._flush_serial()
+			while time.time() < deadline:
+				data = self.serial.read(self.CHUNK_SIZE)
+				if not data:
+					break
+				n += len(data)
+		finally:
+			self._set_timeout(previous)
+
+		self.STATS.Count("bytes_drained", n)
+		return n
+
+	def Resync(self):
+		"""
+		Resynchronises with the Gumbi board after a failed transfer, and puts it back in this instance's mode.
+		Called by Read and Write before a failed segment is retried.
+
+		Stale responses are discarded until the board goes quiet, and until nothing has been sent to the
+		board for ESCAPE_TIMEOUT seconds. By then the board has abandoned any transfer that it was still
+		waiting for data for, and is discarding data until Reset sends SYNC, so neither the rest of the
+		failed transfer nor the zeros sent by Reset can be mistaken for data to write to the target chip.
+
+		Returns None.
+		"""
+		self.STATS.Count("resyncs")
+		self._drain(self.TIMEOUT)
+
+		idle = time.time() - self.tx_time
+		if idle < self.ESCAPE_TIMEOUT:
+			time.sleep(self.ESCAPE_TIMEOUT - idle)
+
+		self.Reset()
+		self._enter()
+
+	def Width(self):
+		"""
+		Returns the number of bytes stored at each target chip address.
+		Subclasses with wider data buses should override this.
+		"""
+		return 1
+
 	def StartTimer(self):
 		"""
 		Starts a timer.
@@ -234,24 +394,34 @@ class Gumbi:
 		"""
 		Reads an ACK/NACK from the Gumbi board. 
 
-		Returns True on ACK, raises an exception on NACK.
+		Returns True on ACK, raises an exception on NACK or if no response is received before the serial port times out.
 		"""
-		line = self.ReadText() 
+		line = self.ReadText()
+		self.STATS.Time("ack_latency", time.time() - self.tx_time)
 		if line != self.ACK:
-			if line == self.NACK:
+			if not line:
+				self.STATS.Count("timeouts")
+				raise Exception("Timed out waiting for ACK from Gumbi board")
+			elif line == self.NACK:
+				self.STATS.Count("nacks")
 				raise Exception("Received NACK from Gumbi board")
 			else:
+				self.STATS.Count("bad_acks")
 				raise Exception("Received unexpected response from Gumbi board: '%s'" % line)
+		self.STATS.Count("acks")
 		return True
 
 	def SetMode(self, mode):
 		"""
 		Puts the Gumbi board in the specified mode.
 
-		@mode - One of: NOP, PARALLEL, SPI, I2C, PING, INFO, SPEEDTEST, GPIO, GID, XFER, GETPINCOUNT
+		@mode - One of: NOP, PARALLEL, SPI, JTAG, I2C, PING, INFO, SPEEDTEST, GPIO, GID, XFER, GETPINCOUNT
 
 		Returns None.
 		"""
+		self.STATS.Count("commands", mode=self.MODE_NAMES.get(mode, mode))
+		if self.TRACE is not None:
+			self.TRACE.Mode(mode)
 		self.WriteBytes(self.PackByte(mode))
 		# ACK acknowledges the receipt of a valid mode
 		self.ReadAck()
@@ -263,41 +433,63 @@ class Gumbi:
 		Returns the string read.
 		"""
 		raw = self.serial.readline()
-
-		if self.DEBUG:
-			print ""
-			print "ReadText():", raw
-			print ""
+		self.STATS.Count("bytes_in", len(raw))
+		if self.TRACE is not None:
+			self.TRACE.Receive(raw)
 
 		return raw.strip()
 
-	def ReadBytes(self, n=None, callback=None):
+	def ReadBytes(self, n=None, callback=None, transform=None):
 		"""
 		Reads n bytes of data from the Gumbi board.
 
-		@n - Number of bytes to read. If not specified, one byte is read.
+		@n         - Number of bytes to read. If not specified, one byte is read.
+		@callback  - Progress callback function, called after each CHUNK_SIZE bytes are received.
+		@transform - Transform instance (see transforms.py) to apply to each chunk as it is received.
 
-		Returns a string of bytes received from the Gumbi board.
+		Returns a string of bytes received from the Gumbi board. Raises an exception if fewer than n bytes
+		are received before the serial port times out.
 		"""
 		data = ''
+		rx = 0
+		raw = []
 
 		if n is None:
 			n = 1
 
 		try:
-			for i in range(0, n):
-				data += self.serial.read(1)
-				if callback is not None:
-					callback(i+1, n)
-		except Exception, e:
-			print "ReadBytes():", e
-
-		if self.DEBUG:
-			print ""
-			print "ReadBytes:", len(data)
-			for c in data:
-				print "\t0x%X" % ord(c)
-			print ""
+			if callback is None and transform is None:
+				# Nothing to report, so read everything in one go
+				data = self.serial.read(n)
+				rx = len(data)
+			else:
+				chunks = []
+				while rx < n:
+					chunk = self.serial.read(min(self.CHUNK_SIZE, n - rx))
+					if not chunk:
+						break
+					rx += len(chunk)
+					if self.TRACE is not None:
+						raw.append(chunk)
+					if transform is not None:
+						chunk = transform.Feed(chunk)
+					chunks.append(chunk)
+					if callback is not None:
+						callback(rx, n)
+				if transform is not None:
+					chunks.append(transform.Flush())
+				data = ''.join(chunks)
+		finally:
+			self.STATS.Count("bytes_in", rx)
+			if self.TRACE is not None:
+				if transform is not None:
+					self.TRACE.Receive(''.join(raw))
+				else:
+					self.TRACE.Receive(data)
+
+		if rx < n:
+			self.STATS.Count("timeouts")
+			raise Exception("Timed out waiting for data from Gumbi board (received %d of %d bytes)" % (rx, n))
 
 		return data
 
@@ -305,59 +497,161 @@ class Gumbi:
 		"""
 		Sends data to the Gumbi board.
 		
-		@data - String of bytes to send.
+		@data     - String of bytes to send.
+		@callback - Progress callback function, called after each CHUNK_SIZE bytes are sent.
 
 		Returns None.
 		"""
 		n = len(data)
-
-		try:
-			for i in range(0, n):
-				self.serial.write(data[i])
-				if callback is not None:
-					callback(i+1, n)
-		except Exception, e:
-			print "WriteBytes():", e
+		self.tx_time = time.time()
+		self.STATS.Count("bytes_out", n)
+		if self.TRACE is not None:
+			self.TRACE.Transmit(data)
+
+		if callback is None:
+			# Send everything in one go so that small frames go out in a single USB transfer
+			self.serial.write(data)
+		else:
+			for i in range(0, n, self.CHUNK_SIZE):
+				chunk = data[i:i+self.CHUNK_SIZE]
+				self.serial.write(chunk)
+				callback(i+len(chunk), n)
 
 		return None
 
-	def Read(self, start, count, callback=None):
+	def WriteConfig(self, action, start, count):
 		"""
-		Reads a number of bytes from the target chip, beginning at the given start address.
+		Packs the current configuration and sends it to the Gumbi board, along with the specified action.
+
+		@action - Action (READ, WRITE, EXIT, etc).
+		@start  - Start address.
+		@count  - Number of bytes.
+
+		Returns None.
+		"""
+		t = time.time()
+		frame = self.config.Pack(action, start, count)
+		self.STATS.Time("config_pack", time.time() - t)
+
+		# The Gumbi board waits CMDELAY seconds after running the configured commands, so allow for that in the timeout
+		cmdelay = self.config.GetSetting("CMDELAY")
+		if cmdelay:
+			self._set_timeout(self.TIMEOUT + (cmdelay[0] or 0))
+		else:
+			self._set_timeout(self.TIMEOUT)
+
+		if self.TRACE is not None:
+			self.TRACE.Action(action)
+		self.WriteBytes(frame)
+
+	def _retry(self, func, *args):
+		"""
+		Calls func with the specified arguments, resynchronising with the Gumbi board and
+		retrying up to RETRIES times if it fails. For internal use only.
+
+		Returns func's return value. Raises the last exception if all retries fail.
+		"""
+		attempt = 0
+
+		while True:
+			try:
+				return func(*args)
+			except Exception:
+				if attempt >= self.RETRIES:
+					raise
+				attempt += 1
+				self.STATS.Count("segment_retries")
+				self.Resync()
+
+	def _segments(self, start, count):
+		"""
+		Splits a transfer into segments of up to SEGMENT_SIZE bytes. For internal use only.
 
 		@start - Start address.
-		@count - Number of bytes to read.
+		@count - Number of bytes.
 
-		Returns a string of bytes read from the chip.
+		Returns a list of (address, offset, size) tuples.
 		"""
-		self.WriteBytes(self.config.Pack(self.READ, start, count))
-	
+		width = self.Width()
+		size = self.SEGMENT_SIZE - (self.SEGMENT_SIZE % width)
+		return [(start + (offset / width), offset, min(size, count - offset)) for offset in range(0, count, size)]
+
+	def _read_segment(self, start, count, callback):
+		"""
+		Reads a single segment. For internal use only.
+		"""
+		t = time.time()
+		self.STATS.Count("actions", action="read")
+
+		self.WriteConfig(self.READ, start, count)
 		# Receive the ACK indicating the provided configuration is valid
 		self.ReadAck()
 		# Receive the ACK indicating that the specified action is valid
 		self.ReadAck()
-	
-		return self.ReadBytes(count, callback)
+		self.STATS.Time("read_setup", time.time() - t)
+
+		t = time.time()
+		data = self.ReadBytes(count, callback)
+		self.STATS.Time("read_transfer", time.time() - t)
+		return data
 
-	def Write(self, start, data, callback=None):
+	def Read(self, start, count, callback=None, transform=None, checkpoint=None):
 		"""
-		Writes a number of bytes to the target chip, beginning at the given start address.
+		Reads a number of bytes from the target chip, beginning at the given start address.
 
-		@start - Address to start writing at.
-		@data  - String of data to write.
+		The data is read in segments of SEGMENT_SIZE bytes. If a segment times out or is short, the
+		Gumbi board is resynchronised and only that segment is read again (up to RETRIES times).
 
-		Returns True on success, raises and exception on failure.
+		@start      - Start address.
+		@count      - Number of bytes to read.
+		@callback   - Progress callback function.
+		@transform  - Transform instance to apply to the data as it is received.
+		@checkpoint - Function called after each segment is read, with the number of bytes read so far and the segment's data.
+
+		Returns a string of bytes read from the chip.
+		"""
+		chunks = []
+
+		for (address, offset, size) in self._segments(start, count):
+			progress = None
+			if callback is not None:
+				progress = lambda rx, n, offset=offset: callback(offset + rx, count)
+
+			data = self._retry(self._read_segment, address, size, progress)
+
+			# Transform whole segments, so that a retried segment doesn't leave the transform part way through a unit
+			if transform is not None:
+				data = transform.Feed(data)
+			chunks.append(data)
+
+			if checkpoint is not None:
+				checkpoint(offset + size, data)
+
+		if transform is not None:
+			chunks.append(transform.Flush())
+
+		return ''.join(chunks)
+
+	def _write_segment(self, start, data, callback):
 		"""
-		self.WriteBytes(self.config.Pack(self.WRITE, start, len(data)))
+		Writes a single segment. For internal use only.
+		"""
+		t = time.time()
+		self.STATS.Count("actions", action="write")
+
+		self.WriteConfig(self.WRITE, start, len(data))
 		# Receive the ACK indicating the provided configuration is valid
 		self.ReadAck()
 		# Receive the ACK indicating that the specified action is valid
 		self.ReadAck()
-	
+		self.STATS.Time("write_setup", time.time() - t)
+
+		t = time.time()
 		tx = 0
 		size = len(data)
 
 		# Write one byte at a time in order to wait for the ACK after each byte is processed.
+		# If this fails part way through, the rest of the segment is not sent; Resync recovers the board.
 		while tx < size:
 			self.WriteBytes(data[tx:tx+1])
 
@@ -366,15 +660,51 @@ class Gumbi:
 			tx += 1
 			if callback is not None:
 				callback(tx, size)
+
+		self.STATS.Time("write_transfer", time.time() - t)
+		return True
+
+	def Write(self, start, data, callback=None, transform=None, checkpoint=None):
+		"""
+		Writes a number of bytes to the target chip, beginning at the given start address.
+
+		The data is written in segments of SEGMENT_SIZE bytes. If a segment fails, the Gumbi board
+		is resynchronised and only that segment is written again (up to RETRIES times).
+
+		@start      - Address to start writing at.
+		@data       - String of data to write.
+		@callback   - Progress callback function.
+		@transform  - Transform instance to apply to the data before it is written.
+		@checkpoint - Function called after each segment is written, with the number of bytes written so far and the segment's data.
+
+		Returns True on success, raises and exception on failure.
+		"""
+		if transform is not None:
+			data = transform.Apply(data)
+
+		count = len(data)
+
+		for (address, offset, size) in self._segments(start, count):
+			progress = None
+			if callback is not None:
+				progress = lambda tx, n, offset=offset: callback(offset + tx, count)
+
+			segment = data[offset:offset+size]
+			self._retry(self._write_segment, address, segment, progress)
+
+			if checkpoint is not None:
+				checkpoint(offset + size, segment)
+
 		return True
 
 	def ExecuteCommands(self):
 		"""
-		Runs the commands listed in self.config.CONFIG["COMMANDS"] without any further actions.
+		Runs the commands listed in the "COMMANDS" configuration setting without any further actions.
 
 		Returns None.
 		"""
-		self.WriteBytes(self.config.Pack(self.COMMAND, 0, 0))
+		self.STATS.Count("actions", action="command")
+		self.WriteConfig(self.COMMAND, 0, 0)
 		# First ACK acknowledges the receipt of a valid configuration
 		self.ReadAck()
 		# Second ACK acknowledges the receipt of a valid action
@@ -420,33 +750,63 @@ class Gumbi:
 
 	def Reset(self):
 		"""
-		Attempts to reset the communications stream with the Gumbi board.
+		Resets the communications stream with the Gumbi board, and confirms that the board is idle.
 		This will exit out of any mode the Gumbi board may be stuck in from a previous unclosed session.
 
-		Returns None.
+		RESET_LEN zero bytes are sent first. Zero is the exit action (or count) in every mode, and a NOP
+		outside of a mode, so they leave the board waiting for a new mode whatever it was doing. SYNC is
+		sent next, which the board waits for after abandoning a transfer (and NACKs as unknown modes
+		otherwise). The board ID is then requested, and everything received before it (NOP ACKs, NACKs,
+		unread data, etc) is discarded.
+
+		Called automatically when a serial port is opened.
+
+		Returns the board ID. Raises an exception if the board does not respond within RESET_TIMEOUT seconds.
 		"""
-		#self.WriteBytes(chr(self.EXIT) * self.RESET_LEN)
-		#self._flush_serial()
-		return None
+		t = time.time()
+		deadline = t + self.RESET_TIMEOUT
+		previous = getattr(self.serial, "timeout", None)
+		line = ''
+
+		self.STATS.Count("resets")
+		self._flush_serial()
+
+		# The reset traffic depends on what state the board was in, so mark it in the trace for Replay to skip
+		if self.TRACE is not None:
+			self.TRACE.Note(Trace.RESET_BEGIN)
+
+		try:
+			self.WriteBytes((self.NULL * self.RESET_LEN) + self.SYNC + self.PackByte(self.GID))
+
+			while not line.upper().startswith(self.ID_PREFIX):
+				remaining = deadline - time.time()
+				if remaining <= 0:
+					raise Exception("Gumbi board did not respond to a reset within %s seconds" % self.RESET_TIMEOUT)
+				self._set_timeout(min(remaining, self.TIMEOUT))
+				line = self.ReadText()
+		finally:
+			self._set_timeout(previous)
+			if self.TRACE is not None:
+				self.TRACE.Note(Trace.RESET_END)
+
+		self.STATS.Time("reset", time.time() - t)
+		return line
 
 	def PrintProgress(self, current, total):
 		"""
-		Displays a progress bar to stdout.
+		Displays a progress bar to stdout. Updates are rate limited, so this may be passed
+		as a callback to Read/Write regardless of how often the callback is invoked.
+
+		To change how progress is reported, set self.progress to a custom Progress instance.
 
 		@current - Current number of bytes.
 		@total   - Total number of bytes.
 
 		Returns None.
 		"""
-		if current > total:
-			current = total
-
-		percent = (current / float(total)) * 100
-		marks = int(math.floor(percent / 2))
-		markstring = "#" * marks
-		dotstring = "." * (50 - marks)
-		sys.stdout.write("\r[%s%s] %0.2f%% (%d / %d)" % (markstring, dotstring, percent, current, total))
-		sys.stdout.flush()
+		if self.progress is None:
+			self.progress = Progress()
+		self.progress(current, total)
 
 	def Close(self):
 		"""
@@ -0,0 +1,297 @@
+import os
+import struct
+
+class Image:
+	"""
+	Sparse memory image, loaded from an Intel HEX, Motorola S-record, ELF or raw binary file. Example:
+
+		image = Image("firmware.hex")
+		for (address, data) in image.Segments():
+			print "0x%.8X: %d bytes" % (address, len(data))
+
+	Files are parsed as a stream, and only the populated address ranges are kept in memory, so memory
+	use is proportional to the amount of data in the image rather than the address range it spans.
+	Raw binary files are loaded as a single segment at address 0.
+	"""
+
+	IHEX = "ihex"
+	SREC = "srec"
+	ELF = "elf"
+	BINARY = "binary"
+
+	EXTENSIONS = {
+		".hex"	: IHEX,
+		".ihx"	: IHEX,
+		".ihex"	: IHEX,
+		".srec"	: SREC,
+		".s19"	: SREC,
+		".s28"	: SREC,
+		".s37"	: SREC,
+		".mot"	: SREC,
+		".elf"	: ELF
+	}
+
+	ELF_MAGIC = "\x7FELF"
+	PT_LOAD = 1
+
+	# S-record types that contain data, and the number of address bytes in each
+	SREC_DATA = {"1" : 2, "2" : 3, "3" : 4}
+
+	def __init__(self, path=None, fmt=None):
+		"""
+		Class constructor.
+
+		@path - Image file to load.
+		@fmt  - Image file format (IHEX, SREC, ELF or BINARY). If not specified, it is detected automatically.
+
+		Returns None.
+		"""
+		self.segments = []
+		self.start = None
+		self.chunks = []
+		self.end = None
+		self.format = None
+
+		if path is not None:
+			self.Load(path, fmt)
+
+	def Format(self, path):
+		"""
+		Detects the format of an image file from its extension or, failing that, its contents.
+
+		@path - Image file.
+
+		Returns one of IHEX, SREC, ELF or BINARY.
+		"""
+		ext = os.path.splitext(path)[1].lower()
+		if self.EXTENSIONS.has_key(ext):
+			return self.EXTENSIONS[ext]
+
+		fp = open(path, "rb")
+		head = fp.read(4)
+		fp.close()
+
+		if head == self.ELF_MAGIC:
+			return self.ELF
+		if head[:1] == ":" and all([c in "0123456789ABCDEFabcdef" for c in head[1:]]):
+			return self.IHEX
+		if head[:1] == "S" and head[1:2] and head[1:2] in "0123456789":
+			return self.SREC
+		return self.BINARY
+
+	def Load(self, path, fmt=None):
+		"""
+		Loads an image file. Data is added to any previously loaded data.
+
+		@path - Image file to load.
+		@fmt  - Image file format. If not specified, it is detected automatically.
+
+		Returns None.
+		"""
+		if fmt is None:
+			fmt = self.Format(path)
+
+		loaders = {
+			self.IHEX	: self._ihex,
+			self.SREC	: self._srec,
+			self.ELF	: self._elf,
+			self.BINARY	: self._binary
+		}
+
+		if not loaders.has_key(fmt):
+			raise Exception("Unsupported image format: %s" % fmt)
+
+		self.format = fmt
+		fp = open(path, "rb")
+		try:
+			loaders[fmt](fp, path)
+		finally:
+			fp.close()
+		self._flush()
+
+	def Add(self, address, data):
+		"""
+		Adds data to the image. Data that is contiguous with the previously added data is appended to the same segment.
+
+		@address - Start address.
+		@data    - Data string.
+
+		Returns None.
+		"""
+		if not data:
+			return
+
+		if self.end != address:
+			self._flush()
+			self.start = address
+			self.end = address
+
+		self.chunks.append(data)
+		self.end += len(data)
+
+	def _flush(self):
+		"""
+		Closes the segment that is being built. For internal use only.
+		"""
+		if self.chunks:
+			self.segments.append((self.start, ''.join(self.chunks)))
+		self.start = None
+		self.end = None
+		self.chunks = []
+
+	def Segments(self):
+		"""
+		Returns a list of (address, data) tuples, sorted by address. Adjacent segments are merged;
+		where segments overlap, data added later takes precedence.
+		"""
+		self._flush()
+		order = sorted(range(0, len(self.segments)), key=lambda i: self.segments[i][0])
+		groups = []
+
+		# Group segments that overlap or abut each other
+		for i in order:
+			(address, data) = self.segments[i]
+			if groups and address <= groups[-1][1]:
+				groups[-1][1] = max(groups[-1][1], address + len(data))
+				groups[-1][2].append(i)
+			else:
+				groups.append([address, address + len(data), [i]])
+
+		segments = []
+		for (start, end, members) in groups:
+			if len(members) == 1:
+				segments.append(self.segments[members[0]])
+				continue
+
+			# Apply the segments in the order they were added, so that later data takes precedence
+			buf = bytearray(end - start)
+			for i in sorted(members):
+				(address, data) = self.segments[i]
+				buf[address-start:address-start+len(data)] = data
+			segments.append((start, str(buf)))
+
+		return segments
+
+	def Size(self):
+		"""
+		Returns the total number of bytes of data in the image.
+		"""
+		return sum([len(data) for (address, data) in self.Segments()])
+
+	def _ihex(self, fp, path):
+		"""
+		Parses an Intel HEX file. For internal use only.
+		"""
+		base = 0
+
+		for (n, line) in enumerate(fp):
+			line = line.strip()
+			if not line:
+				continue
+
+			if line[0] != ":":
+				raise Exception("%s line %d: invalid Intel HEX record" % (path, n + 1))
+
+			try:
+				record = bytearray(line[1:].decode("hex"))
+			except TypeError:
+				raise Exception("%s line %d: invalid Intel HEX record" % (path, n + 1))
+
+			if len(record) < 5 or len(record) != record[0] + 5:
+				raise Exception("%s line %d: invalid Intel HEX record length" % (path, n + 1))
+			if sum(record) & 0xFF:
+				raise Exception("%s line %d: Intel HEX checksum mismatch" % (path, n + 1))
+
+			rtype = record[3]
+			data = record[4:-1]
+
+			if rtype == 0x00:
+				self.Add(base + ((record[1] << 8) | record[2]), str(data))
+			elif rtype == 0x01:
+				break
+			elif rtype == 0x02:
+				base = ((data[0] << 8) | data[1]) << 4
+			elif rtype == 0x04:
+				base = ((data[0] << 8) | data[1]) << 16
+
+	def _srec(self, fp, path):
+		"""
+		Parses a Motorola S-record file. For internal use only.
+		"""
+		for (n, line) in enumerate(fp):
+			line = line.strip()
+			if not line:
+				continue
+
+			if line[0] != "S" or len(line) < 2:
+				raise Exception("%s line %d: invalid S-record" % (path, n + 1))
+
+			try:
+				record = bytearray(line[2:].decode("hex"))
+			except TypeError:
+				raise Exception("%s line %d: invalid S-record" % (path, n + 1))
+
+			if len(record) < 1 or len(record) != record[0] + 1:
+				raise Exception("%s line %d: invalid S-record length" % (path, n + 1))
+			if (sum(record) & 0xFF) != 0xFF:
+				raise Exception("%s line %d: S-record checksum mismatch" % (path, n + 1))
+
+			rtype = line[1]
+			if self.SREC_DATA.has_key(rtype):
+				size = self.SREC_DATA[rtype]
+				address = 0
+				for byte in record[1:1+size]:
+					address = (address << 8) | byte
+				self.Add(address, str(record[1+size:-1]))
+			elif rtype in "789":
+				break
+
+	def _elf(self, fp, path):
+		"""
+		Loads the PT_LOAD segments of an ELF file, at their physical addresses. For internal use only.
+		"""
+		ident = fp.read(16)
+		if ident[:4] != self.ELF_MAGIC or len(ident) < 16:
+			raise Exception("%s: not an ELF file" % path)
+
+		if ident[5] == "\x02":
+			endian = ">"
+		else:
+			endian = "<"
+
+		if ident[4] == "\x02":
+			# ELF64: e_phoff, e_phentsize and e_phnum; program header p_type, p_offset, p_paddr and p_filesz
+			(phoff,) = struct.unpack(endian + "Q", self._read(fp, 32, 8, path))
+			(phentsize, phnum) = struct.unpack(endian + "HH", self._read(fp, 54, 4, path))
+			phdr = (endian + "IIQQQQ", 48)
+		else:
+			(phoff,) = struct.unpack(endian + "I", self._read(fp, 28, 4, path))
+			(phentsize, phnum) = struct.unpack(endian + "HH", self._read(fp, 42, 4, path))
+			phdr = (endian + "IIIII", 20)
+
+		for i in range(0, phnum):
+			fields = struct.unpack(phdr[0], self._read(fp, phoff + (i * phentsize), phdr[1], path))
+
+			if ident[4] == "\x02":
+				(ptype, flags, offset, vaddr, paddr, filesz) = fields
+			else:
+				(ptype, offset, vaddr, paddr, filesz) = fields
+
+			if ptype == self.PT_LOAD and filesz > 0:
+				self.Add(paddr, self._read(fp, offset, filesz, path))
+
+	def _read(self, fp, offset, size, path):
+		"""
+		Reads size bytes from offset in a file. For internal use only.
+		"""
+		fp.seek(offset)
+		data = fp.read(size)
+		if len(data) != size:
+			raise Exception("%s: file is truncated" % path)
+		return data
+
+	def _binary(self, fp, path):
+		"""
+		Loads a raw binary file at address 0. For internal use only.
+		"""
+		self.Add(0, fp.read())
@@ -0,0 +1,271 @@
+from binascii import hexlify, unhexlify
+from gumbi import Gumbi
+from configuration import Configuration
+
+class JTAG(Gumbi):
+	"""
+	Class for bit-banging JTAG devices.
+
+	TMS/TDI vectors are packed 8 clocks per byte and shifted in a single exchange with the Gumbi
+	board, which returns TDO as a packed bit string. All bit strings are least significant bit first
+	(bit 0 of byte 0 is the first bit clocked), the same order that JTAG shifts data. Example:
+
+		jtag = JTAG(config='board.conf')
+		idcode = jtag.ShiftDR("\\x00\\x00\\x00\\x00", 32)
+		jtag.Close()
+	"""
+
+	MODE = "JTAG"
+
+	# Maximum number of clocks per exchange; must be a multiple of 8
+	MAX_CLOCKS = 4096
+
+	TEST_LOGIC_RESET = "TEST-LOGIC-RESET"
+	RUN_TEST_IDLE = "RUN-TEST/IDLE"
+	SELECT_DR = "SELECT-DR-SCAN"
+	CAPTURE_DR = "CAPTURE-DR"
+	SHIFT_DR = "SHIFT-DR"
+	EXIT1_DR = "EXIT1-DR"
+	PAUSE_DR = "PAUSE-DR"
+	EXIT2_DR = "EXIT2-DR"
+	UPDATE_DR = "UPDATE-DR"
+	SELECT_IR = "SELECT-IR-SCAN"
+	CAPTURE_IR = "CAPTURE-IR"
+	SHIFT_IR = "SHIFT-IR"
+	EXIT1_IR = "EXIT1-IR"
+	PAUSE_IR = "PAUSE-IR"
+	EXIT2_IR = "EXIT2-IR"
+	UPDATE_IR = "UPDATE-IR"
+
+	# TAP state transitions: state : (next state if TMS=0, next state if TMS=1)
+	TAP = {
+		TEST_LOGIC_RESET	: (RUN_TEST_IDLE, TEST_LOGIC_RESET),
+		RUN_TEST_IDLE		: (RUN_TEST_IDLE, SELECT_DR),
+		SELECT_DR		: (CAPTURE_DR, SELECT_IR),
+		CAPTURE_DR		: (SHIFT_DR, EXIT1_DR),
+		SHIFT_DR		: (SHIFT_DR, EXIT1_DR),
+		EXIT1_DR		: (PAUSE_DR, UPDATE_DR),
+		PAUSE_DR		: (PAUSE_DR, EXIT2_DR),
+		EXIT2_DR		: (SHIFT_DR, UPDATE_DR),
+		UPDATE_DR		: (RUN_TEST_IDLE, SELECT_DR),
+		SELECT_IR		: (CAPTURE_IR, TEST_LOGIC_RESET),
+		CAPTURE_IR		: (SHIFT_IR, EXIT1_IR),
+		SHIFT_IR		: (SHIFT_IR, EXIT1_IR),
+		EXIT1_IR		: (PAUSE_IR, UPDATE_IR),
+		PAUSE_IR		: (PAUSE_IR, EXIT2_IR),
+		EXIT2_IR		: (SHIFT_IR, UPDATE_IR),
+		UPDATE_IR		: (RUN_TEST_IDLE, SELECT_DR),
+	}
+
+	# Cache of shortest TMS paths between TAP states, shared by all instances
+	PATHS = {}
+
+	def __init__(self, config=None, voltage=None, port=None):
+		"""
+		Class constructor.
+
+		@config  - Path to configuration file, or a dict of configuration settings.
+		@voltage - Target voltage.
+		@port    - Gumbi board serial port.
+
+		Returns None.
+		"""
+		self.state = None
+		self.config = Configuration(config, self.MODE, port)
+		Gumbi.__init__(self, port=port)
+		if voltage is not None:
+			self.SetVoltage(voltage)
+		self.SetMode(self.JTAG)
+
+		# The pin configuration is only sent once, when entering JTAG mode
+		self.WriteConfig(self.COMMAND, 0, 0)
+		# ACK indicates that the provided configuration is valid
+		self.ReadAck()
+
+		self.TAPReset()
+
+	def _exit(self):
+		"""
+		Exit JTAG mode. For internal use only.
+		"""
+		# A zero clock count exits JTAG mode
+		self.WriteBytes(self.Pack16(0))
+		self.ReadAck()
+
+	def _bits2long(self, data):
+		"""
+		Converts a packed, LSB first bit string to an integer. For internal use only.
+		"""
+		if not data:
+			return 0
+		return int(hexlify(data[::-1]), 16)
+
+	def _long2bits(self, value, count):
+		"""
+		Converts an integer to a packed, LSB first bit string of count bits. For internal use only.
+		"""
+		n = (count + 7) / 8
+		if n == 0:
+			return ''
+		value &= ((1 << (n * 8)) - 1)
+		return unhexlify("%0*x" % (n * 2, value))[::-1]
+
+	def _path(self, start, end):
+		"""
+		Returns a (tms, count) tuple of the shortest TMS sequence that moves the TAP from start to end.
+		For internal use only.
+		"""
+		key = (start, end)
+
+		if not self.PATHS.has_key(key):
+			# Breadth first search of the TAP state machine
+			paths = {start : (0, 0)}
+			queue = [start]
+
+			while queue and not paths.has_key(end):
+				state = queue.pop(0)
+				(tms, count) = paths[state]
+
+				for bit in (0, 1):
+					next = self.TAP[state][bit]
+					if not paths.has_key(next):
+						paths[next] = (tms | (bit << count), count + 1)
+						queue.append(next)
+
+			self.PATHS[key] = paths[end]
+
+		return self.PATHS[key]
+
+	def Clock(self, tms, tdi, count):
+		"""
+		Clocks the given TMS and TDI vectors out to the target.
+		Vectors longer than MAX_CLOCKS are sent over multiple exchanges.
+
+		@tms   - Packed TMS bit string.
+		@tdi   - Packed TDI bit string.
+		@count - Number of clocks.
+
+		Returns the TDO values sampled during each clock, as a packed bit string.
+		"""
+		tdo = []
+		i = 0
+
+		while i < count:
+			clocks = min(self.MAX_CLOCKS, count - i)
+			start = i / 8
+			end = start + ((clocks + 7) / 8)
+
+			# TMS and TDI bytes are interleaved so that the Gumbi board can clock them as they arrive
+			frame = [None] * ((end - start) * 2)
+			frame[0::2] = tms[start:end]
+			frame[1::2] = tdi[start:end]
+
+			self.WriteBytes(self.Pack16(clocks) + ''.join(frame))
+			# ACK indicates that the clock request was received
+			self.ReadAck()
+			tdo.append(self.ReadBytes(end - start))
+
+			i += clocks
+
+		return ''.join(tdo)
+
+	def _clock_long(self, tms, tdi, count):
+		"""
+		Clocks integer TMS and TDI vectors out to the target. For internal use only.
+
+		Returns the TDO vector as an integer.
+		"""
+		return self._bits2long(self.Clock(self._long2bits(tms, count), self._long2bits(tdi, count), count))
+
+	def TAPReset(self):
+		"""
+		Moves the TAP to the Test-Logic-Reset state by clocking TMS high five times.
+
+		Returns None.
+		"""
+		self._clock_long(0x1F, 0, 5)
+		self.state = self.TEST_LOGIC_RESET
+
+	def GoTo(self, state):
+		"""
+		Moves the TAP to the specified state, using the shortest path from the current state.
+
+		@state - The target TAP state.
+
+		Returns None.
+		"""
+		(tms, count) = self._path(self.state, state)
+		if count:
+			self._clock_long(tms, 0, count)
+		self.state = state
+
+	def Idle(self, clocks):
+		"""
+		Clocks the TAP in the Run-Test/Idle state.
+
+		@clocks - Number of clocks.
+
+		Returns None.
+		"""
+		self.GoTo(self.RUN_TEST_IDLE)
+		self._clock_long(0, 0, clocks)
+
+	def _shift(self, shift_state, data, bits, end):
+		"""
+		Shifts data through the IR or DR in a single vector. For internal use only.
+		"""
+		(tms1, n1) = self._path(self.state, shift_state)
+		# Exit1 is entered on the last data bit, so the path to the end state starts from there
+		exit1 = self.TAP[shift_state][1]
+		(tms2, n2) = self._path(exit1, end)
+
+		tms = tms1 | (1 << (n1 + bits - 1)) | (tms2 << (n1 + bits))
+		tdi = (self._bits2long(data) & ((1 << bits) - 1)) << n1
+
+		tdo = self._clock_long(tms, tdi, n1 + bits + n2)
+		self.state = end
+
+		return self._long2bits(tdo >> n1, bits)
+
+	def ShiftIR(self, data, bits, end=RUN_TEST_IDLE):
+		"""
+		Shifts data into the instruction register, from the current TAP state to the end state, in a single exchange.
+
+		@data - Packed, LSB first instruction bit string.
+		@bits - The number of bits to shift.
+		@end  - The TAP state to leave the TAP in.
+
+		Returns the bits shifted out of the instruction register, as a packed bit string.
+		"""
+		return self._shift(self.SHIFT_IR, data, bits, end)
+
+	def ShiftDR(self, data, bits, end=RUN_TEST_IDLE):
+		"""
+		Shifts data into the data register, from the current TAP state to the end state, in a single exchange.
+
+		@data - Packed, LSB first data bit string.
+		@bits - The number of bits to shift.
+		@end  - The TAP state to leave the TAP in.
+
+		Returns the bits shifted out of the data register, as a packed bit string.
+		"""
+		return self._shift(self.SHIFT_DR, data, bits, end)
+
+	def Benchmark(self, clocks=0x10000):
+		"""
+		Measures JTAG throughput by clocking the TAP in the Run-Test/Idle state.
+
+		@clocks - Number of clocks.
+
+		Returns the number of clocks per second.
+		"""
+		self.GoTo(self.RUN_TEST_IDLE)
+		vector = "\x00" * ((clocks + 7) / 8)
+
+		self.StartTimer()
+		self.Clock(vector, vector, clocks)
+		t = self.StopTimer()
+
+		if t <= 0:
+			return 0
+		return clocks / t
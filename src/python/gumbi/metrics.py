@@ -0,0 +1,294 @@
+import os
+import math
+import time
+import threading
+
+class Histogram:
+	"""
+	Fixed-size histogram of durations, with power-of-two microsecond buckets.
+	Bucket i counts durations less than 2**i microseconds; the last bucket counts everything else.
+	"""
+
+	BUCKETS = 32
+
+	def __init__(self):
+		"""
+		Class constructor.
+
+		Returns None.
+		"""
+		self.counts = [0] * self.BUCKETS
+		self.count = 0
+		self.sum = 0.0
+		self.min = None
+		self.max = None
+
+	def Add(self, seconds):
+		"""
+		Adds a duration to the histogram.
+
+		@seconds - The duration, in seconds.
+
+		Returns None.
+		"""
+		us = int(seconds * 1000000)
+		if us < 0:
+			us = 0
+		# The bit length of the microsecond count is the index of the first bucket whose bound exceeds it
+		i = min(len(bin(us)) - 2 if us else 0, self.BUCKETS - 1)
+		self.counts[i] += 1
+		self.count += 1
+		self.sum += seconds
+		if self.min is None or seconds < self.min:
+			self.min = seconds
+		if self.max is None or seconds > self.max:
+			self.max = seconds
+
+	def Bound(self, i):
+		"""
+		Returns the upper bound of bucket i, in seconds.
+		"""
+		return (1 << i) / 1000000.0
+
+	def Mean(self):
+		"""
+		Returns the mean duration, in seconds.
+		"""
+		if not self.count:
+			return 0
+		return self.sum / self.count
+
+	def Percentile(self, p):
+		"""
+		Returns an estimate of the given percentile, in seconds (the upper bound of the bucket it falls in).
+
+		@p - Percentile, 0 - 100.
+		"""
+		if not self.count:
+			return 0
+
+		target = self.count * (p / 100.0)
+		n = 0
+
+		for i in range(0, self.BUCKETS):
+			n += self.counts[i]
+			if n >= target and n > 0:
+				return min(self.Bound(i), self.max)
+		return self.max
+
+def Percentile(samples, p):
+	"""
+	Returns the p'th percentile of a sorted list of samples, using the nearest rank method.
+
+	@samples - Sorted list of samples.
+	@p       - Percentile, 0 - 100.
+
+	Returns None if there are no samples.
+	"""
+	if not samples:
+		return None
+	i = int(math.ceil((p / 100.0) * len(samples))) - 1
+	return samples[max(0, min(i, len(samples) - 1))]
+
+class Metrics:
+	"""
+	Thread-safe collection of counters and duration histograms.
+
+	Each counter and histogram is identified by a name and an optional set of labels, for example:
+
+		stats.Count("bytes_out", 64)
+		stats.Count("commands", mode="gpio")
+		stats.Time("ack_latency", 0.0012)
+	"""
+
+	def __init__(self):
+		"""
+		Class constructor.
+
+		Returns None.
+		"""
+		self.lock = threading.Lock()
+		self.Reset()
+
+	def _key(self, name, labels):
+		"""
+		Returns the dict key for the given name and labels. For internal use only.
+		"""
+		if labels:
+			return (name, tuple(sorted(labels.items())))
+		return (name, ())
+
+	def Reset(self):
+		"""
+		Clears all counters and histograms.
+
+		Returns None.
+		"""
+		self.lock.acquire()
+		self.counters = {}
+		self.histograms = {}
+		self.started = time.time()
+		self.lock.release()
+
+	def Count(self, name, n=1, **labels):
+		"""
+		Increments a counter.
+
+		@name   - Counter name.
+		@n      - Amount to increment the counter by.
+		@labels - Counter labels.
+
+		Returns None.
+		"""
+		key = self._key(name, labels)
+		self.lock.acquire()
+		self.counters[key] = self.counters.get(key, 0) + n
+		self.lock.release()
+
+	def Time(self, name, seconds, **labels):
+		"""
+		Adds a duration to a histogram.
+
+		@name    - Histogram name.
+		@seconds - Duration, in seconds.
+		@labels  - Histogram labels.
+
+		Returns None.
+		"""
+		key = self._key(name, labels)
+		self.lock.acquire()
+		if not self.histograms.has_key(key):
+			self.histograms[key] = Histogram()
+		self.histograms[key].Add(seconds)
+		self.lock.release()
+
+	def Counter(self, name, **labels):
+		"""
+		Returns the value of the specified counter.
+		"""
+		return self.counters.get(self._key(name, labels), 0)
+
+	def Histogram(self, name, **labels):
+		"""
+		Returns the specified Histogram instance, or None if nothing has been recorded for it.
+		"""
+		return self.histograms.get(self._key(name, labels))
+
+	def Snapshot(self):
+		"""
+		Returns a copy of all counters and histogram summaries as a dict:
+
+			{
+				"uptime"	: seconds since the last reset,
+				"counters"	: { "name{label=value}" : count, ... },
+				"histograms"	: { "name{label=value}" : { "count", "sum", "min", "max", "mean", "p50", "p99" }, ... }
+			}
+		"""
+		snap = {"uptime" : time.time() - self.started, "counters" : {}, "histograms" : {}}
+
+		self.lock.acquire()
+		try:
+			for (key, value) in self.counters.items():
+				snap["counters"][self._format_key(key)] = value
+
+			for (key, h) in self.histograms.items():
+				snap["histograms"][self._format_key(key)] = {
+					"count"	: h.count,
+					"sum"	: h.sum,
+					"min"	: h.min,
+					"max"	: h.max,
+					"mean"	: h.Mean(),
+					"p50"	: h.Percentile(50),
+					"p99"	: h.Percentile(99)
+				}
+		finally:
+			self.lock.release()
+
+		return snap
+
+	def _format_key(self, key, prefix=''):
+		"""
+		Formats a counter/histogram key as name{label="value",...}. For internal use only.
+		"""
+		(name, labels) = key
+		if not labels:
+			return prefix + name
+		return "%s%s{%s}" % (prefix, name, ','.join(['%s="%s"' % (k, v) for (k, v) in labels]))
+
+	def Report(self):
+		"""
+		Returns a list of human readable lines describing all counters and histograms.
+		"""
+		snap = self.Snapshot()
+		lines = ["Uptime: %.3f seconds" % snap["uptime"], ""]
+
+		if snap["counters"]:
+			lines.append("%-48s %16s" % ("Counter", "Value"))
+			for name in sorted(snap["counters"].keys()):
+				lines.append("%-48s %16d" % (name, snap["counters"][name]))
+			lines.append("")
+
+		if snap["histograms"]:
+			lines.append("%-48s %10s %12s %12s %12s %12s" % ("Latency", "Count", "Mean (ms)", "p50 (ms)", "p99 (ms)", "Max (ms)"))
+			for name in sorted(snap["histograms"].keys()):
+				h = snap["histograms"][name]
+				lines.append("%-48s %10d %12.3f %12.3f %12.3f %12.3f" % (name, h["count"], h["mean"] * 1000, h["p50"] * 1000, h["p99"] * 1000, h["max"] * 1000))
+			lines.append("")
+
+		return lines
+
+	def Prometheus(self, prefix="gumbi_"):
+		"""
+		Returns all counters and histograms in the Prometheus text exposition format.
+
+		@prefix - Prefix to prepend to all metric names.
+		"""
+		lines = []
+		types = {}
+
+		self.lock.acquire()
+		try:
+			for key in sorted(self.counters.keys()):
+				name = prefix + key[0] + "_total"
+				if not types.has_key(name):
+					types[name] = True
+					lines.append("# TYPE %s counter" % name)
+				lines.append("%s %d" % (self._format_key((name, key[1])), self.counters[key]))
+
+			for key in sorted(self.histograms.keys()):
+				h = self.histograms[key]
+				name = prefix + key[0] + "_seconds"
+				if not types.has_key(name):
+					types[name] = True
+					lines.append("# TYPE %s histogram" % name)
+
+				n = 0
+				for i in range(0, h.BUCKETS - 1):
+					n += h.counts[i]
+					labels = key[1] + (("le", "%g" % h.Bound(i)),)
+					lines.append("%s %d" % (self._format_key((name + "_bucket", labels)), n))
+				lines.append("%s %d" % (self._format_key((name + "_bucket", key[1] + (("le", "+Inf"),))), h.count))
+				lines.append("%s %f" % (self._format_key((name + "_sum", key[1])), h.sum))
+				lines.append("%s %d" % (self._format_key((name + "_count", key[1])), h.count))
+		finally:
+			self.lock.release()
+
+		return '\n'.join(lines) + '\n'
+
+	def WritePrometheus(self, path, prefix="gumbi_"):
+		"""
+		Atomically writes all metrics to a Prometheus textfile (i.e., for the node exporter's textfile collector).
+
+		@path   - Path to the output file; should end in .prom.
+		@prefix - Prefix to prepend to all metric names.
+
+		Returns None.
+		"""
+		tmp = "%s.%d.tmp" % (path, os.getpid())
+		fp = open(tmp, "w")
+		try:
+			fp.write(self.Prometheus(prefix))
+		finally:
+			fp.close()
+		# Rename is atomic, so the collector never sees a partially written file
+		os.rename(tmp, path)
@@ -7,6 +7,8 @@ class Parallel(Gumbi):
 	"""
 
 	MODE = "PARALLEL"
+	# Default chip erase time in seconds, if the configuration file doesn't specify TSCE
+	DEFAULT_TSCE = 60
 	
 	def __init__(self, config=None, voltage=None, port=None):
 		"""
@@ -20,12 +22,71 @@ class Parallel(Gumbi):
 		Gumbi.__init__(self, port=port)
 		if voltage is not None:
 			self.SetVoltage(voltage)
+		self._enter()
+
+	def _enter(self):
+		"""
+		Enter parallel mode. For internal use only.
+		"""
 		self.SetMode(self.PARALLEL)
 	
 	def _exit(self):
 		"""
 		Exit parallel mode. For internal use only.
 		"""
-		self.WriteBytes(self.config.Pack(self.EXIT, 0, 0))
+		self.WriteConfig(self.EXIT, 0, 0)
 		# Wait for the board to acknowledge that it is exiting parallel mode
 		self.ReadAck()
+
+	def Width(self):
+		"""
+		Returns the number of bytes stored at each chip address (2 in word mode, 1 in byte mode).
+		"""
+		if len(self.config.GetSetting("DATA")) > 8:
+			return 2
+		return 1
+
+	def Align(self, count):
+		"""
+		Rounds a number of bytes up to a whole number of chip addresses. In word mode the Gumbi board
+		transfers whole words, so a transfer of an odd number of bytes would leave it waiting for (or
+		sending) the last byte of a partial word.
+
+		@count - Number of bytes.
+
+		Returns the rounded number of bytes.
+		"""
+		return count + ((self.Width() - (count % self.Width())) % self.Width())
+
+	def Pad(self, data):
+		"""
+		Pads data to be written with 0xFF bytes, up to a whole number of chip addresses (see Align).
+		Writing 0xFF leaves erased flash unchanged.
+
+		@data - String of data to write.
+
+		Returns the padded data.
+		"""
+		return data + ("\xFF" * (self.Align(len(data)) - len(data)))
+
+	def EraseChip(self):
+		"""
+		Runs the ERASE command set to erase the entire target chip. The Gumbi board waits for
+		TSCE seconds (DEFAULT_TSCE if not set) after running the commands.
+
+		Returns True.
+		"""
+		self.config.SetCommand("ERASE")
+
+		tsce = self.config.GetSetting("TSCE")
+		if tsce is None:
+			tsce = [self.DEFAULT_TSCE]
+
+		# The erase delay must only apply to the erase command, not to subsequent writes in the same session
+		cmdelay = self.config.GetSetting("CMDELAY")
+		self.config.SetSetting("CMDELAY", tsce)
+		try:
+			self.ExecuteCommands()
+		finally:
+			self.config.SetSetting("CMDELAY", cmdelay)
+		return True
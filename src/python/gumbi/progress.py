@@ -0,0 +1,211 @@
+import sys
+import time
+import math
+
+class Progress:
+	"""
+	Rate-limited progress reporter, suitable for use as a Read/Write callback.
+
+	Display updates are limited to one every interval seconds (or every step bytes, if specified),
+	regardless of how often the callback is invoked. Each update reports the overall throughput,
+	a moving-average throughput over the last window seconds, and the estimated time remaining.
+
+	On a TTY, a single progress bar line is redrawn in place. Otherwise, a plain text line is
+	written for each update, at a slower rate suitable for log files. To use a GUI or other
+	front end, pass an output function; it will be called with a dict for each update:
+
+		current   - Number of bytes transferred.
+		total     - Total number of bytes.
+		percent   - Percent complete.
+		elapsed   - Seconds since the transfer started.
+		rate      - Overall throughput, in bytes per second.
+		average   - Moving-average throughput, in bytes per second.
+		eta       - Estimated seconds remaining, or None if unknown.
+		done      - True if the transfer is complete.
+	"""
+
+	INTERVAL = 0.1
+	LOG_INTERVAL = 5.0
+	WINDOW = 5.0
+	BAR_WIDTH = 50
+
+	def __init__(self, interval=None, step=0, window=WINDOW, stream=None, tty=None, output=None):
+		"""
+		Class constructor.
+
+		@interval - Minimum number of seconds between updates. Defaults to INTERVAL on a TTY, LOG_INTERVAL otherwise.
+		@step     - If non-zero, also update every step bytes, even if interval seconds have not passed.
+		@window   - Number of seconds to average throughput over.
+		@stream   - File object to write progress to. Defaults to sys.stdout.
+		@tty      - Set to True or False to override TTY detection.
+		@output   - Function to call with each update, instead of writing to stream.
+
+		Returns None.
+		"""
+		if stream is None:
+			stream = sys.stdout
+		if tty is None:
+			try:
+				tty = stream.isatty()
+			except Exception:
+				tty = False
+		if interval is None:
+			if tty:
+				interval = self.INTERVAL
+			else:
+				interval = self.LOG_INTERVAL
+
+		self.interval = interval
+		self.step = step
+		self.window = window
+		self.stream = stream
+		self.tty = tty
+		self.output = output
+		self.Reset()
+
+	def Reset(self):
+		"""
+		Resets the progress state in preparation for a new transfer.
+
+		Returns None.
+		"""
+		self.start = None
+		self.last_time = 0
+		self.last_count = 0
+		self.samples = []
+
+	def __call__(self, current, total):
+		"""
+		Progress callback.
+
+		@current - Current number of bytes.
+		@total   - Total number of bytes.
+
+		Returns None.
+		"""
+		now = time.time()
+
+		# A count that has gone backwards means that a new transfer has started
+		if self.start is None or current < self.last_count:
+			self.Reset()
+			self.start = now
+			self.samples.append((now, 0))
+
+		if current > total:
+			current = total
+
+		done = (current >= total)
+
+		if not done and (now - self.last_time) < self.interval:
+			if not self.step or (current - self.last_count) < self.step:
+				return None
+
+		self.last_time = now
+		self.last_count = current
+		self.Update(self.Status(now, current, total, done))
+
+	def Status(self, now, current, total, done):
+		"""
+		Builds a progress status dict. See the class description for the dict format.
+		"""
+		self.samples.append((now, current))
+		# Discard samples that have fallen out of the moving average window, but always keep one
+		while len(self.samples) > 2 and (now - self.samples[1][0]) >= self.window:
+			self.samples.pop(0)
+
+		elapsed = now - self.start
+		(t0, c0) = self.samples[0]
+
+		rate = average = 0
+		eta = None
+
+		if elapsed > 0:
+			rate = current / elapsed
+		if now > t0:
+			average = (current - c0) / (now - t0)
+		if done:
+			eta = 0
+		elif average > 0:
+			eta = (total - current) / average
+
+		if total:
+			percent = (current / float(total)) * 100
+		else:
+			percent = 100.0
+
+		return {
+			"current"	: current,
+			"total"		: total,
+			"percent"	: percent,
+			"elapsed"	: elapsed,
+			"rate"		: rate,
+			"average"	: average,
+			"eta"		: eta,
+			"done"		: done
+		}
+
+	def Update(self, status):
+		"""
+		Displays a progress update. Override this, or pass an output function to the constructor, to change how progress is displayed.
+
+		@status - A status dict, as returned by Status().
+
+		Returns None.
+		"""
+		if self.output is not None:
+			self.output(status)
+		else:
+			line = self.Format(status)
+			if self.tty:
+				self.stream.write("\r" + line)
+			else:
+				self.stream.write(line + "\n")
+			self.stream.flush()
+
+	def Format(self, status):
+		"""
+		Formats a status dict as a line of text.
+
+		@status - A status dict, as returned by Status().
+
+		Returns a progress string.
+		"""
+		info = "%0.2f%% (%d / %d) %s/s" % (status["percent"], status["current"], status["total"], self.FormatBytes(status["average"]))
+
+		if status["done"]:
+			info += " in %s" % self.FormatTime(status["elapsed"])
+		elif status["eta"] is not None:
+			info += " ETA %s" % self.FormatTime(status["eta"])
+
+		if not self.tty:
+			return info
+
+		marks = int(math.floor(status["percent"] * self.BAR_WIDTH / 100))
+		bar = "[%s%s] " % ("#" * marks, "." * (self.BAR_WIDTH - marks))
+		# Pad out to erase any leftovers from a longer previous line
+		return (bar + info).ljust(self.BAR_WIDTH + 56)
+
+	def FormatBytes(self, n):
+		"""
+		Formats a byte count using binary unit prefixes.
+
+		@n - Number of bytes.
+
+		Returns a formatted string.
+		"""
+		for unit in ("B", "KiB", "MiB"):
+			if n < 1024:
+				return "%0.1f %s" % (n, unit)
+			n /= 1024.0
+		return "%0.1f GiB" % n
+
+	def FormatTime(self, seconds):
+		"""
+		Formats a number of seconds as H:MM:SS.
+
+		@seconds - Number of seconds.
+
+		Returns a formatted string.
+		"""
+		seconds = int(seconds + 0.5)
+		return "%d:%.2d:%.2d" % (seconds / 3600, (seconds / 60) % 60, seconds % 60)
@@ -0,0 +1,249 @@
+import time
+from gumbi import Gumbi
+from trace import Trace, ReadTrace
+
+class Replay:
+	"""
+	Serial port stand-in that plays back the Gumbi board side of a recorded session, so that host
+	code can be exercised and profiled without a Gumbi board attached.
+
+	Sessions are recorded with a Trace (with snaplen set to 0). To replay one, set Gumbi.TRANSPORT:
+
+		replay = Replay("session.trace")
+		Gumbi.TRANSPORT = replay
+		... run the same host code that was recorded ...
+		Gumbi.TRANSPORT = None
+		for line in replay.Report():
+			print line
+
+	All data sent by the host is verified to be byte-identical to the recorded session; an exception
+	is raised on the first difference. Traffic recorded during a Gumbi.Reset is not replayed, as Gumbi
+	instances don't reset transports when opening them. Data received from the Gumbi board is released to the host only
+	once the host has sent everything that preceded it in the recording.
+
+	Host CPU and wall clock time are accumulated per operation, where operations are delimited by the
+	mode and action annotations in the trace. With speed set to 0, data is returned as fast as possible,
+	which isolates host overhead from USB and Gumbi board latency.
+	"""
+
+	def __init__(self, path, speed=1.0):
+		"""
+		Class constructor.
+
+		@path  - Path to a trace file.
+		@speed - Gumbi board response delay multiplier. 1.0 replays the recorded timing, 0 replays as fast as possible.
+
+		Returns None.
+		"""
+		self.speed = speed
+		self.tx = []
+		self.rx = []
+		self.marks = []
+
+		tx_offset = 0
+		last_ts = None
+		resetting = False
+
+		for (rtype, ts, n, data) in ReadTrace(path):
+			if last_ts is None:
+				last_ts = ts
+
+			if rtype == Trace.NOTE and data in (Trace.RESET_BEGIN, Trace.RESET_END):
+				resetting = (data == Trace.RESET_BEGIN)
+				last_ts = ts
+
+			elif resetting:
+				continue
+
+			elif rtype == Trace.TX or rtype == Trace.RX:
+				if len(data) != n:
+					raise Exception("Trace %s was recorded with a snaplen, and can't be replayed" % path)
+
+				if rtype == Trace.TX:
+					self.tx.append(data)
+					tx_offset += n
+				else:
+					# Released after tx_offset bytes have been sent, delay seconds after the previous event
+					self.rx.append((tx_offset, ts - last_ts, data))
+				last_ts = ts
+
+			elif rtype == Trace.MODE:
+				self.marks.append((tx_offset, "mode:%s" % Gumbi.MODE_NAMES.get(ord(data), ord(data))))
+			elif rtype == Trace.ACTION:
+				self.marks.append((tx_offset, "action:%s" % str(Gumbi.ACTION_NAMES.get(ord(data), ord(data))).lower()))
+
+		self.tx = ''.join(self.tx)
+		self.Rewind()
+
+	def __call__(self, port=None):
+		"""
+		Transport factory, called by Gumbi._open. The same session is shared by all Gumbi instances.
+
+		Returns self.
+		"""
+		return self
+
+	def Rewind(self):
+		"""
+		Restarts playback from the beginning of the session, and clears all statistics.
+
+		Returns None.
+		"""
+		self.tx_pos = 0
+		self.rx_index = 0
+		self.mark_index = 0
+		self.buffer = ''
+		self.last_event = time.time()
+		self.stats = {}
+		self.op = None
+		self.op_cpu = 0
+		self.op_wall = 0
+		self._next_op("session")
+
+	def _cpu(self):
+		"""
+		Returns the CPU time used by this process. For internal use only.
+		"""
+		return time.clock()
+
+	def _charge(self):
+		"""
+		Charges the time spent since the last call to the current operation. For internal use only.
+		"""
+		cpu = self._cpu()
+		wall = time.time()
+
+		if self.op is not None:
+			stats = self.stats[self.op]
+			stats["cpu"] += cpu - self.op_cpu
+			stats["wall"] += wall - self.op_wall
+
+		self.op_cpu = cpu
+		self.op_wall = wall
+
+	def _next_op(self, label):
+		"""
+		Ends the current operation and begins a new one. For internal use only.
+		"""
+		self._charge()
+
+		if not self.stats.has_key(label):
+			self.stats[label] = {"count" : 0, "cpu" : 0.0, "wall" : 0.0, "tx" : 0, "rx" : 0}
+		self.stats[label]["count"] += 1
+		self.op = label
+
+	def _release(self):
+		"""
+		Moves the next block of recorded Gumbi board data into the receive buffer, if the host has sent
+		everything that preceded it. For internal use only.
+
+		Returns True if data was released, False if not.
+		"""
+		if self.rx_index >= len(self.rx) or self.rx[self.rx_index][0] > self.tx_pos:
+			return False
+
+		(offset, delay, data) = self.rx[self.rx_index]
+		self.rx_index += 1
+
+		if self.speed:
+			remaining = self.last_event + (delay * self.speed) - time.time()
+			if remaining > 0:
+				time.sleep(remaining)
+
+		self.last_event = time.time()
+		self.buffer += data
+		self.stats[self.op]["rx"] += len(data)
+		return True
+
+	def write(self, data):
+		"""
+		Verifies data sent by the host against the recorded session.
+		"""
+		while self.mark_index < len(self.marks) and self.marks[self.mark_index][0] <= self.tx_pos:
+			self._next_op(self.marks[self.mark_index][1])
+			self.mark_index += 1
+
+		expected = self.tx[self.tx_pos:self.tx_pos+len(data)]
+
+		if data != expected:
+			i = 0
+			while i < len(expected) and data[i] == expected[i]:
+				i += 1
+			if i >= len(expected):
+				raise Exception("Replay: host sent more data than was recorded (%d bytes past the end of the session)" % (len(data) - len(expected)))
+			raise Exception("Replay: host data differs from the recorded session at byte %d: sent 0x%.2X, expected 0x%.2X" % (self.tx_pos + i, ord(data[i]), ord(expected[i])))
+
+		self.tx_pos += len(data)
+		self.stats[self.op]["tx"] += len(data)
+		self.last_event = time.time()
+		return len(data)
+
+	def read(self, n=1):
+		"""
+		Returns n bytes of recorded Gumbi board data.
+		"""
+		while len(self.buffer) < n and self._release():
+			pass
+
+		if len(self.buffer) < n:
+			raise Exception("Replay: host read %d bytes, but only %d were recorded at this point in the session" % (n, len(self.buffer)))
+
+		data = self.buffer[:n]
+		self.buffer = self.buffer[n:]
+		return data
+
+	def readline(self):
+		"""
+		Returns a new-line terminated line of recorded Gumbi board data.
+		"""
+		while '\n' not in self.buffer and self._release():
+			pass
+
+		i = self.buffer.find('\n')
+		if i < 0:
+			raise Exception("Replay: host read a line, but none was recorded at this point in the session")
+
+		return self.read(i + 1)
+
+	def flushInput(self):
+		self.buffer = ''
+
+	def flushOutput(self):
+		pass
+
+	def close(self):
+		pass
+
+	def Done(self):
+		"""
+		Returns True if the entire recorded session has been played back.
+		"""
+		return (self.tx_pos >= len(self.tx) and self.rx_index >= len(self.rx) and not self.buffer)
+
+	def Stats(self):
+		"""
+		Returns a dict of per-operation statistics:
+
+			{
+				"operation" : {"count", "cpu", "wall", "tx", "rx"},
+				...
+			}
+
+		Operation names are "session" (everything before the first annotation), "mode:<mode name>" and "action:<action name>".
+		"""
+		# Charge the time spent in the current operation so far
+		self._charge()
+		return self.stats
+
+	def Report(self):
+		"""
+		Returns a list of human readable lines describing the per-operation statistics.
+		"""
+		stats = self.Stats()
+		lines = ["%-24s %8s %12s %12s %12s %12s" % ("Operation", "Count", "CPU (ms)", "Wall (ms)", "TX bytes", "RX bytes")]
+
+		for op in sorted(stats.keys()):
+			s = stats[op]
+			lines.append("%-24s %8d %12.3f %12.3f %12d %12d" % (op, s["count"], s["cpu"] * 1000, s["wall"] * 1000, s["tx"], s["rx"]))
+
+		return lines
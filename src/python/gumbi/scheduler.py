@@ -0,0 +1,535 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from gumbi import Gumbi
+from metrics import Percentile
+from board import Board
+from parallel import Parallel
+from monitor import Monitor
+from configuration import Configuration
+
+class Job:
+	"""
+	A unit of work for a Scheduler: a read, write or erase of a parallel chip, or a monitor capture.
+	"""
+
+	ACTIONS = ["read", "write", "erase", "monitor"]
+
+	def __init__(self, action, config=None, address=0, size=0, data=None, filename=None, samples=0, voltage=None):
+		"""
+		Class constructor.
+
+		@action   - One of ACTIONS.
+		@config   - Parallel configuration file or dict for the target chip (not used by monitor jobs).
+		@address  - Starting address.
+		@size     - Number of bytes to read. If 0, the chip size from the configuration file is read.
+		@data     - Data to write.
+		@filename - The file to write data from (write jobs), or to save data to (read and monitor jobs).
+		@samples  - Number of samples to capture (monitor jobs).
+		@voltage  - Target voltage.
+
+		Returns None.
+		"""
+		if action not in self.ACTIONS:
+			raise Exception("Unknown job action: %s" % action)
+		if action != "monitor" and config is None:
+			raise Exception("The %s action requires a chip configuration" % action)
+		if action == "write" and data is None and filename is None:
+			raise Exception("The write action requires data or a file")
+
+		self.id = None
+		self.action = action
+		self.config = config
+		self.address = address
+		self.size = size
+		self.data = data
+		self.filename = filename
+		self.samples = samples
+		self.voltage = voltage
+		self.pins = 0
+		self.estimate = 0
+		self.port = None
+		self.result = None
+		self.error = None
+		self.bytes = 0
+		self.submitted = None
+		self.started = None
+		self.finished = None
+		self.event = threading.Event()
+
+	def Wait(self, timeout=None):
+		"""
+		Waits for the job to complete.
+
+		@timeout - Maximum number of seconds to wait. If None, waits indefinitely.
+
+		Returns the job's result (data read, or a Capture for monitor jobs). Raises the job's exception if it failed.
+		"""
+		self.event.wait(timeout)
+		if not self.event.isSet():
+			raise Exception("Timed out waiting for job %s" % str(self.id))
+		if self.error is not None:
+			raise self.error
+		return self.result
+
+	def Stats(self):
+		"""
+		Returns a dict describing the job:
+
+			{
+				"id", "action", "port", "bytes", "success", "error",
+				"wait"		(seconds from submission to start)
+				"run"		(seconds from start to finish)
+				"latency"	(seconds from submission to finish)
+			}
+		"""
+		stats = {
+			"id"		: self.id,
+			"action"	: self.action,
+			"port"		: self.port,
+			"bytes"		: self.bytes,
+			"success"	: (self.finished is not None and self.error is None),
+			"error"		: (str(self.error) if self.error is not None else None),
+			"wait"		: None,
+			"run"		: None,
+			"latency"	: None
+		}
+
+		if self.started is not None:
+			stats["wait"] = self.started - self.submitted
+		if self.finished is not None:
+			stats["run"] = self.finished - self.started
+			stats["latency"] = self.finished - self.submitted
+
+		return stats
+
+class Scheduler:
+	"""
+	Runs jobs concurrently on a number of Gumbi boards. Example:
+
+		sched = Scheduler(["/dev/ttyACM0", "/dev/ttyACM1"])
+		jobs = [sched.Submit(Job("read", "bin/config/MX29LV320.conf", filename="dump%d.bin" % i)) for i in range(0, 4)]
+		sched.Wait()
+		print json.dumps(sched.Stats())
+		sched.Close()
+
+	Each board has its own job queue, and a thread that runs the jobs in it. A job is placed on the
+	board that is expected to finish it first, taking into account the estimated run time of the jobs
+	already queued on each board. Run times are estimated from each board's observed throughput for
+	the job's action; until a board has run a job of that action, DEFAULT_RATE is assumed.
+
+	Jobs are only placed on boards with enough I/O pins for the job's configuration. A board whose queue
+	is empty takes the last queued job from the board with the longest backlog that it can run.
+	"""
+
+	# Assumed throughput in bytes per second, until one is measured
+	DEFAULT_RATE = 50000.0
+	# Weight of each new throughput measurement in the running average
+	RATE_WEIGHT = 0.3
+	# Ports probed by Discover()
+	DISCOVER_PORTS = 10
+	# Configuration settings that hold Gumbi board pin numbers
+	PIN_KEYS = ["ADDRESS", "DATA", "VCC", "GND"] + Configuration.CONTROL_PINS
+
+	def __init__(self, ports=None):
+		"""
+		Class constructor. Opens each board and starts its job thread.
+
+		@ports - List of Gumbi board serial ports. If not specified, ports are found with Discover().
+
+		Returns None.
+		"""
+		if ports is None:
+			ports = self.Discover()
+		if not ports:
+			raise Exception("No Gumbi boards found")
+
+		self.lock = threading.Condition()
+		self.jobs = []
+		self.boards = []
+		self.closing = False
+		self.start = time.time()
+
+		for port in ports:
+			board = Board(port)
+			self.boards.append({
+				"port"		: port,
+				"board"		: board,
+				"pins"		: board.PinCount(),
+				"queue"		: deque(),
+				"backlog"	: 0.0,
+				"current"	: None,
+				"rates"		: {},
+				"jobs"		: 0,
+				"errors"	: 0,
+				"bytes"		: 0,
+				"busy"		: 0.0
+			})
+
+		self.threads = []
+		for entry in self.boards:
+			thread = threading.Thread(target=self._worker, args=(entry,), name="gumbi-sched-%s" % str(entry["port"]))
+			thread.daemon = True
+			thread.start()
+			self.threads.append(thread)
+
+	def Discover(self):
+		"""
+		Lists the serial ports that Gumbi boards may be attached to (ttyACM0 - ttyACM9).
+
+		Returns a list of port names.
+		"""
+		prefix = Gumbi.SERIAL_PORT[:-1]
+		return [prefix + str(n) for n in range(0, self.DISCOVER_PORTS) if os.path.exists(prefix + str(n))]
+
+	def _settings(self, config):
+		"""
+		Returns the settings dict for a configuration file or dict. For internal use only.
+		"""
+		if isinstance(config, dict):
+			return config
+		return Configuration.CACHE.Load(config).settings
+
+	def _setting(self, settings, key, default=None):
+		"""
+		Returns the first value of a setting. For internal use only.
+		"""
+		value = settings.get(key)
+		if isinstance(value, (list, tuple)):
+			if not value:
+				return default
+			return value[0]
+		if value is None:
+			return default
+		return value
+
+	def _required_pins(self, job):
+		"""
+		Returns the number of Gumbi board pins needed to run a job. For internal use only.
+		"""
+		if job.action == "monitor" or job.config is None:
+			return job.pins
+
+		settings = self._settings(job.config)
+
+		# Pin numbers are relative to the package, if the number of package pins is specified
+		package = self._setting(settings, "PINS", 0)
+		if package:
+			return package
+
+		pins = [0]
+		for key in self.PIN_KEYS:
+			value = settings.get(key)
+			if isinstance(value, (list, tuple)):
+				if key in Configuration.CONTROL_PINS:
+					value = value[:1]
+				pins += [pin for pin in value if isinstance(pin, int) and pin != Gumbi.UNUSED]
+			elif isinstance(value, int) and value != Gumbi.UNUSED:
+				pins.append(value)
+		return max(pins)
+
+	def _cost(self, job):
+		"""
+		Returns the (action, units) that a job's run time is estimated from. For internal use only.
+		"""
+		if job.action == "erase":
+			return ("erase", 1)
+		if job.action == "write":
+			if job.data is None:
+				return ("write", os.path.getsize(job.filename))
+			return ("write", len(job.data))
+		if job.action == "monitor":
+			return ("monitor", job.samples * (max(job.pins, Gumbi.PINS_PER_PORT) / Gumbi.PINS_PER_PORT))
+
+		size = job.size
+		if not size:
+			size = self._setting(self._settings(job.config), "SIZE", 0)
+		return ("read", size)
+
+	def _estimate(self, entry, job):
+		"""
+		Returns the estimated number of seconds a board will take to run a job. For internal use only.
+		"""
+		(action, units) = self._cost(job)
+
+		if entry["rates"].has_key(action):
+			return units / entry["rates"][action]
+		if action == "erase":
+			tsce = Parallel.DEFAULT_TSCE
+			if job.config is not None:
+				tsce = self._setting(self._settings(job.config), "TSCE", tsce)
+			return float(tsce)
+		return units / self.DEFAULT_RATE
+
+	def _update_rate(self, entry, job, seconds):
+		"""
+		Folds a job's measured run time into a board's throughput estimate. For internal use only.
+		"""
+		(action, units) = self._cost(job)
+		if seconds <= 0 or units <= 0:
+			return
+
+		rate = units / seconds
+		if entry["rates"].has_key(action):
+			rate = (self.RATE_WEIGHT * rate) + ((1 - self.RATE_WEIGHT) * entry["rates"][action])
+		entry["rates"][action] = rate
+
+	def Submit(self, job):
+		"""
+		Places a job on the board that is expected to finish it first.
+
+		@job - A Job instance.
+
+		Returns the Job instance.
+		"""
+		if not job.pins:
+			job.pins = self._required_pins(job)
+
+		self.lock.acquire()
+		try:
+			if self.closing:
+				raise Exception("Scheduler is closed")
+
+			best = None
+			for entry in self.boards:
+				if entry["pins"] < job.pins:
+					continue
+				finish = entry["backlog"] + self._estimate(entry, job)
+				if best is None or finish < best[0]:
+					best = (finish, entry)
+
+			if best is None:
+				raise Exception("No board has the %d pins needed for this job" % job.pins)
+
+			entry = best[1]
+			job.id = len(self.jobs)
+			job.submitted = time.time()
+			job.estimate = self._estimate(entry, job)
+			entry["queue"].append(job)
+			entry["backlog"] += job.estimate
+			self.jobs.append(job)
+			self.lock.notifyAll()
+		finally:
+			self.lock.release()
+
+		return job
+
+	def _steal(self, entry):
+		"""
+		Takes a queued job from the board with the longest backlog, for an idle board. For internal use only.
+
+		Returns a Job instance, or None. Must be called with the lock held.
+		"""
+		donors = sorted([e for e in self.boards if e is not entry and e["queue"]], key=lambda e: -e["backlog"])
+
+		for donor in donors:
+			for job in reversed(donor["queue"]):
+				if job.pins <= entry["pins"]:
+					donor["queue"].remove(job)
+					donor["backlog"] -= job.estimate
+					job.estimate = self._estimate(entry, job)
+					entry["backlog"] += job.estimate
+					return job
+		return None
+
+	def _next(self, entry):
+		"""
+		Waits for the next job for a board. For internal use only.
+
+		Returns a Job instance, or None if the scheduler is closing and there are no more jobs.
+		"""
+		self.lock.acquire()
+		try:
+			while True:
+				if entry["queue"]:
+					job = entry["queue"].popleft()
+				else:
+					job = self._steal(entry)
+
+				if job is not None:
+					entry["current"] = job
+					return job
+				if self.closing:
+					return None
+				self.lock.wait()
+		finally:
+			self.lock.release()
+
+	def _run(self, board, job):
+		"""
+		Runs a job on a board. For internal use only.
+
+		Returns a (result, bytes transferred) tuple.
+		"""
+		if job.action == "monitor":
+			capture = board.Run(Monitor, lambda m: m.Capture(job.samples), config=job.pins, voltage=job.voltage)
+			if job.filename:
+				open(job.filename, "wb").write(capture.data)
+			return (capture, len(capture.data))
+
+		if job.action == "read":
+			size = job.size
+			if not size:
+				size = self._setting(self._settings(job.config), "SIZE", 0)
+			if not size:
+				raise Exception("No read size was specified, and %s does not set the chip SIZE" % job.config)
+
+			def read(p):
+				# Don't run any previously selected command set before reading
+				p.config.SetCommand([])
+				return p.Read(job.address, p.Align(size))[:size]
+
+			data = board.Run(Parallel, read, job.config, job.voltage)
+			if job.filename:
+				open(job.filename, "wb").write(data)
+			return (data, len(data))
+
+		if job.action == "write":
+			data = job.data
+			if data is None:
+				data = open(job.filename, "rb").read()
+
+			def write(p):
+				p.config.SetCommand("WRITE")
+				return p.Write(job.address, p.Pad(data))
+
+			board.Run(Parallel, write, job.config, job.voltage)
+			return (True, len(data))
+
+		return (board.Run(Parallel, lambda p: p.EraseChip(), job.config, job.voltage), 0)
+
+	def _worker(self, entry):
+		"""
+		Job thread for a board. For internal use only.
+		"""
+		while True:
+			job = self._next(entry)
+			if job is None:
+				break
+
+			job.port = entry["port"]
+			job.started = time.time()
+			try:
+				(job.result, job.bytes) = self._run(entry["board"], job)
+			except Exception, e:
+				job.error = e
+			job.finished = time.time()
+
+			run = job.finished - job.started
+			Gumbi.STATS.Time("job_latency", job.finished - job.submitted, action=job.action)
+			Gumbi.STATS.Time("job_run", run, action=job.action, port=str(entry["port"]))
+
+			self.lock.acquire()
+			try:
+				entry["current"] = None
+				entry["backlog"] = max(0.0, entry["backlog"] - job.estimate)
+				entry["jobs"] += 1
+				entry["bytes"] += job.bytes
+				entry["busy"] += run
+				if job.error is None:
+					self._update_rate(entry, job, run)
+				else:
+					entry["errors"] += 1
+				self.lock.notifyAll()
+			finally:
+				self.lock.release()
+
+			job.event.set()
+
+	def Wait(self):
+		"""
+		Waits for all submitted jobs to finish.
+
+		Returns a list of the jobs that failed.
+		"""
+		for job in list(self.jobs):
+			job.event.wait()
+		return [job for job in self.jobs if job.error is not None]
+
+	def Stats(self):
+		"""
+		Returns a dict of job and board statistics:
+
+			{
+				"elapsed"	: seconds since the scheduler was started,
+				"jobs"		: [Job.Stats() for each job],
+				"boards"	: [{"port", "pins", "jobs", "errors", "bytes", "busy", "utilisation", "queued", "rates"}],
+				"latency"	: {"p50", "p90", "p99", "max"} of the finished jobs' latencies
+			}
+		"""
+		self.lock.acquire()
+		try:
+			elapsed = time.time() - self.start
+			boards = []
+			for entry in self.boards:
+				boards.append({
+					"port"		: entry["port"],
+					"pins"		: entry["pins"],
+					"jobs"		: entry["jobs"],
+					"errors"	: entry["errors"],
+					"bytes"		: entry["bytes"],
+					"busy"		: entry["busy"],
+					"utilisation"	: (entry["busy"] / elapsed if elapsed > 0 else 0.0),
+					"queued"	: len(entry["queue"]),
+					"rates"		: dict(entry["rates"])
+				})
+			jobs = [job.Stats() for job in self.jobs]
+		finally:
+			self.lock.release()
+
+		latencies = sorted([job["latency"] for job in jobs if job["latency"] is not None])
+		latency = {}
+		for p in (50, 90, 99):
+			latency["p%d" % p] = Percentile(latencies, p)
+		latency["max"] = (latencies[-1] if latencies else None)
+
+		return {
+			"elapsed"	: elapsed,
+			"jobs"		: jobs,
+			"boards"	: boards,
+			"latency"	: latency
+		}
+
+	def Save(self, path):
+		"""
+		Saves the output of Stats() to a JSON file.
+
+		Returns None.
+		"""
+		fp = open(path, "w")
+		json.dump(self.Stats(), fp, indent=4, sort_keys=True)
+		fp.close()
+
+	def Report(self):
+		"""
+		Returns a list of human readable lines describing the board statistics.
+		"""
+		stats = self.Stats()
+		lines = ["%-16s %6s %6s %6s %12s %10s %8s" % ("Board", "Pins", "Jobs", "Errors", "Bytes", "Busy (s)", "Util")]
+
+		for board in stats["boards"]:
+			lines.append("%-16s %6d %6d %6d %12d %10.3f %7.1f%%" % (board["port"], board["pins"], board["jobs"], board["errors"], board["bytes"], board["busy"], board["utilisation"] * 100))
+
+		if stats["latency"]["max"] is not None:
+			lines.append("")
+			lines.append("Job latency: p50 %.3fs, p90 %.3fs, p99 %.3fs, max %.3fs" % (stats["latency"]["p50"], stats["latency"]["p90"], stats["latency"]["p99"], stats["latency"]["max"]))
+
+		return lines
+
+	def Close(self):
+		"""
+		Runs all queued jobs, then closes all boards.
+
+		Returns None.
+		"""
+		self.lock.acquire()
+		self.closing = True
+		self.lock.notifyAll()
+		self.lock.release()
+
+		for thread in self.threads:
+			thread.join()
+		for entry in self.boards:
+			entry["board"].Close()
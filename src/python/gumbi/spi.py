@@ -0,0 +1,101 @@
+import time
+from gumbi import Gumbi
+from configuration import Configuration
+
+class SPI(Gumbi):
+	"""
+	Class for interfacing with SPI serial flash devices.
+
+	The SPI bus is bit-banged by the Gumbi board; the SCK, MOSI and MISO configuration
+	settings define the bus pins, and the CE setting defines the chip select pin.
+	"""
+
+	MODE = "SPI"
+	PAGE_SIZE = 256
+
+	def __init__(self, config=None, voltage=None, port=None):
+		"""
+		Class constructor.
+
+		@config - Path to configuration file.
+
+		Returns None.
+		"""
+		self.config = Configuration(config, self.MODE, port)
+		Gumbi.__init__(self, port=port)
+		if voltage is not None:
+			self.SetVoltage(voltage)
+		self._enter()
+
+	def _enter(self):
+		"""
+		Enter SPI mode. For internal use only.
+		"""
+		self.SetMode(self.SPI)
+
+	def _exit(self):
+		"""
+		Exit SPI mode. For internal use only.
+		"""
+		self.WriteConfig(self.EXIT, 0, 0)
+		# Wait for the board to acknowledge that it is exiting SPI mode
+		self.ReadAck()
+
+	def Command(self, commands, count=0):
+		"""
+		Sends a list of bytes to the target chip in a single chip select transaction,
+		then reads back the specified number of response bytes.
+
+		@commands - A list of bytes to send, or a configuration key identifier string.
+		@count    - The number of response bytes to read.
+
+		Returns a string of count bytes read from the chip.
+		"""
+		self.STATS.Count("actions", action="command")
+		self.config.SetCommand(commands)
+		self.WriteConfig(self.COMMAND, 0, count)
+		# First ACK acknowledges the receipt of a valid configuration
+		self.ReadAck()
+		# Second ACK acknowledges the receipt of a valid action
+		self.ReadAck()
+		data = self.ReadBytes(count)
+		# Third ACK indicates the completion of the command
+		self.ReadAck()
+		return data
+
+	def _write_segment(self, start, data, callback):
+		"""
+		Writes a single segment (see Gumbi.Write). Data is sent a page at a time, and the Gumbi board
+		acknowledges each page once it has been programmed. The target area must already be erased.
+		For internal use only.
+		"""
+		t = time.time()
+		self.STATS.Count("actions", action="write")
+
+		self.WriteConfig(self.WRITE, start, len(data))
+		# Receive the ACK indicating the provided configuration is valid
+		self.ReadAck()
+		# Receive the ACK indicating that the specified action is valid
+		self.ReadAck()
+		self.STATS.Time("write_setup", time.time() - t)
+
+		t = time.time()
+		tx = 0
+		size = len(data)
+		address = start
+
+		# As in Gumbi._write_segment, if this fails part way through the rest of the segment is not sent
+		while tx < size:
+			# Page program commands can't cross a page boundary; this must match the Gumbi board's chunking
+			chunk = min(self.PAGE_SIZE - (address % self.PAGE_SIZE), size - tx)
+			self.WriteBytes(data[tx:tx+chunk])
+
+			# Wait for an ACK indicating that the page has been programmed
+			self.ReadAck()
+			tx += chunk
+			address += chunk
+			if callback is not None:
+				callback(tx, size)
+
+		self.STATS.Time("write_transfer", time.time() - t)
+		return True
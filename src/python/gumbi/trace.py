@@ -0,0 +1,184 @@
+import time
+import struct
+from collections import deque
+
+class Trace:
+	"""
+	Records timestamped data sent to (TX) and received from (RX) the Gumbi board, along with
+	mode and action annotations, into an in-memory ring buffer and/or a binary trace file.
+
+	To trace all Gumbi board communications, set Gumbi.TRACE to a Trace instance:
+
+		Gumbi.TRACE = Trace("session.trace")
+		...
+		Gumbi.TRACE.Close()
+
+	The trace file consists of a header (MAGIC, followed by a version byte) followed by records.
+	Each record consists of a RECORD_HEADER (record type, timestamp, original data length, captured
+	data length) followed by the captured data. Use bin/gumbitrace.py to decode trace files.
+	"""
+
+	MAGIC = "GTRC"
+	VERSION = 1
+	RECORD_HEADER = "<BdII"
+	RECORD_HEADER_SIZE = struct.calcsize(RECORD_HEADER)
+
+	# Record types
+	TX = 1
+	RX = 2
+	MODE = 3
+	ACTION = 4
+	NOTE = 5
+
+	# NOTE records written before and after the traffic of a Gumbi.Reset, which Replay skips
+	RESET_BEGIN = "reset"
+	RESET_END = "reset done"
+
+	TYPE_NAMES = {
+		TX	: "TX",
+		RX	: "RX",
+		MODE	: "MODE",
+		ACTION	: "ACTION",
+		NOTE	: "NOTE"
+	}
+
+	def __init__(self, path=None, size=4096, snaplen=0):
+		"""
+		Class constructor.
+
+		@path    - Path to the trace file to write. If None, records are only kept in the ring buffer.
+		@size    - Number of records to keep in the ring buffer. If 0, no ring buffer is kept.
+		@snaplen - Maximum number of data bytes to capture per record. If 0, all data is captured.
+
+		Returns None.
+		"""
+		self.snaplen = snaplen
+		self.ring = None
+		self.fp = None
+
+		if size:
+			self.ring = deque(maxlen=size)
+
+		if path is not None:
+			self.fp = open(path, "wb")
+			self.fp.write(self.MAGIC + chr(self.VERSION))
+
+	def Record(self, rtype, data):
+		"""
+		Records a block of data.
+
+		@rtype - Record type (TX, RX, MODE, ACTION, NOTE).
+		@data  - Data string.
+
+		Returns None.
+		"""
+		ts = time.time()
+		n = len(data)
+
+		if self.snaplen and n > self.snaplen:
+			data = data[:self.snaplen]
+
+		if self.ring is not None:
+			self.ring.append((rtype, ts, n, data))
+
+		if self.fp is not None:
+			self.fp.write(struct.pack(self.RECORD_HEADER, rtype, ts, n, len(data)) + data)
+
+	def Transmit(self, data):
+		"""
+		Records data sent to the Gumbi board.
+		"""
+		self.Record(self.TX, data)
+
+	def Receive(self, data):
+		"""
+		Records data received from the Gumbi board.
+		"""
+		self.Record(self.RX, data)
+
+	def Mode(self, mode):
+		"""
+		Annotates the trace with the mode about to be entered.
+		"""
+		self.Record(self.MODE, chr(mode))
+
+	def Action(self, action):
+		"""
+		Annotates the trace to indicate that the next TX record is a configuration frame for the given action.
+		"""
+		self.Record(self.ACTION, chr(action))
+
+	def Note(self, text):
+		"""
+		Annotates the trace with an arbitrary text string.
+		"""
+		self.Record(self.NOTE, text)
+
+	def Records(self):
+		"""
+		Returns a list of (type, timestamp, length, data) tuples for the records in the ring buffer, oldest first.
+		"""
+		if self.ring is None:
+			return []
+		return list(self.ring)
+
+	def Save(self, path):
+		"""
+		Saves the contents of the ring buffer to a trace file.
+
+		@path - Path to the trace file.
+
+		Returns None.
+		"""
+		fp = open(path, "wb")
+		fp.write(self.MAGIC + chr(self.VERSION))
+		for (rtype, ts, n, data) in self.Records():
+			fp.write(struct.pack(self.RECORD_HEADER, rtype, ts, n, len(data)) + data)
+		fp.close()
+
+	def Flush(self):
+		"""
+		Flushes buffered records to the trace file.
+
+		Returns None.
+		"""
+		if self.fp is not None:
+			self.fp.flush()
+
+	def Close(self):
+		"""
+		Closes the trace file.
+
+		Returns None.
+		"""
+		if self.fp is not None:
+			self.fp.close()
+			self.fp = None
+
+def ReadTrace(path):
+	"""
+	Reads a trace file.
+
+	@path - Path to the trace file.
+
+	Returns a generator of (type, timestamp, length, data) tuples.
+	"""
+	fp = open(path, "rb")
+
+	try:
+		header = fp.read(len(Trace.MAGIC) + 1)
+		if header[:len(Trace.MAGIC)] != Trace.MAGIC:
+			raise Exception("%s is not a Gumbi trace file" % path)
+		if ord(header[-1]) != Trace.VERSION:
+			raise Exception("Unsupported trace file version: %d" % ord(header[-1]))
+
+		while True:
+			header = fp.read(Trace.RECORD_HEADER_SIZE)
+			if len(header) < Trace.RECORD_HEADER_SIZE:
+				break
+
+			(rtype, ts, n, caplen) = struct.unpack(Trace.RECORD_HEADER, header)
+			data = fp.read(caplen)
+			yield (rtype, ts, n, data)
+	finally:
+		fp.close()
@@ -0,0 +1,315 @@
+import array
+
+# array type codes for each item size, used to byte swap in a single pass
+_TYPECODES = {}
+for _code in ['Q', 'L', 'I', 'H']:
+	try:
+		_TYPECODES[array.array(_code).itemsize] = _code
+	except ValueError:
+		pass
+
+class Transform:
+	"""
+	Base class for byte lane transforms that can be applied to data as it is read from or written to the target chip.
+
+	Transforms operate on fixed size units of UNIT bytes. Feed() transforms as many whole units as are
+	available and carries any remaining bytes over to the next block, so a transform can be applied to a
+	stream of blocks of any size. Flush() returns any remaining bytes unchanged. Example:
+
+		swap = ByteSwap(2)
+		for block in blocks:
+			fp.write(swap.Feed(block))
+		fp.write(swap.Flush())
+
+	Transforms are stateful, so a new instance should be used for each stream.
+	"""
+
+	UNIT = 1
+
+	def __init__(self):
+		"""
+		Class constructor.
+
+		Returns None.
+		"""
+		self.pending = ''
+
+	def _transform(self, data):
+		"""
+		Place holder _transform method, called by Feed() with a whole number of units of data.
+
+		This should be overridden by the subclass and return the transformed data.
+		"""
+		return data
+
+	def Feed(self, data):
+		"""
+		Transforms a block of data.
+
+		@data - String of data.
+
+		Returns the transformed data. This may be shorter than the input if it was not a whole number of units.
+		"""
+		if self.pending:
+			data = self.pending + data
+		n = len(data) - (len(data) % self.UNIT)
+		self.pending = data[n:]
+		if n == len(data):
+			return self._transform(data)
+		return self._transform(data[:n])
+
+	def Flush(self):
+		"""
+		Ends the stream.
+
+		Returns any remaining bytes that did not make up a whole unit, unchanged.
+		"""
+		data = self.pending
+		self.pending = ''
+		return data
+
+	def Apply(self, data):
+		"""
+		Transforms a complete string of data.
+
+		Returns the transformed data.
+		"""
+		return self.Feed(data) + self.Flush()
+
+class ByteSwap(Transform):
+	"""
+	Reverses the byte order of each 16 or 32 bit word. For example, ByteSwap(2) converts a dump of a
+	16-bit big endian bus to little endian, or vice versa.
+	"""
+
+	def __init__(self, width=2):
+		"""
+		Class constructor.
+
+		@width - Word size in bytes.
+
+		Returns None.
+		"""
+		Transform.__init__(self)
+		self.UNIT = width
+
+	def _transform(self, data):
+		"""
+		Byte swaps a whole number of words. For internal use only.
+		"""
+		if self.UNIT == 1 or not data:
+			return data
+
+		if _TYPECODES.has_key(self.UNIT):
+			words = array.array(_TYPECODES[self.UNIT], data)
+			words.byteswap()
+			return words.tostring()
+
+		# No native type of this size; swap each byte lane with slice assignment
+		swapped = bytearray(len(data))
+		for lane in range(0, self.UNIT):
+			swapped[lane::self.UNIT] = data[self.UNIT-lane-1::self.UNIT]
+		return str(swapped)
+
+class Pipeline(Transform):
+	"""
+	Applies a sequence of transforms to a stream. Example:
+
+		pipeline = Pipeline(ByteSwap(4), ByteSwap(2))
+		data = pipeline.Apply(data)
+	"""
+
+	def __init__(self, *stages):
+		"""
+		Class constructor.
+
+		@stages - Transform instances, in the order they are to be applied.
+
+		Returns None.
+		"""
+		Transform.__init__(self)
+		self.stages = stages
+
+	def Feed(self, data):
+		"""
+		Passes a block of data through each stage.
+
+		Returns the transformed data.
+		"""
+		for stage in self.stages:
+			data = stage.Feed(data)
+		return data
+
+	def Flush(self):
+		"""
+		Flushes each stage, passing its remaining bytes through the stages that follow it.
+
+		Returns the remaining data.
+		"""
+		data = ''
+		for stage in self.stages:
+			data = stage.Feed(data) + stage.Flush()
+		return data
+
+class Deinterleave:
+	"""
+	Splits data read from a bus of interleaved chips into the data for each chip. For example, two 8-bit
+	chips sharing a 16-bit bus store the even bytes in one chip and the odd bytes in the other:
+
+		(even, odd) = Deinterleave(2).Apply(data)
+
+	Like Transform, data may be fed in blocks of any size.
+	"""
+
+	def __init__(self, ways=2, width=1):
+		"""
+		Class constructor.
+
+		@ways  - Number of interleaved chips.
+		@width - Number of bytes from each chip in each bus word.
+
+		Returns None.
+		"""
+		self.ways = ways
+		self.width = width
+		self.pending = ''
+
+	def _split(self, data):
+		"""
+		Splits a whole number of bus words into lanes. For internal use only.
+		"""
+		if self.width == 1:
+			return [data[lane::self.ways] for lane in range(0, self.ways)]
+
+		if _TYPECODES.has_key(self.width):
+			words = array.array(_TYPECODES[self.width], data)
+			return [words[lane::self.ways].tostring() for lane in range(0, self.ways)]
+
+		lanes = []
+		for lane in range(0, self.ways):
+			buf = bytearray(len(data) / self.ways)
+			for i in range(0, self.width):
+				buf[i::self.width] = data[(lane*self.width)+i::self.ways*self.width]
+			lanes.append(str(buf))
+		return lanes
+
+	def Feed(self, data):
+		"""
+		Splits a block of data.
+
+		@data - String of data read from the bus.
+
+		Returns a list of strings, one per chip.
+		"""
+		if self.pending:
+			data = self.pending + data
+		unit = self.ways * self.width
+		n = len(data) - (len(data) % unit)
+		self.pending = data[n:]
+		return self._split(data[:n])
+
+	def Flush(self):
+		"""
+		Ends the stream. Any trailing partial bus word is padded with 0xFF.
+
+		Returns a list of strings, one per chip.
+		"""
+		data = self.pending
+		self.pending = ''
+		if not data:
+			return [''] * self.ways
+		return self._split(data + ("\xFF" * ((self.ways * self.width) - len(data))))
+
+	def Apply(self, data):
+		"""
+		Splits a complete string of data.
+
+		Returns a list of strings, one per chip.
+		"""
+		return [a + b for (a, b) in zip(self.Feed(data), self.Flush())]
+
+class Interleave:
+	"""
+	Combines the data for each of a set of interleaved chips into the data to write to their shared bus.
+	This is the inverse of Deinterleave:
+
+		data = Interleave(2).Apply([even, odd])
+
+	Like Transform, data may be fed in blocks of any size.
+	"""
+
+	def __init__(self, ways=2, width=1):
+		"""
+		Class constructor.
+
+		@ways  - Number of interleaved chips.
+		@width - Number of bytes from each chip in each bus word.
+
+		Returns None.
+		"""
+		self.ways = ways
+		self.width = width
+		self.pending = [''] * ways
+
+	def _merge(self, lanes):
+		"""
+		Interleaves lanes of equal length. For internal use only.
+		"""
+		if not lanes[0]:
+			return ''
+
+		if self.width == 1:
+			merged = bytearray(len(lanes[0]) * self.ways)
+			for lane in range(0, self.ways):
+				merged[lane::self.ways] = lanes[lane]
+			return str(merged)
+
+		if _TYPECODES.has_key(self.width):
+			code = _TYPECODES[self.width]
+			merged = array.array(code, lanes[0] * self.ways)
+			for lane in range(0, self.ways):
+				merged[lane::self.ways] = array.array(code, lanes[lane])
+			return merged.tostring()
+
+		merged = bytearray(len(lanes[0]) * self.ways)
+		for lane in range(0, self.ways):
+			for i in range(0, self.width):
+				merged[(lane*self.width)+i::self.ways*self.width] = lanes[lane][i::self.width]
+		return str(merged)
+
+	def Feed(self, lanes):
+		"""
+		Interleaves a block of data for each chip.
+
+		@lanes - A list of strings, one per chip. The strings may be of different lengths.
+
+		Returns the interleaved data for as many whole bus words as are available.
+		"""
+		if len(lanes) != self.ways:
+			raise Exception("Expected data for %d chips, got %d" % (self.ways, len(lanes)))
+
+		lanes = [self.pending[i] + lanes[i] for i in range(0, self.ways)]
+		n = min([len(lane) for lane in lanes])
+		n -= n % self.width
+		self.pending = [lane[n:] for lane in lanes]
+		return self._merge([lane[:n] for lane in lanes])
+
+	def Flush(self):
+		"""
+		Ends the stream. Chips with less data than the others are padded with 0xFF.
+
+		Returns the remaining interleaved data.
+		"""
+		n = max([len(lane) for lane in self.pending])
+		n += (self.width - (n % self.width)) % self.width
+		lanes = [lane + ("\xFF" * (n - len(lane))) for lane in self.pending]
+		self.pending = [''] * self.ways
+		return self._merge(lanes)
+
+	def Apply(self, lanes):
+		"""
+		Interleaves the complete data for each chip.
+
+		Returns the interleaved data.
+		"""
+		return self.Feed(lanes) + self.Flush()